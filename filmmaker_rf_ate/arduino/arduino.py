@@ -1,7 +1,10 @@
-import time
-from typing import Literal
+import asyncio
+from concurrent.futures import Executor
+from typing import Callable, Literal
 from serial import Serial
 
+from filmmaker_rf_ate.utils.instrumentation import async_sleep, bind_context, sleep
+
 
 class ArduinoException(Exception):
     pass
@@ -14,15 +17,17 @@ class RFATEArduino:
         baudrate: int = 57600,
         timeout: float = 0.3,
         eol: Literal["\r\n", "\n", "\r"] = "\r\n",
+        serial_factory: Callable[..., Serial] = Serial,
     ):
         self._port = port
         self._baudrate = baudrate
         self._timeout = timeout
         self._eol = eol
+        self._serial_factory = serial_factory
         self._serial: Serial = None
 
     def __enter__(self):
-        self._serial = Serial(
+        self._serial = self._serial_factory(
             port=self._port, baudrate=self._baudrate, timeout=self._timeout
         )
         self._serial.readlines()
@@ -32,14 +37,21 @@ class RFATEArduino:
         self._serial.close()
 
     def write_read(self, msg: str, sleep_time: float = 0.3) -> str:
-        time.sleep(sleep_time)
+        sleep(sleep_time)
+        return self._exchange(msg)
+
+    def _exchange(self, msg: str) -> str:
         self._serial.write(bytes(msg + self._eol, "utf-8"))
         response = self._serial.read_until(bytes(self._eol, "utf-8"))
 
         return response.decode("utf-8").replace(self._eol, "")
 
     def get_analog(self, channel: Literal[0, 1]):
-        response = self.write_read(f"A{channel}")
+        sleep(0.3)
+        return self._read_analog(channel)
+
+    def _read_analog(self, channel: Literal[0, 1]) -> float:
+        response = self._exchange(f"A{channel}")
         ret = None
         for i in range(5):
             try:
@@ -56,9 +68,7 @@ class RFATEArduino:
             )
 
     def get_radio_power(self):
-        voltage = self.get_analog(0)
-        power = -40 * voltage + 20
-        return power
+        return _voltage_to_power(self.get_analog(0))
 
     def set_mode(self, mode: Literal["M", "Z", "P"]):
         self._serial.write(bytes(f"M{mode}" + self._eol, "utf-8"))
@@ -73,6 +83,47 @@ class RFATEArduino:
         )
 
 
+def _voltage_to_power(voltage: float) -> float:
+    return -40 * voltage + 20
+
+
+class AsyncRFATEArduino:
+    """
+    Awaitable front end to an RFATEArduino. Settling delays are waited out on the event loop, and
+    only the blocking serial reads and writes are handed to an executor.
+    """
+
+    def __init__(self, arduino: RFATEArduino, executor: Executor = None):
+        self._arduino = arduino
+        self._executor = executor
+
+    async def _run(self, function, *args):
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor, bind_context(function), *args
+        )
+
+    async def __aenter__(self):
+        await self._run(self._arduino.__enter__)
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self._run(self._arduino.__exit__, exc_type, exc_val, exc_tb)
+
+    async def write_read(self, msg: str, sleep_time: float = 0.3) -> str:
+        await async_sleep(sleep_time)
+        return await self._run(self._arduino._exchange, msg)
+
+    async def get_analog(self, channel: Literal[0, 1]) -> float:
+        await async_sleep(0.3)
+        return await self._run(self._arduino._read_analog, channel)
+
+    async def get_radio_power(self) -> float:
+        return _voltage_to_power(await self.get_analog(0))
+
+    async def set_mode(self, mode: Literal["M", "Z", "P"]) -> None:
+        await self._run(self._arduino.set_mode, mode)
+
+
 if __name__ == "__main__":
     with RFATEArduino("COM4") as ard:
         res = ard.get_analog(0)
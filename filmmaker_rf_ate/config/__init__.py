@@ -1,3 +1,8 @@
-from filmmaker_rf_ate.config.config import CONFIG, Config
+from filmmaker_rf_ate.config import config
+from filmmaker_rf_ate.config.config import Config
 
 __all__ = ["CONFIG", "Config"]
+
+
+def __getattr__(name: str):
+    return getattr(config, name)
@@ -4,12 +4,13 @@ from typing import Literal
 
 import yaml
 
+from rode.devices.utils.versions import Version
 from rode.devices.wireless.wireless_go_2_rx import WirelessGo2Rx
 from rode.devices.wireless.wireless_go_2_tx import WirelessGo2Tx
 from rode.devices.wireless.filmmaker_2_rx import Filmmaker2Rx
 from rode.devices.wireless.filmmaker_2_tx import Filmmaker2Tx
 from rode.devices.wireless.bases.wireless_device_base import WirelessDeviceBase
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 
 from filmmaker_rf_ate.config.tests import TestConfig
 
@@ -28,6 +29,74 @@ class DeviceClasses:
     ref: type[WirelessDeviceBase]
 
 
+@dataclass
+class CheckpointConfig:
+    enabled: bool = True
+    # Passed tests from an interrupted run are skipped on a rerun within this many seconds
+    resume_window: float = 3600.0
+    # A failed-only retest reuses passed tests from runs up to this many seconds old
+    retest_window: float = 86400.0
+
+
+@dataclass
+class FirmwareUpdateConfig:
+    # Simulator only: there is no flasher for real devices yet, so the station skips updates
+    # unless it is given one, as the simulator does
+    enabled: bool = False
+    # A target is only updated if it has an image, along with the version the image contains
+    mcu_image: str | None = None
+    mcu_version: Version | None = None
+    nordic_image: str | None = None
+    nordic_version: Version | None = None
+    max_parallel: int = 4
+    chunk_size: int = 4096
+    reboot_timeout: float = 30.0
+
+    def __post_init__(self):
+        if isinstance(self.mcu_version, str):
+            self.mcu_version = Version(self.mcu_version)
+
+        if isinstance(self.nordic_version, str):
+            self.nordic_version = Version(self.nordic_version)
+
+
+@dataclass
+class UploadConfig:
+    enabled: bool = False
+    # MES endpoint accepting batches of DUT records
+    url: str | None = None
+    headers: dict[str, str] = field(default_factory=dict)
+    batch_size: int = 100
+    timeout: float = 10.0
+    max_backoff: float = 300.0
+
+
+@dataclass
+class WorkerConfig:
+    # Run each slot in its own process, so a crash only takes down that slot
+    enabled: bool = False
+    # Seconds to wait for a worker to finish its batch when stopping
+    stop_timeout: float = 10.0
+
+
+@dataclass
+class CommandRetryConfig:
+    # Resend commands that fail with a transient USB error, if safe for the command
+    enabled: bool = False
+    # Retry policy fields to change, keyed by command kind (read, write, measurement, unsafe)
+    policies: dict[str, dict] = field(default_factory=dict)
+
+
+@dataclass
+class ObserverDispatchConfig:
+    # Deliver test messages to the GUI and other observers on a separate thread
+    enabled: bool = False
+    # Status messages that may wait for delivery. Pass and fail messages are never dropped.
+    queue_size: int = 256
+    # What to do with a status message once the queue is full: drop_oldest, merge or block
+    policy: str = "merge"
+
+
 @dataclass
 class Config:
     gender: Literal["rx", "tx"]
@@ -36,6 +105,20 @@ class Config:
     device_classes: DeviceClasses = None
     tests: TestConfig = None
     stop_on_fail: bool = True
+    results_db: str = "results.db"
+    metrics_file: str | None = "rf_ate.prom"
+    # Records each serial batch for replay. Batches testing slots at once are not recorded.
+    transcript_dir: str | None = None
+    hot_swap_poll_interval: float = 1.0
+    # Power every DUT on in one round trip as a batch starts, rather than as each test starts.
+    # In a serial batch, DUTs then wait powered on while the slots before them are tested.
+    batch_power_on: bool = False
+    checkpoints: CheckpointConfig = None
+    firmware_update: FirmwareUpdateConfig = None
+    upload: UploadConfig = None
+    workers: WorkerConfig = None
+    command_retries: CommandRetryConfig = None
+    observer_dispatch: ObserverDispatchConfig = None
 
     def __post_init__(self):
         if self.gender == "rx":
@@ -45,6 +128,36 @@ class Config:
         else:
             raise ValueError(f"Unknown DUT type `{self.gender}`")
 
+        if isinstance(self.checkpoints, dict):
+            self.checkpoints = CheckpointConfig(**self.checkpoints)
+        elif self.checkpoints is None:
+            self.checkpoints = CheckpointConfig()
+
+        if isinstance(self.firmware_update, dict):
+            self.firmware_update = FirmwareUpdateConfig(**self.firmware_update)
+        elif self.firmware_update is None:
+            self.firmware_update = FirmwareUpdateConfig()
+
+        if isinstance(self.upload, dict):
+            self.upload = UploadConfig(**self.upload)
+        elif self.upload is None:
+            self.upload = UploadConfig()
+
+        if isinstance(self.workers, dict):
+            self.workers = WorkerConfig(**self.workers)
+        elif self.workers is None:
+            self.workers = WorkerConfig()
+
+        if isinstance(self.command_retries, dict):
+            self.command_retries = CommandRetryConfig(**self.command_retries)
+        elif self.command_retries is None:
+            self.command_retries = CommandRetryConfig()
+
+        if isinstance(self.observer_dispatch, dict):
+            self.observer_dispatch = ObserverDispatchConfig(**self.observer_dispatch)
+        elif self.observer_dispatch is None:
+            self.observer_dispatch = ObserverDispatchConfig()
+
         if isinstance(self.tests, dict):
             self.tests = TestConfig(self.gender, **self.tests)
         else:
@@ -66,4 +179,14 @@ def read_config(config_yaml_path: PathLike = None) -> Config:
     return Config(**parsed_yaml)
 
 
-CONFIG = read_config()
+_config: Config | None = None
+
+
+def __getattr__(name: str):
+    # CONFIG is read on first use, so modules can be imported without a config.yaml
+    global _config
+    if name == "CONFIG":
+        if _config is None:
+            _config = read_config()
+        return _config
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
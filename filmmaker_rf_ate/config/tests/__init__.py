@@ -1,19 +1,33 @@
 from filmmaker_rf_ate.config.tests.tests import (
     TestConfig,
     AntennaConfig,
+    BatteryTestConfig,
     ConnectionStatsTestConfig,
     NvmTestConfig,
     RfPowerTestConfig,
     RfidAssignmentTestConfig,
     FirmwareTestConfig,
+    TestHistoryConfig,
+    TestOrderConfig,
+    TestProfileConfig,
+    ProfilePolicyConfig,
+    TestTimeoutConfig,
+    WatchdogConfig,
 )
 
 __all__ = [
     "TestConfig",
     "FirmwareTestConfig",
     "AntennaConfig",
+    "BatteryTestConfig",
     "ConnectionStatsTestConfig",
     "NvmTestConfig",
     "RfPowerTestConfig",
     "RfidAssignmentTestConfig",
+    "TestHistoryConfig",
+    "TestOrderConfig",
+    "TestProfileConfig",
+    "ProfilePolicyConfig",
+    "TestTimeoutConfig",
+    "WatchdogConfig",
 ]
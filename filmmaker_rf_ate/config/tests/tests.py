@@ -1,4 +1,4 @@
-from dataclasses import field, dataclass
+from dataclasses import field, dataclass, replace
 from typing import Literal
 
 from rode.devices.utils.versions import Version
@@ -19,6 +19,13 @@ class FirmwareTestConfig:
             self.min_nordic_version_version = Version(self.min_nordic_version)
 
 
+@dataclass
+class BatteryTestConfig:
+    # Seconds a fuel gauge reading taken while warming up stays usable as the test's starting
+    # point. Older readings are replaced by one taken as the test is built.
+    max_baseline_age: float = 60.0
+
+
 @dataclass
 class NvmTestConfig:
     address: int
@@ -41,6 +48,19 @@ class ConnectionStatsTestConfig:
     duration_long: int = 500
     min_rssi: int = -95
     allowed_errors: int = 1000
+    # Take each measurement as this many back-to-back reads and store every window's readings,
+    # which the duration optimiser replays. 1 takes each measurement in a single read.
+    windows: int = 1
+    # Tests run on the DUT while the long measurement is in progress, instead of in turn. Only
+    # for DUT firmware that answers other commands during a measurement.
+    window_tests: list[str] = field(default_factory=list)
+
+    def __post_init__(self):
+        shared = {"connection_stats", "rf_power"} & set(self.window_tests)
+        if shared:
+            raise ValueError(
+                f"{sorted(shared)} cannot run during the connection stats measurement"
+            )
 
 
 @dataclass
@@ -96,6 +116,131 @@ class RfidAssignmentTestConfig:
     port: int = 1234
 
 
+@dataclass
+class TestProfileConfig:
+    duration_short: int | None = None
+    duration_long: int | None = None
+    allowed_errors: int | None = None
+    channels: list[RadioChannel] | None = None
+    antennae: list[AntennaConfig] | None = None
+
+    def __post_init__(self):
+        if self.channels is not None:
+            self.channels = [
+                RadioChannel[channel]
+                if isinstance(channel, str)
+                else RadioChannel(channel)
+                for channel in self.channels
+            ]
+
+        if self.antennae is not None:
+            self.antennae = [
+                AntennaConfig(**antenna) if isinstance(antenna, dict) else antenna
+                for antenna in self.antennae
+            ]
+
+
+@dataclass
+class ProfilePolicyConfig:
+    enabled: bool = False
+    default_profile: str = "full"
+    screen_profile: str = "quick"
+    full_profile: str = "full"
+    audit_profile: str = "audit"
+    full_every: int = 10
+    audit_every: int = 100
+    full_after_marginal: int = 1
+    rssi_margin: float = 3.0
+    errors_margin: float = 0.2
+    delta_power_margin: float = 1.0
+
+
+@dataclass
+class TestHistoryConfig:
+    duration: float
+    failure_rate: float = 0.0
+    min_start_time: float = 0.0
+    after: list[str] = field(default_factory=list)
+
+
+DEFAULT_TEST_HISTORY = {
+    "firmware_version": TestHistoryConfig(2.0, 0.01),
+    "connection_stats": TestHistoryConfig(640.0, 0.04),
+    "rf_power": TestHistoryConfig(35.0, 0.03),
+    "battery": TestHistoryConfig(1.0, 0.02, min_start_time=300.0),
+}
+
+
+@dataclass
+class TestOrderConfig:
+    mode: Literal["fixed", "fail_fast"] = "fixed"
+    # Tests not listed keep their default history, and listed fields override the defaults
+    history: dict[str, TestHistoryConfig] = field(default_factory=dict)
+
+    def __post_init__(self):
+        if self.mode not in ("fixed", "fail_fast"):
+            raise ValueError(
+                f"Unknown test order mode `{self.mode}`, expected `fixed` or `fail_fast`"
+            )
+
+        self.history = {
+            **DEFAULT_TEST_HISTORY,
+            **{
+                name: _history_config(DEFAULT_TEST_HISTORY.get(name), history)
+                for name, history in self.history.items()
+            },
+        }
+
+
+def _history_config(
+    default: TestHistoryConfig | None, history: TestHistoryConfig | dict
+) -> TestHistoryConfig:
+    if not isinstance(history, dict):
+        return history
+    return (
+        TestHistoryConfig(**history) if default is None else replace(default, **history)
+    )
+
+
+@dataclass
+class TestTimeoutConfig:
+    """
+    Watchdog deadlines in seconds, None for no deadline. For connection_stats, the measurement
+    durations are added to test_routine.
+    """
+
+    pre_test_routine: float | None = 60.0
+    test_routine: float | None = 120.0
+    post_test_routine: float | None = 60.0
+    total: float | None = None
+
+
+DEFAULT_TEST_TIMEOUTS = {
+    "firmware_version": TestTimeoutConfig(30.0, 30.0, 30.0),
+    "connection_stats": TestTimeoutConfig(60.0, 120.0, 30.0),
+    "rf_power": TestTimeoutConfig(60.0, 180.0, 60.0),
+    "battery": TestTimeoutConfig(30.0, 30.0, 30.0),
+}
+
+
+@dataclass
+class WatchdogConfig:
+    enabled: bool = True
+    # Tests not listed keep their default timeouts
+    tests: dict[str, TestTimeoutConfig] = field(default_factory=dict)
+
+    def __post_init__(self):
+        self.tests = {
+            **DEFAULT_TEST_TIMEOUTS,
+            **{
+                name: TestTimeoutConfig(**timeouts)
+                if isinstance(timeouts, dict)
+                else timeouts
+                for name, timeouts in self.tests.items()
+            },
+        }
+
+
 @dataclass
 class TestConfig:
     gender: Literal["rx", "tx"]
@@ -105,15 +250,59 @@ class TestConfig:
         default_factory=lambda: ConnectionStatsTestConfig()
     )
     rf_power: RfPowerTestConfig = field(default_factory=lambda: RfPowerTestConfig())
+    battery: BatteryTestConfig = field(default_factory=lambda: BatteryTestConfig())
     rfid_assignment: RfidAssignmentTestConfig = field(
         default_factory=lambda: RfidAssignmentTestConfig()
     )
+    order: TestOrderConfig = field(default_factory=lambda: TestOrderConfig())
+    profiles: dict[str, TestProfileConfig] = field(
+        default_factory=lambda: {
+            "quick": TestProfileConfig(
+                duration_short=30,
+                duration_long=120,
+                allowed_errors=240,
+                channels=[
+                    RadioChannel.CHANNEL_0,
+                    RadioChannel.CHANNEL_40,
+                    RadioChannel.CHANNEL_80,
+                ],
+            ),
+            "full": TestProfileConfig(),
+            "audit": TestProfileConfig(
+                duration_short=240, duration_long=1000, allowed_errors=2000
+            ),
+        }
+    )
+    profile_policy: ProfilePolicyConfig = field(
+        default_factory=lambda: ProfilePolicyConfig()
+    )
+    watchdog: WatchdogConfig = field(default_factory=lambda: WatchdogConfig())
 
     def __post_init__(self):
         if isinstance(self.firmware, dict):
             self.firmware = FirmwareTestConfig(**self.firmware)
 
+        if isinstance(self.connection_stats, dict):
+            self.connection_stats = ConnectionStatsTestConfig(**self.connection_stats)
+
         if isinstance(self.rf_power, dict):
             self.rf_power = RfPowerTestConfig(**self.rf_power)
 
+        if isinstance(self.battery, dict):
+            self.battery = BatteryTestConfig(**self.battery)
+
+        if isinstance(self.order, dict):
+            self.order = TestOrderConfig(**self.order)
+
+        self.profiles = {
+            name: TestProfileConfig(**profile) if isinstance(profile, dict) else profile
+            for name, profile in self.profiles.items()
+        }
+
+        if isinstance(self.profile_policy, dict):
+            self.profile_policy = ProfilePolicyConfig(**self.profile_policy)
+
+        if isinstance(self.watchdog, dict):
+            self.watchdog = WatchdogConfig(**self.watchdog)
+
         self.nvm = NvmTestConfig(self.gender)
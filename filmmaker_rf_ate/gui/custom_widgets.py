@@ -1,23 +1,33 @@
 import threading
+import time
 
 from functional_test_core.device_test.observer import Observer, Observable, Message
 from functional_test_core.models import DeviceInfo
 from functional_test_core.models.utils import spprint_devices
 from kivy.uix.boxlayout import BoxLayout
-from kivy.properties import StringProperty, ListProperty
+from kivy.properties import BooleanProperty, StringProperty, ListProperty
 from kivy.uix.label import Label
+from kivy.uix.recycleview import RecycleView
 
 from filmmaker_rf_ate.config import Config
 from filmmaker_rf_ate.gui.graphics.colours import hex_to_kivy, PRIMARY, SUCCESS, ERROR
-from filmmaker_rf_ate.utils.get_devices import get_devices
-from filmmaker_rf_ate.tests.test_factory import test_factory
+from filmmaker_rf_ate.gui.log_buffer import LogBuffer, LogLine
+from filmmaker_rf_ate.gui.update_bus import GuiUpdateBus
+from filmmaker_rf_ate.station.hot_swap import HotSwapRunner
+from filmmaker_rf_ate.station.station import SlotResult, Station
+from filmmaker_rf_ate.station.warmup import WarmUp
+from filmmaker_rf_ate.station.workers import WorkerPool
+from filmmaker_rf_ate.utils.device_tracker import DeviceTracker
 
 
 class DutWidgetObserver(Observer):
-    def __init__(self, dut_widget: "DUTWidget", log_label: Label):
+    def __init__(
+        self, dut_widget: "DUTWidget", merged_log_view: "LogView", bus: GuiUpdateBus
+    ):
         super().__init__()
         self._dut_widget = dut_widget
-        self._log_label = log_label
+        self._merged_log_view = merged_log_view
+        self._bus = bus
 
     @property
     def dut_widget(self) -> "DUTWidget":
@@ -28,17 +38,77 @@ class DutWidgetObserver(Observer):
         self._dut_widget = value
 
     def update(self, observable: Observable, message: Message, *args, **kwargs):
-        self._log_label.text = message.content
+        line = LogLine(
+            time.time(), self._dut_widget.board_name, message.status, message.content
+        )
+        for log_view in (self._dut_widget.ids.log_view, self._merged_log_view):
+            log_view.buffer.append(line)
+            self._bus.post((id(log_view), "data"), log_view.refresh)
 
+        color_key = (id(self._dut_widget), "color")
         if message.status == "running":
-            self._dut_widget.set_color_running()
+            self._bus.post(color_key, self._dut_widget.set_color_running)
         elif message.status == "pass":
-            self._dut_widget.set_color_pass()
+            self._bus.post(color_key, self._dut_widget.set_color_pass)
         elif message.status == "fail":
-            self._dut_widget.set_color_fail()
+            self._bus.post(color_key, self._dut_widget.set_color_fail)
+
+
+LOG_LINES = 500
+
+STATUS_COLORS = {
+    "running": [1, 1, 1, 1],
+    "pass": hex_to_kivy(SUCCESS),
+    "fail": hex_to_kivy(ERROR),
+}
+
+
+class LogLineLabel(Label):
+    status = StringProperty("")
+
+    def on_status(self, instance, value: str):
+        self.color = STATUS_COLORS.get(value, [1, 1, 1, 1])
+
+
+class LogView(RecycleView):
+    """
+    Scrollable view of a log buffer. The RecycleView only creates labels for visible lines, so
+    render cost does not grow with the buffer. Follows new lines while scrolled to the bottom.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._buffer: LogBuffer | None = None
+        self._version = -1
+
+    @property
+    def buffer(self) -> LogBuffer | None:
+        return self._buffer
+
+    @buffer.setter
+    def buffer(self, value: LogBuffer):
+        self._buffer = value
+        self._version = -1
+        self.refresh()
+
+    def refresh(self):
+        """
+        Re-reads the buffer if it has changed. Must run on the main thread.
+        """
+        if self._buffer is None or self._buffer.version == self._version:
+            return
+
+        self._version = self._buffer.version
+        follow = not self.data or self.scroll_y <= 0.01
+        self.data = self._buffer.to_data()
+        if follow:
+            self.scroll_y = 0
 
 
 class RootLayout(BoxLayout):
+    # Set while continuous mode waits for its runs in progress, keeping the buttons disabled
+    stopping = BooleanProperty(False)
+
     def __init__(
         self,
         config: Config,
@@ -48,86 +118,195 @@ class RootLayout(BoxLayout):
         self.ref: DeviceInfo | None = None
         self._config = config
         self.duts: list[DeviceInfo | None] = [None, None, None, None]
-
-    def _scan_devices(
-        self,
-    ) -> tuple[
-        DeviceInfo | None,
-        DeviceInfo | None,
-        DeviceInfo | None,
-        DeviceInfo | None,
-        DeviceInfo | None,
-    ]:
-        self.ids.log_label.text = "Scanning for devices..."
+        self._station = Station.from_config(config)
+        self._bus = GuiUpdateBus()
+        self._bus.start()
+        self.ids.merged_log.buffer = LogBuffer(4 * LOG_LINES, show_slot=True)
+        self._hot_swap: HotSwapRunner | None = None
+        slots = tuple(widget.slot for widget in self.ids.dut_layout.dut_widgets)
+        # One set of device handles for scans, warm up and continuous mode
+        self._devices = DeviceTracker(config, slots)
+        self._warm_up = WarmUp(config, slots, devices=self._devices)
+        self._workers: WorkerPool | None = None
+        if config.workers.enabled:
+            # Workers open their own devices, so there is nothing to warm up here
+            self._workers = WorkerPool(self._station, slots).start()
+        else:
+            self._warm_up.start()
+
+    def close(self):
+        self._warm_up.stop()
+        if self._hot_swap is not None:
+            self._hot_swap.stop()
+        if self._workers is not None:
+            self._workers.stop()
+        self._devices.close()
+        self._bus.stop()
+        self._station.close()
+
+    def _scan_devices(self) -> tuple[DeviceInfo | None, dict[str, DeviceInfo]]:
+        """
+        @return: reference, or None if it was not found, and the DUTs found keyed by slot
+        """
+        log_label = self.ids.log_label
+        self._bus.set(log_label, "text", "Scanning for devices...")
         for widget in self.ids.dut_layout.dut_widgets:
-            widget.disabled = True
-            widget.error_code = ""
-
-        try:
-            ref, *duts = get_devices(
-                self._config.device_classes.dut,
-                self._config.device_classes.ref,
-                retries=5,
+            self._bus.set(widget, "disabled", True)
+            self._bus.set(widget, "error_code", "")
+
+        ref, duts = self._devices.scan(retries=5)
+        if ref is None:
+            self._bus.set(
+                log_label, "text", "Reference unit not found! Check connection."
             )
-        except AssertionError:
-            self.ids.log_label.text = "Reference unit not found! Check connection."
-            return None, None, None, None, None
+            return None, {}
 
-        self.ids.log_label.text = (
-            f"{len([dut for dut in duts if dut is not None])} device(s) found!"
-        )
+        self._bus.set(log_label, "text", f"{len(duts)} device(s) found!")
 
-        for dut, widget in zip(duts, self.ids.dut_layout.dut_widgets):
-            if dut is not None:
-                widget.disabled = False
-            else:
-                widget.disabled = True
+        for widget in self.ids.dut_layout.dut_widgets:
+            self._bus.set(widget, "disabled", widget.slot not in duts)
 
-        return ref, *duts
+        return ref, duts
 
     def scan_button_callback(self):
         threading.Thread(target=self._scan_devices).start()
 
     def start_test(self):
         def _start_test_callback():
-            ref, *duts = self._scan_devices()
+            widgets = {
+                widget.slot: widget for widget in self.ids.dut_layout.dut_widgets
+            }
 
+            ref, slot_duts = self._scan_devices()
             if not ref:
                 return
 
-            observer = DutWidgetObserver(duts[0], log_label=self.ids.log_label)
-            failed = []
-            for dut, widget in zip(duts, self.ids.dut_layout.dut_widgets):
-                if dut is None:
-                    continue
-
-                observer.dut_widget = widget
-
-                test_handler = test_factory(
-                    ref, dut, self._config, self._config.stop_on_fail
+            # Every occupied slot is tested, reusing what was read ahead where there is any
+            warm = self._warm_up.take(slot_duts)
+            if warm:
+                self._bus.set(
+                    self.ids.log_label,
+                    "text",
+                    f"{len(slot_duts)} device(s) found, {len(warm)} warmed up!",
                 )
-                test_handler.add_observer(observer)
-                results = test_handler.execute_tests()
 
-                if any([not result.passed for result in results]):
-                    failed.append(dut)
+            observers = {
+                slot: DutWidgetObserver(
+                    widgets[slot], merged_log_view=self.ids.merged_log, bus=self._bus
+                )
+                for slot in slot_duts
+            }
 
-                widget.error_code = "".join(
-                    [result.error_code for result in results if not result.passed]
+            def _on_result(slot_result: SlotResult):
+                self._bus.set(
+                    widgets[slot_result.slot], "error_code", slot_result.error_code
                 )
 
+            retest_failed = self.ids.retest_button.state == "down"
+            try:
+                if self._workers is not None:
+                    slot_results = self._workers.run_batch(
+                        slot_duts, observers, _on_result, retest_failed=retest_failed
+                    )
+                else:
+                    slot_results = self._station.run_batch(
+                        ref,
+                        slot_duts,
+                        observers,
+                        _on_result,
+                        retest_failed=retest_failed,
+                        warm=warm,
+                    )
+            finally:
+                for slot in slot_duts:
+                    self._warm_up.release(slot, slot_duts[slot])
+
+            failed = [
+                slot_result.dut
+                for slot_result in slot_results
+                if not slot_result.passed
+            ]
             if failed:
                 failed_dut_str = ", ".join([device.name_short for device in failed])
-                self.ids.log_label.text = f"Test(s) failed! Reject [{failed_dut_str}]."
+                self._bus.set(
+                    self.ids.log_label,
+                    "text",
+                    f"Test(s) failed! Reject [{failed_dut_str}].",
+                )
             else:
-                self.ids.log_label.text = "Tests passed!"
+                self._bus.set(self.ids.log_label, "text", "Tests passed!")
 
-            print(
-                spprint_devices([dut for dut in duts if dut is not None], verbose=False)
-            )
+            print(spprint_devices(list(slot_duts.values()), verbose=False))
 
         threading.Thread(target=_start_test_callback, daemon=True).start()
 
+    def continuous_callback(self, enabled: bool):
+        """
+        Starts or stops testing each slot as soon as a DUT is inserted
+        """
+        if not enabled:
+            hot_swap, self._hot_swap = self._hot_swap, None
+            self.stopping = True
+            self._bus.set(
+                self.ids.log_label, "text", "Waiting for running slots to finish..."
+            )
+
+            def _stop():
+                # Slots still hold the reference and Arduino until their runs finish
+                if hot_swap is not None:
+                    hot_swap.stop()
+                if self._workers is None:
+                    self._warm_up.start()
+                self._bus.set(self, "stopping", False)
+                self._bus.set(self.ids.log_label, "text", "Continuous mode stopped.")
+
+            threading.Thread(target=_stop, daemon=True).start()
+            return
+
+        widgets = {widget.slot: widget for widget in self.ids.dut_layout.dut_widgets}
+
+        def _on_start(slot: str, dut: DeviceInfo):
+            self._bus.set(widgets[slot], "disabled", False)
+            self._bus.set(widgets[slot], "error_code", "")
+            self._bus.post(
+                (id(widgets[slot]), "color"), widgets[slot].set_color_running
+            )
+
+        def _on_result(slot_result: SlotResult):
+            self._bus.set(
+                widgets[slot_result.slot], "error_code", slot_result.error_code
+            )
+            verdict = "passed" if slot_result.passed else "failed! Reject"
+            self._bus.set(self.ids.log_label, "text", f"{slot_result.slot} {verdict}.")
+
+        def _on_empty(slot: str):
+            self._bus.set(widgets[slot], "disabled", True)
+            self._bus.set(widgets[slot], "error_code", "")
+
+        hot_swap = self._hot_swap = HotSwapRunner(
+            self._station,
+            tuple(widgets),
+            observer_factory=lambda slot: DutWidgetObserver(
+                widgets[slot], merged_log_view=self.ids.merged_log, bus=self._bus
+            ),
+            on_start=_on_start,
+            on_result=_on_result,
+            on_empty=_on_empty,
+            devices=self._devices,
+        )
+
+        def _start():
+            # Each slot starts as soon as it is filled, so there is nothing to warm up ahead.
+            # Waits for warm ups in progress, which still hold their DUTs.
+            self._warm_up.stop()
+            if self._hot_swap is hot_swap:
+                hot_swap.start()
+                self._bus.set(
+                    self.ids.log_label, "text", "Continuous mode: insert DUTs to test."
+                )
+
+        threading.Thread(target=_start, daemon=True).start()
+
 
 class DUTLayout(BoxLayout):
     dut_widgets: list["DUTWidget"] = ListProperty([])
@@ -141,6 +320,8 @@ class DUTLayout(BoxLayout):
 
 # Individual board status layout
 class DUTWidget(BoxLayout):
+    # Slot the widget shows, named as in results and by the CLI, e.g. dut1
+    slot = StringProperty("")
     board_name = StringProperty("DUT")
     error_code = StringProperty("")
     label_text = StringProperty("")
@@ -156,6 +337,7 @@ class DUTWidget(BoxLayout):
         )
         super().__init__(**kwargs)
         self.disabled = True
+        self.ids.log_view.buffer = LogBuffer(LOG_LINES)
 
     def on_disabled(self, instance, value: bool):
         if value:
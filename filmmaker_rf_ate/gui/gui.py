@@ -14,6 +14,9 @@ class Filmmaker2RFApp(App):
     def build(self):
         return RootLayout(self._test_config)
 
+    def on_stop(self):
+        self.root.close()
+
 
 if __name__ == "__main__":
     from filmmaker_rf_ate.config import CONFIG
@@ -0,0 +1,60 @@
+# Bounded in-memory logs backing the GUI log views
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+
+DEFAULT_CAPACITY = 500
+
+
+@dataclass(frozen=True, slots=True)
+class LogLine:
+    timestamp: float
+    slot: str
+    status: str
+    content: str
+
+    def format(self, show_slot: bool = False) -> str:
+        prefix = time.strftime("%H:%M:%S", time.localtime(self.timestamp))
+        if show_slot:
+            prefix = f"{prefix} {self.slot}"
+        return f"{prefix} {self.content}"
+
+
+class LogBuffer:
+    """
+    Ring buffer of the most recent log lines. Once full, each new line drops the oldest, so memory
+    use is fixed however long the station runs.
+    """
+
+    def __init__(self, capacity: int = DEFAULT_CAPACITY, show_slot: bool = False):
+        self._lines: deque[LogLine] = deque(maxlen=capacity)
+        self._lock = threading.Lock()
+        self._show_slot = show_slot
+        self.version = 0
+
+    def __len__(self) -> int:
+        return len(self._lines)
+
+    def append(self, line: LogLine) -> None:
+        with self._lock:
+            self._lines.append(line)
+            self.version += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._lines.clear()
+            self.version += 1
+
+    def lines(self) -> list[LogLine]:
+        with self._lock:
+            return list(self._lines)
+
+    def to_data(self) -> list[dict]:
+        """
+        @return: RecycleView data, oldest line first
+        """
+        return [
+            {"text": line.format(self._show_slot), "status": line.status}
+            for line in self.lines()
+        ]
@@ -0,0 +1,55 @@
+# Hands widget updates from test threads to the Kivy main thread
+import threading
+from typing import Callable, Hashable
+
+from kivy.clock import Clock
+
+
+class GuiUpdateBus:
+    """
+    Test threads post updates without touching widgets. Once per frame, the Kivy clock applies
+    them on the main thread. Updates are keyed, so only the latest update per key since the last
+    frame is applied.
+    """
+
+    def __init__(self, fps: float = 20):
+        self._fps = fps
+        self._lock = threading.Lock()
+        self._pending: dict[Hashable, Callable[[], None]] = {}
+        self._event = None
+        self.posted = 0
+        self.applied = 0
+
+    def start(self) -> None:
+        if self._event is None:
+            self._event = Clock.schedule_interval(self.drain, 1 / self._fps)
+
+    def stop(self) -> None:
+        if self._event is not None:
+            self._event.cancel()
+            self._event = None
+
+    def post(self, key: Hashable, update: Callable[[], None]) -> None:
+        """
+        Queues an update, replacing any queued update with the same key. Safe from any thread.
+        """
+        with self._lock:
+            self._pending[key] = update
+            self.posted += 1
+
+    def set(self, target, name: str, value) -> None:
+        """
+        Queues setting a widget property
+        """
+        self.post((id(target), name), lambda: setattr(target, name, value))
+
+    def drain(self, dt: float = None) -> None:
+        """
+        Applies queued updates. Must run on the main thread.
+        """
+        with self._lock:
+            pending, self._pending = self._pending, {}
+
+        for update in pending.values():
+            update()
+        self.applied += len(pending)
@@ -0,0 +1,14 @@
+from filmmaker_rf_ate.results.checkpoints import CheckpointStore
+from filmmaker_rf_ate.results.compact import CompactRecord, SessionResults
+from filmmaker_rf_ate.results.records import DutRecord
+from filmmaker_rf_ate.results.store import ResultStore
+from filmmaker_rf_ate.results.upload import UploadQueue
+
+__all__ = [
+    "CheckpointStore",
+    "CompactRecord",
+    "DutRecord",
+    "ResultStore",
+    "SessionResults",
+    "UploadQueue",
+]
@@ -0,0 +1,526 @@
+# Yield, failure Pareto and capability statistics over the result store
+import argparse
+import fnmatch
+import json
+import sqlite3
+import sys
+from dataclasses import dataclass, asdict
+from os import PathLike
+
+import numpy as np
+
+DEFAULT_MEASUREMENTS = [
+    "min_rssi.measured_average",
+    "ch1_total_errors.total",
+    "ch2_total_errors.total",
+    "*_avg_power.mean_delta_power",
+    "*_avg_power.channels.*.pow_delta",
+    "battery_stats.*",
+]
+
+BATTERY_DELTA = "battery_stats.delta_percentage"
+
+
+def limits_from_info(
+    name: str, info: dict | None
+) -> dict[str, tuple[float | None, float | None]]:
+    """
+    @param name: name of a stored result
+    @param info: its info dict
+    @return: spec limits of the result's measurements, from the limits the test applied
+    """
+    info = info or {}
+    if name == "min_rssi" and "min" in info.get("limits", {}):
+        return {"min_rssi.measured_average": (info["limits"]["min"], None)}
+    if name in ("ch1_total_errors", "ch2_total_errors") and "allowed" in info:
+        return {f"{name}.total": (None, info["allowed"])}
+    if name.endswith("_avg_power") and "min" in info.get("limits", {}).get(
+        "delta_power", {}
+    ):
+        return {
+            f"{name}.mean_delta_power": (info["limits"]["delta_power"]["min"], None)
+        }
+    return {}
+
+
+@dataclass
+class MeasurementStats:
+    key: str
+    count: int
+    mean: float
+    std: float
+    min: float
+    p01: float
+    p50: float
+    p99: float
+    max: float
+    lsl: float | None = None
+    usl: float | None = None
+    cpk: float | None = None
+    profile: str | None = None
+
+
+class ResultAnalytics:
+    """
+    Reads the result store in fixed size chunks. Only the selected measurement columns are kept in
+    memory, so the database itself can be much larger than memory.
+    """
+
+    def __init__(
+        self,
+        path: PathLike | str,
+        since: float = None,
+        until: float = None,
+        chunk_size: int = 500_000,
+    ):
+        self._connection = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        self._since = since
+        self._until = until
+        self._chunk_size = chunk_size
+
+    def close(self):
+        self._connection.close()
+
+    def _unit_filter(self, column: str = "id", profile: str = None) -> tuple[str, list]:
+        """
+        @param profile: only units tested with this profile
+        """
+        clauses = []
+        args = []
+        if profile is not None:
+            clauses.append("profile = ?")
+            args.append(profile)
+        if self._since is not None:
+            clauses.append("finished_at >= ?")
+            args.append(self._since)
+        if self._until is not None:
+            clauses.append("finished_at <= ?")
+            args.append(self._until)
+
+        if not clauses:
+            return "1", []
+
+        return (
+            f"{column} IN (SELECT id FROM units WHERE {' AND '.join(clauses)})",
+            args,
+        )
+
+    def _chunks(self, query: str, args: list, dtype: np.dtype):
+        cursor = self._connection.execute(query, args)
+        while True:
+            rows = cursor.fetchmany(self._chunk_size)
+            if not rows:
+                return
+            yield np.array(rows, dtype=dtype)
+
+    def unit_ids(self, profile: str = None) -> np.ndarray:
+        """
+        @param profile: only units tested with this profile
+        @return: sorted ids of the units in range
+        """
+        where, args = self._unit_filter(profile=profile)
+        chunks = [
+            chunk.ravel()
+            for chunk in self._chunks(
+                f"SELECT id FROM units WHERE {where} ORDER BY id", args, np.int64
+            )
+        ]
+        return np.concatenate(chunks) if chunks else np.empty(0, dtype=np.int64)
+
+    def profiles(self) -> list[str]:
+        """
+        @return: profiles the units in range were tested with
+        """
+        where, args = self._unit_filter()
+        return [
+            profile
+            for (profile,) in self._connection.execute(
+                f"SELECT DISTINCT profile FROM units WHERE {where} "
+                "AND profile IS NOT NULL ORDER BY profile",
+                args,
+            )
+        ]
+
+    def stored_limits(
+        self, profile: str = None
+    ) -> dict[str, tuple[float | None, float | None]]:
+        """
+        Spec limits as last applied by the tests to units of a profile. Sampled profiles scale
+        limits such as the allowed errors with their durations, so each profile has its own.
+        @param profile: profile of the units, or None for the latest units of any profile
+        @return: limits keyed by measurement key
+        """
+        where, args = self._unit_filter("unit_id", profile)
+        limits = {}
+        for name, info in self._connection.execute(
+            "SELECT name, info FROM results WHERE rowid IN ("
+            "SELECT MAX(rowid) FROM results WHERE (name IN "
+            "('min_rssi', 'ch1_total_errors', 'ch2_total_errors') "
+            f"OR name GLOB '*_avg_power') AND {where} GROUP BY name)",
+            args,
+        ):
+            limits.update(limits_from_info(name, json.loads(info) if info else None))
+
+        limits[BATTERY_DELTA] = (0, None)
+        return limits
+
+    def measurement_keys(self, patterns: list[str] = None) -> dict[str, int]:
+        keys = dict(self._connection.execute("SELECT key, id FROM measurement_keys"))
+        if not patterns:
+            return keys
+
+        return {
+            key: key_id
+            for key, key_id in keys.items()
+            if any(fnmatch.fnmatchcase(key, pattern) for pattern in patterns)
+        }
+
+    def yield_summary(self) -> dict:
+        where, args = self._unit_filter()
+        total = 0
+        passed = 0
+        for chunk in self._chunks(
+            f"SELECT passed FROM units WHERE {where}", args, np.int8
+        ):
+            total += chunk.size
+            passed += int(np.count_nonzero(chunk))
+
+        return {
+            "units": total,
+            "passed": passed,
+            "failed": total - passed,
+            "yield": passed / total if total else None,
+        }
+
+    def failure_pareto(self) -> list[tuple[str, int, float]]:
+        """
+        @return: failing result names with their count and cumulative fraction, most frequent first
+        """
+        where, args = self._unit_filter("unit_id")
+        counts: dict[str, int] = {}
+        cursor = self._connection.execute(
+            f"SELECT name FROM results WHERE passed = 0 AND {where}", args
+        )
+        while rows := cursor.fetchmany(self._chunk_size):
+            names, chunk_counts = np.unique(
+                np.array([row[0] for row in rows]), return_counts=True
+            )
+            for name, count in zip(names.tolist(), chunk_counts.tolist()):
+                counts[name] = counts.get(name, 0) + count
+
+        if not counts:
+            return []
+
+        names = np.array(list(counts))
+        values = np.array(list(counts.values()))
+        order = np.argsort(-values, kind="stable")
+        cumulative = np.cumsum(values[order]) / values.sum()
+
+        return [
+            (str(names[i]), int(values[i]), float(c)) for i, c in zip(order, cumulative)
+        ]
+
+    def load_measurements(
+        self, keys: dict[str, int], profile: str = None
+    ) -> dict[str, tuple[np.ndarray, np.ndarray]]:
+        """
+        @param keys: measurement keys to load, with their key ids
+        @param profile: only units tested with this profile
+        @return: unit ids and values for each key, sorted by unit id
+        """
+        if not keys:
+            return {}
+
+        where, args = self._unit_filter("unit_id", profile)
+        placeholders = ", ".join("?" * len(keys))
+        unit_chunks: dict[int, list[np.ndarray]] = {
+            key_id: [] for key_id in keys.values()
+        }
+        value_chunks: dict[int, list[np.ndarray]] = {
+            key_id: [] for key_id in keys.values()
+        }
+
+        for chunk in self._chunks(
+            f"SELECT key_id, unit_id, value FROM measurements "
+            f"WHERE key_id IN ({placeholders}) AND {where}",
+            [*keys.values(), *args],
+            np.float64,
+        ):
+            key_ids = chunk[:, 0].astype(np.int64)
+            for key_id in np.unique(key_ids).tolist():
+                mask = key_ids == key_id
+                unit_chunks[key_id].append(chunk[mask, 1].astype(np.int64))
+                value_chunks[key_id].append(chunk[mask, 2])
+
+        measurements = {}
+        for key, key_id in keys.items():
+            if not unit_chunks[key_id]:
+                continue
+            unit_ids = np.concatenate(unit_chunks[key_id])
+            values = np.concatenate(value_chunks[key_id])
+            order = np.argsort(unit_ids, kind="stable")
+            measurements[key] = unit_ids[order], values[order]
+
+        return measurements
+
+    def measurement_stats(
+        self,
+        patterns: list[str] = None,
+        limits: dict[str, tuple[float | None, float | None]] = None,
+        profile: str = None,
+    ) -> list[MeasurementStats]:
+        """
+        @param limits: spec limits for Cpk, keyed by measurement key pattern. Those not given are
+        taken from the limits stored with the profile's units.
+        @param profile: only units tested with this profile
+        """
+        patterns = DEFAULT_MEASUREMENTS if patterns is None else patterns
+        # The caller's patterns take precedence over the stored limits, even exact stored keys
+        limit_sets = (limits or {}, self.stored_limits(profile))
+
+        measurements = self.load_measurements(
+            self.measurement_keys(patterns), profile=profile
+        )
+
+        initial = measurements.get("battery_stats.initial_percentage")
+        final = measurements.get("battery_stats.percentage")
+        if initial is not None and final is not None:
+            unit_ids, initial_idx, final_idx = np.intersect1d(
+                initial[0], final[0], assume_unique=True, return_indices=True
+            )
+            measurements[BATTERY_DELTA] = (
+                unit_ids,
+                final[1][final_idx] - initial[1][initial_idx],
+            )
+
+        stats = []
+        for key in sorted(measurements):
+            lsl, usl = next(
+                (
+                    limit
+                    for limit_set in limit_sets
+                    for pattern, limit in limit_set.items()
+                    if fnmatch.fnmatchcase(key, pattern)
+                ),
+                (None, None),
+            )
+            summary = summarise(key, measurements[key][1], lsl, usl)
+            summary.profile = profile
+            stats.append(summary)
+
+        return stats
+
+    def export(self, path: PathLike | str, patterns: list[str] = None) -> int:
+        """
+        Exports one row per unit with a column per measurement, to Parquet (.parquet) or Arrow IPC
+        (.arrow, .feather). Requires pyarrow.
+        @return: number of units written
+        """
+        try:
+            import pyarrow as pa
+            import pyarrow.ipc
+            import pyarrow.parquet
+        except ImportError:
+            raise RuntimeError(
+                "Exporting requires pyarrow, install with `poetry install --extras export`"
+            )
+
+        all_keys = self.measurement_keys()
+        keys = self.measurement_keys(patterns)
+        key_names = sorted(keys)
+        key_index = np.full(max(all_keys.values(), default=0) + 1, -1, dtype=np.int64)
+        for i, key in enumerate(key_names):
+            key_index[keys[key]] = i
+
+        schema = pa.schema(
+            [
+                ("id", pa.int64()),
+                ("record_key", pa.string()),
+                ("station", pa.string()),
+                ("slot", pa.string()),
+                ("serial", pa.string()),
+                ("rfid", pa.string()),
+                ("profile", pa.string()),
+                ("started_at", pa.float64()),
+                ("finished_at", pa.float64()),
+                ("passed", pa.bool_()),
+                ("error_code", pa.string()),
+                *[(key, pa.float64()) for key in key_names],
+            ]
+        )
+
+        if str(path).endswith(".parquet"):
+            writer = pyarrow.parquet.ParquetWriter(path, schema)
+        else:
+            writer = pyarrow.ipc.new_file(path, schema)
+
+        where, args = self._unit_filter()
+        written = 0
+        unit_cursor = self._connection.cursor().execute(
+            "SELECT id, record_key, station, slot, serial, rfid, profile, started_at, "
+            f"finished_at, passed, error_code FROM units WHERE {where} ORDER BY id",
+            args,
+        )
+        try:
+            while units := unit_cursor.fetchmany(self._chunk_size):
+                columns = list(zip(*units))
+                unit_ids = np.array(columns[0], dtype=np.int64)
+
+                matrix = np.full((len(units), len(key_names)), np.nan)
+                if key_names:
+                    rows = self._connection.execute(
+                        "SELECT unit_id, key_id, value FROM measurements "
+                        f"WHERE key_id IN ({', '.join('?' * len(keys))}) "
+                        "AND unit_id BETWEEN ? AND ?",
+                        (*keys.values(), int(unit_ids[0]), int(unit_ids[-1])),
+                    ).fetchall()
+                    if rows:
+                        data = np.array(rows, dtype=np.float64)
+                        rows_idx = np.searchsorted(
+                            unit_ids, data[:, 0].astype(np.int64)
+                        )
+                        cols_idx = key_index[data[:, 1].astype(np.int64)]
+                        mask = (
+                            (cols_idx >= 0)
+                            & (rows_idx < unit_ids.size)
+                            & (
+                                unit_ids[np.minimum(rows_idx, unit_ids.size - 1)]
+                                == data[:, 0]
+                            )
+                        )
+                        matrix[rows_idx[mask], cols_idx[mask]] = data[mask, 2]
+
+                arrays = [
+                    pa.array(unit_ids),
+                    *[pa.array(column, type=pa.string()) for column in columns[1:7]],
+                    pa.array(columns[7], type=pa.float64()),
+                    pa.array(columns[8], type=pa.float64()),
+                    pa.array([bool(passed) for passed in columns[9]]),
+                    pa.array(columns[10], type=pa.string()),
+                    *[pa.array(matrix[:, i]) for i in range(len(key_names))],
+                ]
+                writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+                written += len(units)
+        finally:
+            writer.close()
+
+        return written
+
+
+def summarise(
+    key: str, values: np.ndarray, lsl: float | None = None, usl: float | None = None
+) -> MeasurementStats:
+    mean = float(values.mean())
+    std = float(values.std(ddof=1)) if values.size > 1 else 0.0
+    p01, p50, p99 = np.percentile(values, [1, 50, 99]).tolist()
+
+    cpk = None
+    if std > 0 and (lsl is not None or usl is not None):
+        cpk = min(
+            (usl - mean) / (3 * std) if usl is not None else np.inf,
+            (mean - lsl) / (3 * std) if lsl is not None else np.inf,
+        )
+
+    return MeasurementStats(
+        key,
+        int(values.size),
+        mean,
+        std,
+        float(values.min()),
+        p01,
+        p50,
+        p99,
+        float(values.max()),
+        lsl,
+        usl,
+        cpk,
+    )
+
+
+def _parse_limit(value: str) -> tuple[str, tuple[float | None, float | None]]:
+    key, _, bounds = value.partition("=")
+    lsl, _, usl = bounds.partition(":")
+    return key, (float(lsl) if lsl else None, float(usl) if usl else None)
+
+
+def main(argv: list[str] = None):
+    parser = argparse.ArgumentParser(description="Analyse stored RF ATE results")
+    parser.add_argument("database", help="result store database")
+    parser.add_argument(
+        "--since", type=float, help="earliest finish time (unix seconds)"
+    )
+    parser.add_argument("--until", type=float, help="latest finish time (unix seconds)")
+    parser.add_argument(
+        "-m",
+        "--measurement",
+        action="append",
+        help="measurement key pattern, e.g. `*_avg_power.mean_delta_power`. Repeatable.",
+    )
+    parser.add_argument(
+        "-l",
+        "--limit",
+        action="append",
+        type=_parse_limit,
+        default=[],
+        help="spec limits for Cpk as `key=lsl:usl`, either side may be empty, in place of the "
+        "limits stored with each profile's units. Repeatable.",
+    )
+    parser.add_argument("--export", help="export units to a .parquet or .arrow file")
+    parser.add_argument("--json", action="store_true", help="print JSON")
+    args = parser.parse_args(argv)
+
+    analytics = ResultAnalytics(args.database, args.since, args.until)
+    try:
+        if args.export:
+            written = analytics.export(args.export, args.measurement)
+            print(f"Exported {written} unit(s) to {args.export}")
+            return
+
+        limits = dict(args.limit)
+        report = {
+            "yield": analytics.yield_summary(),
+            "pareto": analytics.failure_pareto(),
+            "measurements": [
+                asdict(stats)
+                for profile in analytics.profiles() or [None]
+                for stats in analytics.measurement_stats(
+                    args.measurement, limits, profile
+                )
+            ],
+        }
+    finally:
+        analytics.close()
+
+    if args.json:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+        return
+
+    summary = report["yield"]
+    print(
+        f"Units: {summary['units']}, passed: {summary['passed']}, failed: {summary['failed']}"
+    )
+    if summary["yield"] is not None:
+        print(f"Yield: {summary['yield']:.2%}")
+
+    print("\nFailure Pareto:")
+    for name, count, cumulative in report["pareto"]:
+        print(f"  {name:<40} {count:>8} {cumulative:>8.1%}")
+
+    profile = object()
+    for stats in report["measurements"]:
+        if stats["profile"] != profile:
+            profile = stats["profile"]
+            print(f"\nMeasurements, profile {profile or 'any'}:")
+            print(
+                f"  {'key':<48} {'n':>8} {'mean':>9} {'std':>9} {'p01':>9} {'p50':>9} {'p99':>9} {'cpk':>6}"
+            )
+        cpk = f"{stats['cpk']:.2f}" if stats["cpk"] is not None else "-"
+        print(
+            f"  {stats['key']:<48} {stats['count']:>8} {stats['mean']:>9.2f} {stats['std']:>9.2f} "
+            f"{stats['p01']:>9.2f} {stats['p50']:>9.2f} {stats['p99']:>9.2f} {cpk:>6}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+import json
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from os import PathLike
+
+from functional_test_core.models import TestInfo
+
+from filmmaker_rf_ate.results.records import dumps
+from filmmaker_rf_ate.utils.identity import DutIdentity
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS checkpoints (
+    serial TEXT NOT NULL,
+    rfid TEXT NOT NULL,
+    test TEXT NOT NULL,
+    passed INTEGER NOT NULL,
+    params TEXT NOT NULL,
+    results TEXT NOT NULL,
+    finished_at REAL NOT NULL,
+    complete INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (serial, rfid, test)
+);
+"""
+
+
+@dataclass
+class Checkpoint:
+    test: str
+    passed: bool
+    params: str
+    results: list[TestInfo]
+    finished_at: float
+    complete: bool
+
+
+def _key(identity: DutIdentity) -> tuple[str, str]:
+    return identity.serial or "", identity.rfid or ""
+
+
+class CheckpointStore:
+    """
+    Latest result of each test per DUT, keyed by serial number and RFID. Checkpoints are written
+    as each test finishes, so they survive a crash part way through a unit. Once the unit's run
+    completes they are marked complete, or deleted if the unit passed.
+    """
+
+    def __init__(self, path: PathLike | str):
+        self._connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.executescript(SCHEMA)
+        self._lock = threading.Lock()
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
+
+    def save(
+        self,
+        identity: DutIdentity,
+        test: str,
+        params: dict,
+        results: list[TestInfo],
+        finished_at: float = None,
+    ) -> None:
+        """
+        Records a finished test, replacing any earlier checkpoint of it
+        """
+        if not any(_key(identity)):
+            return
+
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO checkpoints "
+                "(serial, rfid, test, passed, params, results, finished_at, complete) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, 0)",
+                (
+                    *_key(identity),
+                    test,
+                    all(result.passed for result in results),
+                    dumps(params),
+                    dumps(
+                        [
+                            {
+                                "name": result.name,
+                                "passed": result.passed,
+                                "error_code": result.error_code,
+                                "info": result.info,
+                            }
+                            for result in results
+                        ]
+                    ),
+                    time.time() if finished_at is None else finished_at,
+                ),
+            )
+
+    def load(
+        self, identity: DutIdentity, max_age: float, include_complete: bool = False
+    ) -> dict[str, Checkpoint]:
+        """
+        @param identity: DUT to look up
+        @param max_age: ignore checkpoints older than this many seconds
+        @param include_complete: include checkpoints from runs that finished
+        @return: checkpoints keyed by test name
+        """
+        if not any(_key(identity)):
+            return {}
+
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT test, passed, params, results, finished_at, complete "
+                "FROM checkpoints WHERE serial = ? AND rfid = ? AND finished_at >= ?"
+                + ("" if include_complete else " AND complete = 0"),
+                (*_key(identity), time.time() - max_age),
+            ).fetchall()
+
+        checkpoints = {}
+        for test, passed, params, results, finished_at, complete in rows:
+            test_infos = []
+            for result in json.loads(results):
+                test_info = TestInfo(
+                    result["name"], bool(result["passed"]), info=result["info"]
+                )
+                test_info.error_code = result["error_code"]
+                test_infos.append(test_info)
+
+            checkpoints[test] = Checkpoint(
+                test, bool(passed), params, test_infos, finished_at, bool(complete)
+            )
+
+        return checkpoints
+
+    def complete(self, identity: DutIdentity, passed: bool) -> None:
+        """
+        Closes a unit's run. A passed unit's checkpoints are no longer needed; a failed unit's
+        are kept for a failed-only retest.
+        """
+        if not any(_key(identity)):
+            return
+
+        with self._lock, self._connection:
+            if passed:
+                self._connection.execute(
+                    "DELETE FROM checkpoints WHERE serial = ? AND rfid = ?",
+                    _key(identity),
+                )
+            else:
+                self._connection.execute(
+                    "UPDATE checkpoints SET complete = 1 WHERE serial = ? AND rfid = ?",
+                    _key(identity),
+                )
@@ -0,0 +1,309 @@
+# Compact in-memory DUT records, for keeping a whole session's results in memory
+import json
+from array import array
+from typing import Iterator
+
+from functional_test_core.models import TestInfo
+
+from filmmaker_rf_ate.results.records import DutRecord, dumps
+from filmmaker_rf_ate.utils.identity import DutIdentity
+
+# Labels and config-derived values repeat across units, so each distinct one is kept once.
+# Only immutable values are interned, as every record holding one shares it.
+_interned: dict = {}
+
+
+def _intern(value):
+    return _interned.setdefault(value, value)
+
+
+class _Slotted:
+    """
+    Pickles the slots as a plain tuple, which is smaller and faster than the default
+    """
+
+    __slots__ = ()
+
+    def __getstate__(self) -> tuple:
+        return tuple(getattr(self, slot) for slot in self.__slots__)
+
+    def __setstate__(self, state: tuple) -> None:
+        for slot, value in zip(self.__slots__, state):
+            setattr(self, slot, value)
+
+
+def _is_number(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+class MeasurementBlock(_Slotted):
+    """
+    Numeric values of one part of a result's info, in a flat array. Holds either a dict of numbers,
+    or a dict of rows that all have the same numeric columns, e.g. RF power per channel.
+    """
+
+    __slots__ = ("key", "rows", "columns", "values", "int_columns")
+
+    def __init__(
+        self,
+        key: str | None,
+        rows: tuple[str, ...] | None,
+        columns: tuple[str, ...],
+        values: array,
+        int_columns: int = 0,
+    ):
+        """
+        @param key: info key the block was read from, None for a result's top level numbers
+        @param rows: row labels, or None for a single row
+        @param columns: column labels
+        @param values: row major values
+        @param int_columns: bit per column, set if the column's values were ints
+        """
+        self.key = key
+        self.rows = rows
+        self.columns = columns
+        self.values = values
+        self.int_columns = int_columns
+
+    @classmethod
+    def from_dict(cls, key: str | None, values: dict) -> "MeasurementBlock | None":
+        """
+        @return: the block, or None if the dict does not have a block's shape
+        """
+        if not values:
+            return None
+
+        if all(_is_number(value) for value in values.values()):
+            rows = None
+            columns = _intern(tuple(values))
+            table = [tuple(values.values())]
+        else:
+            first = next(iter(values.values()))
+            if not isinstance(first, dict) or not first:
+                return None
+
+            columns = tuple(first)
+            if not all(
+                isinstance(row, dict)
+                and tuple(row) == columns
+                and all(_is_number(value) for value in row.values())
+                for row in values.values()
+            ):
+                return None
+
+            rows = _intern(tuple(values))
+            columns = _intern(columns)
+            table = [tuple(row.values()) for row in values.values()]
+
+        int_columns = 0
+        for column in range(len(columns)):
+            if all(isinstance(row[column], int) for row in table):
+                int_columns |= 1 << column
+
+        return cls(
+            key,
+            rows,
+            columns,
+            array("d", [value for row in table for value in row]),
+            int_columns,
+        )
+
+    def _row(self, index: int) -> dict:
+        offset = index * len(self.columns)
+        return {
+            column: int(self.values[offset + i])
+            if self.int_columns >> i & 1
+            else self.values[offset + i]
+            for i, column in enumerate(self.columns)
+        }
+
+    def to_dict(self) -> dict:
+        if self.rows is None:
+            return self._row(0)
+        return {row: self._row(i) for i, row in enumerate(self.rows)}
+
+
+class CompactResult(_Slotted):
+    """
+    A TestInfo with its info dict split into measurement blocks and the remaining values
+    """
+
+    __slots__ = ("name", "passed", "error_code", "keys", "blocks", "limits", "other")
+
+    def __init__(
+        self,
+        name: str,
+        passed: bool,
+        error_code: str,
+        keys: tuple[str, ...] | None,
+        blocks: tuple[MeasurementBlock, ...],
+        limits: str | None,
+        other: dict | None,
+    ):
+        """
+        @param keys: info keys in their original order, or None if the result had no info
+        @param blocks: numeric parts of the info
+        @param limits: the info's limits as JSON, if it has any
+        @param other: the rest of the info, e.g. versions and RFIDs
+        """
+        self.name = name
+        self.passed = passed
+        self.error_code = error_code
+        self.keys = keys
+        self.blocks = blocks
+        self.limits = limits
+        self.other = other
+
+    @classmethod
+    def from_test_info(cls, result: TestInfo) -> "CompactResult":
+        info = result.info
+        if info is None:
+            return cls(
+                result.name, result.passed, result.error_code, None, (), None, None
+            )
+
+        numbers = {}
+        blocks = []
+        limits = None
+        other = {}
+        for key, value in info.items():
+            if _is_number(value):
+                numbers[key] = value
+            elif key == "limits":
+                limits = _intern(dumps(value))
+            elif isinstance(value, dict) and (
+                block := MeasurementBlock.from_dict(key, value)
+            ):
+                blocks.append(block)
+            else:
+                other[key] = value
+
+        if numbers:
+            blocks.insert(0, MeasurementBlock.from_dict(None, numbers))
+
+        return cls(
+            result.name,
+            result.passed,
+            result.error_code,
+            _intern(tuple(info)),
+            tuple(blocks),
+            limits,
+            other or None,
+        )
+
+    def to_info(self) -> dict | None:
+        if self.keys is None:
+            return None
+
+        values = {} if self.other is None else dict(self.other)
+        if self.limits is not None:
+            values["limits"] = json.loads(self.limits)
+        for block in self.blocks:
+            if block.key is None:
+                values.update(block.to_dict())
+            else:
+                values[block.key] = block.to_dict()
+        return {key: values[key] for key in self.keys}
+
+    def to_test_info(self) -> TestInfo:
+        result = TestInfo(self.name, self.passed, info=self.to_info())
+        result.error_code = self.error_code
+        return result
+
+
+class CompactRecord(_Slotted):
+    """
+    A DutRecord in a fraction of the memory. Params are kept as JSON, shared between records
+    that have the same, and timings are kept as JSON until needed.
+    """
+
+    __slots__ = (
+        "slot",
+        "serial",
+        "rfid",
+        "results",
+        "started_at",
+        "finished_at",
+        "params",
+        "timings",
+        "profile",
+        "station",
+        "record_key",
+    )
+
+    def __init__(self, record: DutRecord):
+        self.slot = record.slot
+        self.serial = record.identity.serial
+        self.rfid = record.identity.rfid
+        self.results = tuple(
+            CompactResult.from_test_info(result) for result in record.results
+        )
+        self.started_at = record.started_at
+        self.finished_at = record.finished_at
+        self.params = _intern(dumps(record.params))
+        self.timings = dumps(record.timings) if record.timings else None
+        self.profile = record.profile
+        self.station = _intern(record.station)
+        self.record_key = record.record_key
+
+    @property
+    def passed(self) -> bool:
+        return all(result.passed for result in self.results)
+
+    @property
+    def error_code(self) -> str:
+        return "".join(
+            [result.error_code for result in self.results if not result.passed]
+        )
+
+    def to_record(self) -> DutRecord:
+        return DutRecord(
+            self.slot,
+            DutIdentity(self.serial, self.rfid),
+            [result.to_test_info() for result in self.results],
+            self.started_at,
+            self.finished_at,
+            params=json.loads(self.params),
+            timings={} if self.timings is None else json.loads(self.timings),
+            profile=self.profile,
+            station=self.station,
+            record_key=self.record_key,
+        )
+
+    def to_dict(self) -> dict:
+        return self.to_record().to_dict()
+
+
+class SessionResults:
+    """
+    Every DUT record of a session, kept compact so long sessions stay small
+    """
+
+    def __init__(self):
+        self._records: list[CompactRecord] = []
+        self._passed = 0
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def __iter__(self) -> Iterator[CompactRecord]:
+        return iter(self._records)
+
+    @property
+    def passed(self) -> int:
+        return self._passed
+
+    def append(self, record: DutRecord) -> None:
+        compact = CompactRecord(record)
+        self._records.append(compact)
+        self._passed += compact.passed
+
+    def records(self) -> Iterator[DutRecord]:
+        """
+        @return: the records in their full form, built as iterated
+        """
+        return (record.to_record() for record in self._records)
+
+    def clear(self) -> None:
+        self._records = []
+        self._passed = 0
@@ -0,0 +1,377 @@
+# Shortest connection stats durations and smallest RF power channel sets that would have made the
+# same decisions on stored units
+import argparse
+import json
+import sys
+from dataclasses import asdict, dataclass
+from itertools import combinations
+
+import numpy as np
+import yaml
+
+from filmmaker_rf_ate.config.config import read_config
+from filmmaker_rf_ate.config.tests import TestConfig
+from filmmaker_rf_ate.results.analytics import ResultAnalytics
+from filmmaker_rf_ate.tests.test_profiles import resolve_profile
+
+# Beyond this many channels, only subsets of up to three channels are tried
+MAX_EXHAUSTIVE_CHANNELS = 12
+
+
+@dataclass
+class Candidate:
+    value: int | list[str]
+    units: int
+    # Failed with the current setting, but would have passed with this one
+    escapes: int
+    # Passed with the current setting, but would have failed with this one
+    false_fails: int
+    allowed_errors: int | None = None
+
+    @property
+    def escape_rate(self) -> float:
+        return self.escapes / self.units if self.units else 0.0
+
+    @property
+    def false_fail_rate(self) -> float:
+        return self.false_fails / self.units if self.units else 0.0
+
+
+@dataclass
+class Recommendation:
+    setting: str
+    current: int | list[str]
+    chosen: Candidate | None
+    candidates: list[Candidate]
+    note: str | None = None
+
+
+def window_durations(duration: int, windows: int) -> np.ndarray:
+    """
+    @return: length of each window, as ConnectionStatsTest splits a measurement
+    """
+    windows = max(min(windows, duration), 1)
+    return duration // windows + (np.arange(windows) < duration % windows)
+
+
+def channel_subsets(count: int) -> np.ndarray:
+    """
+    @return: a row per channel subset to try, marking the channels used, smallest first and
+    ending with all channels
+    """
+    if count <= MAX_EXHAUSTIVE_CHANNELS:
+        subsets = np.arange(1, 2**count)[:, np.newaxis] >> np.arange(count) & 1
+    else:
+        subsets = np.array(
+            [
+                np.isin(np.arange(count), combination)
+                for size in (1, 2, 3)
+                for combination in combinations(range(count), size)
+            ]
+            + [np.ones(count, dtype=bool)],
+            dtype=np.int64,
+        )
+    return subsets[np.argsort(subsets.sum(axis=1), kind="stable")]
+
+
+def _matrix(
+    measurements: dict[str, tuple[np.ndarray, np.ndarray]],
+    keys: list[str],
+    unit_ids: np.ndarray,
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    @param unit_ids: sorted ids of the units to include
+    @return: ids of those units with a value for every key, and their values, a column per key
+    """
+    for key in keys:
+        if key not in measurements:
+            return np.empty(0, dtype=np.int64), np.empty((0, len(keys)))
+        unit_ids = np.intersect1d(unit_ids, measurements[key][0], assume_unique=True)
+
+    matrix = np.empty((unit_ids.size, len(keys)))
+    for column, key in enumerate(keys):
+        ids, values = measurements[key]
+        matrix[:, column] = values[np.searchsorted(ids, unit_ids)]
+    return unit_ids, matrix
+
+
+def _compare(
+    passed: np.ndarray, reference: np.ndarray
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    @param passed: decision of each unit (rows) under each candidate (columns)
+    @param reference: decision of each unit under the current setting
+    @return: escapes and false fails of each candidate
+    """
+    reference = reference[:, np.newaxis]
+    return (
+        np.count_nonzero(passed & ~reference, axis=0),
+        np.count_nonzero(~passed & reference, axis=0),
+    )
+
+
+def _choose(
+    candidates: list[Candidate], max_escape_rate: float, max_false_fail_rate: float
+) -> Candidate | None:
+    """
+    @param candidates: cheapest first
+    @return: the cheapest candidate within both bounds
+    """
+    return next(
+        (
+            candidate
+            for candidate in candidates
+            if candidate.escape_rate <= max_escape_rate
+            and candidate.false_fail_rate <= max_false_fail_rate
+        ),
+        None,
+    )
+
+
+class DurationOptimiser:
+    """
+    Replays the per-window connection stats and per-channel RF power results of stored units
+    against shorter measurements and smaller channel sets. A candidate is acceptable if the units
+    it would have let through that failed (escapes), and those it would have failed that passed,
+    stay within `max_escape_rate` and `max_false_fail_rate` of all units. Error limits are scaled
+    with the duration, as the built-in profiles do.
+    """
+
+    def __init__(
+        self,
+        analytics: ResultAnalytics,
+        test_config: TestConfig,
+        profile: str,
+        max_escape_rate: float = 0.001,
+        max_false_fail_rate: float = 0.01,
+    ):
+        self._analytics = analytics
+        self._test_config = test_config
+        self._profile = profile
+        self._profile_config = resolve_profile(test_config, profile)
+        self._max_escape_rate = max_escape_rate
+        self._max_false_fail_rate = max_false_fail_rate
+        self._unit_ids = analytics.unit_ids(profile)
+
+    def _load(self, keys: list[str]) -> tuple[np.ndarray, np.ndarray]:
+        return _matrix(
+            self._analytics.load_measurements(self._analytics.measurement_keys(keys)),
+            keys,
+            self._unit_ids,
+        )
+
+    def _windows(self, name: str) -> tuple[np.ndarray, np.ndarray, int]:
+        """
+        @return: unit ids, a column per window, and the window count. Units whose measurement
+        was split differently are left out.
+        """
+        windows = self._test_config.connection_stats.windows
+        keys = [f"{name}.windows.{i}" for i in range(windows)]
+        unit_ids, matrix = self._load(keys)
+        other = self._analytics.load_measurements(
+            self._analytics.measurement_keys([f"{name}.windows.{windows}"])
+        )
+        if other:
+            keep = ~np.isin(unit_ids, next(iter(other.values()))[0])
+            unit_ids, matrix = unit_ids[keep], matrix[keep]
+        return unit_ids, matrix, windows
+
+    def duration_short(self) -> Recommendation:
+        current = self._profile_config.duration_short
+        _, rssi, windows = self._windows("min_rssi")
+        if windows < 2 or not rssi.size:
+            return Recommendation(
+                "duration_short", current, None, [], "no per-window RSSI stored"
+            )
+
+        lengths = window_durations(current, windows)
+        durations = np.cumsum(lengths)
+        # A shorter measurement averages over its own span
+        average = np.cumsum(rssi * lengths, axis=1) / durations
+        # The test itself averages its windows evenly
+        average[:, -1] = rssi.mean(axis=1)
+        passed = average >= self._test_config.connection_stats.min_rssi
+        escapes, false_fails = _compare(passed, passed[:, -1])
+
+        candidates = [
+            Candidate(int(duration), int(rssi.shape[0]), int(e), int(f))
+            for duration, e, f in zip(durations, escapes, false_fails)
+        ]
+        return Recommendation(
+            "duration_short",
+            current,
+            _choose(candidates, self._max_escape_rate, self._max_false_fail_rate),
+            candidates,
+        )
+
+    def duration_long(self) -> Recommendation:
+        current = self._profile_config.duration_long
+        allowed = self._profile_config.allowed_errors
+        ch1_ids, ch1, windows = self._windows("ch1_total_errors")
+        ch2_ids, ch2, _ = self._windows("ch2_total_errors")
+        unit_ids = np.intersect1d(ch1_ids, ch2_ids, assume_unique=True)
+        if windows < 2 or not unit_ids.size:
+            return Recommendation(
+                "duration_long", current, None, [], "no per-window errors stored"
+            )
+
+        ch1 = ch1[np.searchsorted(ch1_ids, unit_ids)]
+        ch2 = ch2[np.searchsorted(ch2_ids, unit_ids)]
+        durations = np.cumsum(window_durations(current, windows))
+        limits = np.round(allowed * durations / current)
+        passed = (np.cumsum(ch1, axis=1) < limits) & (np.cumsum(ch2, axis=1) < limits)
+        escapes, false_fails = _compare(passed, passed[:, -1])
+
+        candidates = [
+            Candidate(int(duration), int(unit_ids.size), int(e), int(f), int(limit))
+            for duration, limit, e, f in zip(durations, limits, escapes, false_fails)
+        ]
+        return Recommendation(
+            "duration_long",
+            current,
+            _choose(candidates, self._max_escape_rate, self._max_false_fail_rate),
+            candidates,
+        )
+
+    def channels(self) -> Recommendation:
+        channels = [channel.name for channel in self._profile_config.channels]
+        antennae = self._profile_config.antennae
+        keys = [
+            f"{antenna.antenna.name}_avg_power.channels.{channel}.pow_delta"
+            for antenna in antennae
+            for channel in channels
+        ]
+        unit_ids, deltas = self._load(keys)
+        if not unit_ids.size:
+            return Recommendation(
+                "channels", channels, None, [], "no per-channel power stored"
+            )
+
+        count = len(channels)
+        subsets = channel_subsets(count)
+        weights = subsets / subsets.sum(axis=1, keepdims=True)
+
+        deltas = deltas.reshape(unit_ids.size, len(antennae), count)
+        min_deltas = np.array([antenna.min_delta for antenna in antennae])
+        # units x antennae x subsets
+        means = deltas @ weights.T
+        passed = np.all(means > min_deltas[np.newaxis, :, np.newaxis], axis=1)
+        escapes, false_fails = _compare(passed, passed[:, -1])
+
+        candidates = [
+            Candidate(
+                [channel for channel, used in zip(channels, subset) if used],
+                int(unit_ids.size),
+                int(e),
+                int(f),
+            )
+            for subset, e, f in zip(subsets, escapes, false_fails)
+        ]
+        return Recommendation(
+            "channels",
+            channels,
+            _choose(candidates, self._max_escape_rate, self._max_false_fail_rate),
+            candidates,
+        )
+
+    def recommend(self) -> list[Recommendation]:
+        return [self.duration_short(), self.duration_long(), self.channels()]
+
+    def config_patch(self, recommendations: list[Recommendation]) -> dict:
+        """
+        @return: profile settings to merge into config.yaml, only those that would change
+        """
+        settings = {}
+        for recommendation in recommendations:
+            chosen = recommendation.chosen
+            if chosen is None or chosen.value == recommendation.current:
+                continue
+
+            settings[recommendation.setting] = chosen.value
+            if chosen.allowed_errors is not None:
+                settings["allowed_errors"] = chosen.allowed_errors
+
+        if not settings:
+            return {}
+        return {"tests": {"profiles": {self._profile: settings}}}
+
+
+def main(argv: list[str] = None):
+    parser = argparse.ArgumentParser(
+        description="Find shorter test durations and smaller channel sets from stored results"
+    )
+    parser.add_argument("database", help="result store database")
+    parser.add_argument("--config", help="config.yaml the units were tested with")
+    parser.add_argument(
+        "--profile", help="profile to optimise, the default if not given"
+    )
+    parser.add_argument(
+        "--since", type=float, help="earliest finish time (unix seconds)"
+    )
+    parser.add_argument("--until", type=float, help="latest finish time (unix seconds)")
+    parser.add_argument("--max-escape-rate", type=float, default=0.001)
+    parser.add_argument("--max-false-fail-rate", type=float, default=0.01)
+    parser.add_argument("-o", "--output", help="write the config patch to this file")
+    parser.add_argument("--json", action="store_true", help="print JSON")
+    args = parser.parse_args(argv)
+
+    if args.config:
+        config = read_config(args.config)
+    else:
+        from filmmaker_rf_ate.config import CONFIG
+
+        config = CONFIG
+    profile = args.profile or config.tests.profile_policy.default_profile
+
+    analytics = ResultAnalytics(args.database, args.since, args.until)
+    try:
+        optimiser = DurationOptimiser(
+            analytics,
+            config.tests,
+            profile,
+            args.max_escape_rate,
+            args.max_false_fail_rate,
+        )
+        recommendations = optimiser.recommend()
+    finally:
+        analytics.close()
+
+    patch = optimiser.config_patch(recommendations)
+    if args.output:
+        with open(args.output, "w") as file:
+            yaml.safe_dump(patch, file, sort_keys=False)
+
+    if args.json:
+        json.dump(
+            {
+                "recommendations": [
+                    asdict(recommendation) for recommendation in recommendations
+                ],
+                "patch": patch,
+            },
+            sys.stdout,
+            indent=2,
+        )
+        print()
+        return
+
+    for recommendation in recommendations:
+        print(f"{recommendation.setting} (currently {recommendation.current}):")
+        if recommendation.note:
+            print(f"  skipped, {recommendation.note}")
+            continue
+
+        for candidate in recommendation.candidates:
+            marker = "*" if candidate is recommendation.chosen else " "
+            print(
+                f"  {marker} {str(candidate.value):<48} escapes {candidate.escapes:>6} "
+                f"({candidate.escape_rate:.3%})  false fails {candidate.false_fails:>6} "
+                f"({candidate.false_fail_rate:.3%})"
+            )
+
+    print("\nConfig patch:")
+    print(yaml.safe_dump(patch, sort_keys=False) if patch else "  no changes")
+
+
+if __name__ == "__main__":
+    main()
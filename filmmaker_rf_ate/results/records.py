@@ -0,0 +1,124 @@
+import json
+import platform
+import uuid
+from dataclasses import dataclass, field
+from enum import Enum
+
+from functional_test_core.device_test import TestHandler
+from functional_test_core.models import TestInfo
+
+from filmmaker_rf_ate.utils.identity import DutIdentity
+from filmmaker_rf_ate.utils.window_tests import all_tests
+
+
+def json_default(value):
+    if isinstance(value, (bytes, bytearray)):
+        return value.hex()
+    if isinstance(value, Enum):
+        return value.name
+    return str(value)
+
+
+def dumps(value) -> str:
+    return json.dumps(value, default=json_default, separators=(",", ":"))
+
+
+def flatten_measurements(name: str, info: dict | None) -> dict[str, float]:
+    """
+    Flattens the numeric leaves of a result's info dict, skipping limits
+    @param name: name of the result, used as the key prefix
+    @param info: result info dict
+    @return: dotted measurement key to value, e.g. `min_rssi.measured_average`
+    """
+    measurements = {}
+    if not info:
+        return measurements
+
+    for key, value in info.items():
+        if key == "limits":
+            continue
+
+        if isinstance(value, dict):
+            measurements.update(flatten_measurements(f"{name}.{key}", value))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            measurements[f"{name}.{key}"] = float(value)
+
+    return measurements
+
+
+@dataclass
+class DutRecord:
+    slot: str | None
+    identity: DutIdentity
+    results: list[TestInfo]
+    started_at: float
+    finished_at: float
+    params: dict[str, dict] = field(default_factory=dict)
+    timings: dict[str, dict] = field(default_factory=dict)
+    profile: str | None = None
+    station: str = field(default_factory=platform.node)
+    record_key: str = field(default_factory=lambda: uuid.uuid4().hex)
+
+    @property
+    def passed(self) -> bool:
+        return all(result.passed for result in self.results)
+
+    @property
+    def error_code(self) -> str:
+        return "".join(
+            [result.error_code for result in self.results if not result.passed]
+        )
+
+    @classmethod
+    def from_test_handler(
+        cls,
+        slot: str | None,
+        identity: DutIdentity,
+        test_handler: TestHandler,
+        results: list[TestInfo],
+        started_at: float,
+        finished_at: float,
+        profile: str | None = None,
+    ) -> "DutRecord":
+        return cls(
+            slot,
+            identity,
+            results,
+            started_at,
+            finished_at,
+            params={
+                test.name: dict(getattr(test, "_test_params", {}))
+                for test in all_tests(test_handler.tests)
+            },
+            timings={
+                test.name: test.timing
+                for test in all_tests(test_handler.tests)
+                if getattr(test, "timing", None) is not None
+            },
+            profile=profile,
+        )
+
+    def to_dict(self) -> dict:
+        return {
+            "record_key": self.record_key,
+            "station": self.station,
+            "slot": self.slot,
+            "serial": self.identity.serial,
+            "rfid": self.identity.rfid,
+            "profile": self.profile,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "passed": self.passed,
+            "error_code": self.error_code,
+            "params": self.params,
+            "timings": self.timings,
+            "results": [
+                {
+                    "name": result.name,
+                    "passed": result.passed,
+                    "error_code": result.error_code,
+                    "info": result.info,
+                }
+                for result in self.results
+            ],
+        }
@@ -0,0 +1,348 @@
+import logging
+import os
+import queue
+import sqlite3
+import threading
+from os import PathLike
+
+from filmmaker_rf_ate.results.records import DutRecord, dumps, flatten_measurements
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS units (
+    id INTEGER PRIMARY KEY,
+    record_key TEXT NOT NULL UNIQUE,
+    station TEXT,
+    slot TEXT,
+    serial TEXT,
+    rfid TEXT,
+    profile TEXT,
+    started_at REAL NOT NULL,
+    finished_at REAL NOT NULL,
+    passed INTEGER NOT NULL,
+    error_code TEXT,
+    params TEXT,
+    timings TEXT
+);
+CREATE INDEX IF NOT EXISTS units_serial ON units (serial);
+CREATE INDEX IF NOT EXISTS units_rfid ON units (rfid);
+CREATE INDEX IF NOT EXISTS units_finished_at ON units (finished_at);
+
+CREATE TABLE IF NOT EXISTS results (
+    unit_id INTEGER NOT NULL REFERENCES units (id),
+    name TEXT NOT NULL,
+    passed INTEGER NOT NULL,
+    error_code TEXT,
+    info TEXT
+);
+CREATE INDEX IF NOT EXISTS results_unit_id ON results (unit_id);
+
+CREATE TABLE IF NOT EXISTS measurement_keys (
+    id INTEGER PRIMARY KEY,
+    key TEXT NOT NULL UNIQUE
+);
+
+CREATE TABLE IF NOT EXISTS measurements (
+    unit_id INTEGER NOT NULL REFERENCES units (id),
+    key_id INTEGER NOT NULL REFERENCES measurement_keys (id),
+    value REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS measurements_key_id ON measurements (key_id, unit_id);
+"""
+
+
+def connect(path: PathLike | str) -> sqlite3.Connection:
+    connection = sqlite3.connect(path, timeout=30)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    connection.executescript(SCHEMA)
+    return connection
+
+
+class ResultStore:
+    """
+    Append-only SQLite store of DUT records. Records are queued by the test threads and written
+    in batches by a background writer thread. A batch that fails to write is kept and retried.
+    Once out of attempts, its records are written one by one, and any that still fail are
+    appended to a JSON Lines file beside the database rather than lost.
+    """
+
+    _STOP = object()
+
+    def __init__(
+        self,
+        path: PathLike | str,
+        batch_size: int = 256,
+        flush_interval: float = 0.5,
+        retry_interval: float = 1.0,
+        max_attempts: int = 5,
+    ):
+        """
+        @param retry_interval: seconds between attempts to write a failed batch
+        @param max_attempts: attempts at a batch before its records are written one by one
+        """
+        self._path = path
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+        self._retry_interval = retry_interval
+        self._max_attempts = max_attempts
+        self.failed_path = f"{os.fspath(path)}.failed.jsonl"
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._key_ids: dict[str, int] = {}
+        self._logger = logging.getLogger("result_store")
+
+        connect(self._path).close()
+
+        self._writer = threading.Thread(
+            target=self._write_loop, name="result_store", daemon=True
+        )
+        self._writer.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def record(self, record: DutRecord) -> None:
+        """
+        Queues a record for writing, never blocks
+        """
+        self._queue.put(record)
+
+    def close(self, timeout: float = None) -> None:
+        """
+        Writes any queued records and stops the writer thread
+        """
+        if self._writer.is_alive():
+            self._queue.put(self._STOP)
+            self._writer.join(timeout)
+
+    def _write_loop(self):
+        connection = connect(self._path)
+        self._load_key_ids(connection)
+
+        # Records whose write failed, retried ahead of newer ones
+        pending = []
+        attempts = 0
+        stopping = False
+        while not stopping or pending:
+            if not stopping:
+                batch = self._take_batch(self._retry_interval if pending else None)
+                if self._STOP in batch:
+                    stopping = True
+                    batch = [record for record in batch if record is not self._STOP]
+                pending.extend(batch)
+
+            if not pending:
+                continue
+
+            try:
+                with connection:
+                    for record in pending:
+                        self._insert(connection, record)
+                pending = []
+                attempts = 0
+                continue
+            except Exception:
+                attempts += 1
+                self._logger.exception(
+                    f"Failed to write {len(pending)} record(s), attempt {attempts}"
+                )
+                self._reload_key_ids(connection)
+
+            if stopping or attempts >= self._max_attempts:
+                self._set_aside(self._write_each(connection, pending))
+                pending = []
+                attempts = 0
+
+        connection.close()
+
+    def _take_batch(self, timeout: float | None) -> list:
+        """
+        @param timeout: seconds to wait for the first record, or None to wait for one
+        @return: queued records, up to a batch, or none if the timeout ran out
+        """
+        try:
+            batch = [self._queue.get(timeout=timeout)]
+        except queue.Empty:
+            return []
+
+        while len(batch) < self._batch_size:
+            try:
+                batch.append(self._queue.get(timeout=self._flush_interval))
+            except queue.Empty:
+                break
+        return batch
+
+    def _write_each(
+        self, connection: sqlite3.Connection, records: list[DutRecord]
+    ) -> list[DutRecord]:
+        """
+        Writes records one transaction each, so one bad record does not hold back the rest
+        @return: the records that failed
+        """
+        failed = []
+        for record in records:
+            try:
+                with connection:
+                    self._insert(connection, record)
+            except Exception:
+                self._logger.exception(f"Failed to write record {record.record_key}")
+                self._reload_key_ids(connection)
+                failed.append(record)
+        return failed
+
+    def _set_aside(self, records: list[DutRecord]) -> None:
+        if not records:
+            return
+
+        lines = []
+        for record in records:
+            try:
+                lines.append(dumps(record.to_dict()) + "\n")
+            except Exception:
+                self._logger.exception(
+                    f"Failed to serialise record {record.record_key}"
+                )
+        try:
+            with open(self.failed_path, "a") as file:
+                file.writelines(lines)
+            self._logger.error(
+                f"Set aside {len(lines)} record(s) in {self.failed_path}"
+            )
+        except OSError:
+            # Last resort, so the records can still be recovered from the log
+            self._logger.exception(f"Failed to set aside records: {''.join(lines)}")
+
+    def _reload_key_ids(self, connection: sqlite3.Connection) -> None:
+        # Ids inserted by a rolled back transaction are no longer valid
+        try:
+            self._load_key_ids(connection)
+        except sqlite3.Error:
+            self._key_ids = {}
+            self._logger.exception("Failed to reload measurement keys")
+
+    def _load_key_ids(self, connection: sqlite3.Connection) -> None:
+        self._key_ids = {
+            key: key_id
+            for key_id, key in connection.execute(
+                "SELECT id, key FROM measurement_keys"
+            )
+        }
+
+    def _key_id(self, connection: sqlite3.Connection, key: str) -> int:
+        key_id = self._key_ids.get(key)
+        if key_id is None:
+            connection.execute(
+                "INSERT OR IGNORE INTO measurement_keys (key) VALUES (?)", (key,)
+            )
+            (key_id,) = connection.execute(
+                "SELECT id FROM measurement_keys WHERE key = ?", (key,)
+            ).fetchone()
+            self._key_ids[key] = key_id
+        return key_id
+
+    def _insert(self, connection: sqlite3.Connection, record: DutRecord) -> None:
+        cursor = connection.execute(
+            "INSERT OR IGNORE INTO units (record_key, station, slot, serial, rfid, profile, "
+            "started_at, finished_at, passed, error_code, params, timings) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                record.record_key,
+                record.station,
+                record.slot,
+                record.identity.serial,
+                record.identity.rfid,
+                record.profile,
+                record.started_at,
+                record.finished_at,
+                record.passed,
+                record.error_code,
+                dumps(record.params),
+                dumps(record.timings),
+            ),
+        )
+        if cursor.rowcount == 0:
+            return  # Already stored
+
+        unit_id = cursor.lastrowid
+
+        connection.executemany(
+            "INSERT INTO results (unit_id, name, passed, error_code, info) VALUES (?, ?, ?, ?, ?)",
+            [
+                (
+                    unit_id,
+                    result.name,
+                    result.passed,
+                    result.error_code,
+                    dumps(result.info),
+                )
+                for result in record.results
+            ],
+        )
+
+        measurements = {}
+        for result in record.results:
+            measurements.update(flatten_measurements(result.name, result.info))
+
+        connection.executemany(
+            "INSERT INTO measurements (unit_id, key_id, value) VALUES (?, ?, ?)",
+            [
+                (unit_id, self._key_id(connection, key), value)
+                for key, value in measurements.items()
+            ],
+        )
+
+    def find(
+        self,
+        serial: str = None,
+        rfid: str = None,
+        since: float = None,
+        until: float = None,
+        limit: int = 1000,
+    ) -> list[dict]:
+        """
+        Looks up stored units, newest first
+        @param serial: serial number to match
+        @param rfid: RFID (hex) to match
+        @param since: earliest finish time (unix seconds)
+        @param until: latest finish time (unix seconds)
+        @param limit: maximum number of units returned
+        @return: unit rows, each with a list of its results
+        """
+        clauses = []
+        args = []
+        for clause, arg in (
+            ("serial = ?", serial),
+            ("rfid = ?", rfid),
+            ("finished_at >= ?", since),
+            ("finished_at <= ?", until),
+        ):
+            if arg is not None:
+                clauses.append(clause)
+                args.append(arg)
+
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+
+        connection = sqlite3.connect(self._path, timeout=30)
+        connection.row_factory = sqlite3.Row
+        try:
+            units = [
+                dict(row)
+                for row in connection.execute(
+                    f"SELECT * FROM units {where} ORDER BY finished_at DESC LIMIT ?",
+                    (*args, limit),
+                )
+            ]
+            for unit in units:
+                unit["results"] = [
+                    dict(row)
+                    for row in connection.execute(
+                        "SELECT name, passed, error_code, info FROM results WHERE unit_id = ?",
+                        (unit["id"],),
+                    )
+                ]
+        finally:
+            connection.close()
+
+        return units
@@ -0,0 +1,233 @@
+import gzip
+import hashlib
+import http.client
+import logging
+import random
+import sqlite3
+import threading
+import time
+from os import PathLike
+from urllib.parse import urlsplit
+
+from filmmaker_rf_ate.results.records import DutRecord, dumps
+from filmmaker_rf_ate.utils.instrumentation import METRICS, StationMetrics
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY,
+    record_key TEXT NOT NULL UNIQUE,
+    payload TEXT NOT NULL,
+    queued_at REAL NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    rejected INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+# Statuses worth retrying. Any other error status means the MES will never accept the batch, so it
+# is resent in halves to find the records at fault.
+RETRY_STATUSES = {408, 425, 429, 500, 502, 503, 504}
+
+
+class UploadError(Exception):
+    def __init__(self, message: str, retry: bool):
+        super().__init__(message)
+        self.retry = retry
+
+
+class UploadQueue:
+    """
+    Durable outbox of DUT records for the MES. Records are written to SQLite as they complete, and
+    a background thread posts them in gzipped batches over one kept-alive connection. Failed posts
+    back off exponentially, and every record carries its record key so a batch that is resent
+    after a lost response is not stored twice.
+    """
+
+    def __init__(
+        self,
+        path: PathLike | str,
+        url: str,
+        batch_size: int = 100,
+        timeout: float = 10.0,
+        min_backoff: float = 1.0,
+        max_backoff: float = 300.0,
+        headers: dict[str, str] = None,
+        metrics: StationMetrics = METRICS,
+    ):
+        self._url = urlsplit(url)
+        if self._url.scheme not in ("http", "https"):
+            raise ValueError(f"Unsupported upload URL `{url}`")
+
+        self._batch_size = batch_size
+        self._timeout = timeout
+        self._min_backoff = min_backoff
+        self._max_backoff = max_backoff
+        self._headers = {} if headers is None else headers
+        self._metrics = metrics
+        self._connection: http.client.HTTPConnection | None = None
+        self._logger = logging.getLogger("upload_queue")
+
+        self._db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+        self._lock = threading.Lock()
+
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._uploader = threading.Thread(
+            target=self._upload_loop, name="upload_queue", daemon=True
+        )
+        self._uploader.start()
+
+    def record(self, record: DutRecord) -> None:
+        """
+        Adds a record to the outbox. Only touches the local disk, so never waits on the network.
+        """
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR IGNORE INTO outbox (record_key, payload, queued_at) "
+                "VALUES (?, ?, ?)",
+                (record.record_key, dumps(record.to_dict()), time.time()),
+            )
+        self._wake.set()
+
+    def stats(self) -> tuple[int, float]:
+        """
+        @return: records waiting to be uploaded, and the age in seconds of the oldest
+        """
+        with self._lock:
+            depth, oldest = self._db.execute(
+                "SELECT COUNT(*), MIN(queued_at) FROM outbox WHERE rejected = 0"
+            ).fetchone()
+        return depth, 0.0 if oldest is None else time.time() - oldest
+
+    def close(self, timeout: float = None) -> None:
+        """
+        Stops the uploader. Records still waiting stay in the outbox for the next session.
+        """
+        self._stop.set()
+        self._wake.set()
+        self._uploader.join(timeout)
+        with self._lock:
+            self._db.close()
+
+    def _upload_loop(self) -> None:
+        backoff = 0.0
+        while not self._stop.is_set():
+            try:
+                uploaded = self._upload_batch()
+                backoff = 0.0
+            except UploadError as e:
+                uploaded = 0
+                backoff = min(self._max_backoff, max(self._min_backoff, backoff * 2))
+                self._logger.warning(f"{e}, retrying in {backoff:.1f}s")
+            except sqlite3.Error:
+                uploaded = 0
+                backoff = self._max_backoff
+                self._logger.exception("Failed to read the outbox")
+
+            depth, lag = self.stats()
+            self._metrics.set_upload_queue(depth, lag)
+
+            if backoff:
+                # Jitter so stations coming back online do not all retry at once
+                self._stop.wait(backoff * random.uniform(0.5, 1.0))
+            elif not uploaded or not depth:
+                self._wake.wait(self._timeout)
+                self._wake.clear()
+
+        if self._connection is not None:
+            self._connection.close()
+
+    def _upload_batch(self) -> int:
+        """
+        Posts the oldest waiting records
+        @return: number of records uploaded
+        """
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT id, record_key, payload FROM outbox WHERE rejected = 0 "
+                "ORDER BY id LIMIT ?",
+                (self._batch_size,),
+            ).fetchall()
+        if not rows:
+            return 0
+
+        return self._upload_rows(rows)
+
+    def _upload_rows(self, rows: list[tuple[int, str, str]]) -> int:
+        """
+        Posts records as one batch. A batch the MES will never accept is split in half and each
+        half resent, so only the records it rejects on their own are marked rejected.
+        @param rows: outbox rows, as id, record key and payload
+        @return: number of records uploaded
+        """
+        ids = [(row_id,) for row_id, _, _ in rows]
+        keys = [record_key for _, record_key, _ in rows]
+        body = gzip.compress(
+            (
+                '{"records":[' + ",".join(payload for _, _, payload in rows) + "]}"
+            ).encode()
+        )
+
+        try:
+            self._post(body, hashlib.sha256("\n".join(keys).encode()).hexdigest())
+        except UploadError as e:
+            if not e.retry and len(rows) > 1:
+                middle = len(rows) // 2
+                return self._upload_rows(rows[:middle]) + self._upload_rows(
+                    rows[middle:]
+                )
+
+            with self._lock, self._db:
+                self._db.executemany(
+                    "UPDATE outbox SET attempts = attempts + 1"
+                    + ("" if e.retry else ", rejected = 1")
+                    + " WHERE id = ?",
+                    ids,
+                )
+            self._metrics.add_uploads("retried" if e.retry else "rejected", len(rows))
+            if not e.retry:
+                self._logger.error(f"Record {keys[0]} rejected: {e}")
+                return 0
+            raise
+
+        with self._lock, self._db:
+            self._db.executemany("DELETE FROM outbox WHERE id = ?", ids)
+        self._metrics.add_uploads("uploaded", len(rows))
+        return len(rows)
+
+    def _post(self, body: bytes, idempotency_key: str) -> None:
+        if self._connection is None:
+            connection_class = (
+                http.client.HTTPSConnection
+                if self._url.scheme == "https"
+                else http.client.HTTPConnection
+            )
+            self._connection = connection_class(self._url.netloc, timeout=self._timeout)
+
+        try:
+            self._connection.request(
+                "POST",
+                self._url.path or "/",
+                body,
+                {
+                    **self._headers,
+                    "Content-Type": "application/json",
+                    "Content-Encoding": "gzip",
+                    "Idempotency-Key": idempotency_key,
+                },
+            )
+            response = self._connection.getresponse()
+            response.read()
+        except (OSError, http.client.HTTPException) as e:
+            # The connection may be half closed, so start a fresh one next time
+            self._connection.close()
+            self._connection = None
+            raise UploadError(f"Upload failed: {e!r}", retry=True)
+
+        if response.status >= 300:
+            raise UploadError(
+                f"MES answered {response.status} {response.reason}",
+                retry=response.status in RETRY_STATUSES,
+            )
@@ -0,0 +1,235 @@
+# Station throughput benchmark against simulated devices
+import copy
+import threading
+import time
+import tracemalloc
+from dataclasses import dataclass, field
+from functools import partial
+
+from filmmaker_rf_ate.config import Config
+from filmmaker_rf_ate.results import ResultStore
+from filmmaker_rf_ate.simulation.devices import SimFaults, SimTiming, SimulatedStation
+from filmmaker_rf_ate.station.async_engine import AsyncStation
+from filmmaker_rf_ate.simulation.time_scale import (
+    WaitClock,
+    set_sleep_scale,
+    set_wait_clock,
+)
+from filmmaker_rf_ate.station.station import Station
+from filmmaker_rf_ate.utils.get_devices import get_devices
+from filmmaker_rf_ate.utils.instrumentation import StationMetrics
+
+
+@dataclass
+class BenchmarkReport:
+    batches: int
+    units: int
+    passed: int
+    wall_seconds: float
+    # Station time the run would have taken with real device timing
+    station_seconds: float
+    peak_memory: int
+    phase_seconds: dict[str, dict[str, float]] = field(default_factory=dict)
+    engine: str = "threaded"
+    # Process CPU time, mostly scheduling and bookkeeping since device time is simulated
+    cpu_seconds: float = 0.0
+    peak_threads: int = 0
+
+    @property
+    def units_per_hour(self) -> float:
+        return 3600 * self.units / self.station_seconds if self.station_seconds else 0.0
+
+    def format(self) -> str:
+        lines = [
+            f"{self.units} unit(s) in {self.batches} batch(es) on the {self.engine} "
+            f"engine, {self.passed} passed",
+            f"Wall time {self.wall_seconds:.2f}s, station time {self.station_seconds:.1f}s",
+            f"Throughput {self.units_per_hour:.1f} units/hour",
+            f"CPU time {self.cpu_seconds:.2f}s, "
+            f"{self.cpu_seconds / self.units if self.units else 0.0:.3f}s per unit",
+            f"Peak threads {self.peak_threads}",
+            f"Peak traced memory {self.peak_memory / 1024 / 1024:.2f} MiB",
+            "Mean time per test phase (station time):",
+        ]
+        for test, phases in self.phase_seconds.items():
+            breakdown = ", ".join(
+                f"{phase} {seconds:.2f}s" for phase, seconds in phases.items()
+            )
+            lines.append(f"  {test}: {breakdown}")
+        return "\n".join(lines)
+
+
+def run_benchmark(
+    config: Config,
+    batches: int = 1,
+    dut_count: int = 4,
+    timing: SimTiming = None,
+    faults: SimFaults = None,
+    results_db: str = None,
+    seed: int = 0,
+    engine: str = "threaded",
+    parallel: bool = False,
+) -> BenchmarkReport:
+    """
+    Runs batches through the station against simulated devices
+    @param config: station config. The metrics file and transcripts are disabled for the run.
+    @param batches: number of batches to run
+    @param dut_count: DUTs per batch. Batches of more than four skip get_devices.
+    @param timing: simulated device timing. Its time_scale also scales test sleeps.
+    @param faults: simulated device faults
+    @param results_db: optional result store to record to
+    @param seed: seed for simulated measurements and faults
+    @param engine: `threaded` for Station.run_batch, or `asyncio` for AsyncStation
+    @param parallel: test a batch's slots at once on the threaded engine. The asyncio engine
+    always does.
+    @return: benchmark report
+    """
+    timing = SimTiming() if timing is None else timing
+    faults = SimFaults() if faults is None else faults
+
+    config = copy.copy(config)
+    config.metrics_file = None
+    config.transcript_dir = None
+
+    metrics = StationMetrics()
+    simulation = SimulatedStation(dut_count, config.hid_index, timing, faults, seed)
+    station = Station(
+        config,
+        None if results_db is None else ResultStore(results_db),
+        metrics,
+        simulation.arduino_factory,
+        flasher=simulation.flasher,
+    )
+    if engine == "asyncio":
+        async_station = AsyncStation(station, max_workers=4)
+        run_batch = async_station.run_batch
+    elif engine == "threaded":
+        async_station = None
+        run_batch = partial(station.run_batch, parallel=parallel)
+    else:
+        raise ValueError(f"Unknown engine `{engine}`")
+
+    peak_threads = threading.active_count()
+    sampled = threading.Event()
+
+    def sample_threads():
+        nonlocal peak_threads
+        while not sampled.wait(0.005):
+            # Not counting this thread
+            peak_threads = max(peak_threads, threading.active_count() - 1)
+
+    sampler = threading.Thread(target=sample_threads, daemon=True)
+
+    clock = WaitClock()
+    set_sleep_scale(timing.time_scale)
+    set_wait_clock(clock)
+    tracemalloc.start()
+    units, passed = 0, 0
+    sampler.start()
+    start = time.perf_counter()
+    cpu_start = time.process_time()
+    try:
+        with simulation.install():
+            for _ in range(batches):
+                if dut_count > 4:
+                    ref, duts = simulation.devices()
+                else:
+                    ref, *found = get_devices(
+                        config.device_classes.dut,
+                        config.device_classes.ref,
+                        hid_index=config.hid_index,
+                    )
+                    duts = {
+                        dut.name_short: dut
+                        for dut in found
+                        if dut is not None and dut.name_short
+                    }
+                slot_results = run_batch(ref, duts)
+                units += len(slot_results)
+                passed += sum(slot_result.passed for slot_result in slot_results)
+    finally:
+        wall_seconds = time.perf_counter() - start
+        cpu_seconds = time.process_time() - cpu_start
+        sampled.set()
+        sampler.join()
+        _, peak_memory = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        set_sleep_scale(1.0)
+        set_wait_clock(None)
+        if async_station is not None:
+            async_station.close()
+        station.close()
+
+    scale = timing.time_scale or 1.0
+    phase_seconds: dict[str, dict[str, float]] = {}
+    for (test, phase), histogram in metrics.phase_duration.items():
+        if histogram.count:
+            phase_seconds.setdefault(test, {})[phase] = (
+                histogram.sum / histogram.count / scale
+            )
+
+    return BenchmarkReport(
+        batches,
+        units,
+        passed,
+        wall_seconds,
+        # Only the simulated waits are scaled, so only they are stretched back
+        clock.unscaled(wall_seconds, timing.time_scale),
+        peak_memory,
+        phase_seconds,
+        engine,
+        cpu_seconds,
+        peak_threads,
+    )
+
+
+if __name__ == "__main__":
+    import argparse
+    import logging
+
+    from filmmaker_rf_ate.config import CONFIG
+
+    parser = argparse.ArgumentParser(
+        description="Benchmark station throughput against simulated devices"
+    )
+    parser.add_argument("-b", "--batches", type=int, default=5)
+    parser.add_argument("-n", "--duts", type=int, default=4)
+    parser.add_argument(
+        "-s",
+        "--time-scale",
+        type=float,
+        default=0.01,
+        help="simulated time per second of station time",
+    )
+    parser.add_argument("--os-error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "-e",
+        "--engine",
+        choices=("threaded", "asyncio", "compare"),
+        default="threaded",
+        help="compare runs the batches on both engines",
+    )
+    parser.add_argument(
+        "-p", "--parallel", action="store_true", help="test slots at once when threaded"
+    )
+    parser.add_argument("--db", help="record results to this database")
+    parser.add_argument("-v", "--verbose", action="store_true")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING)
+
+    engines = ("threaded", "asyncio") if args.engine == "compare" else (args.engine,)
+    for engine in engines:
+        report = run_benchmark(
+            CONFIG,
+            args.batches,
+            args.duts,
+            SimTiming(time_scale=args.time_scale),
+            SimFaults(os_error_rate=args.os_error_rate),
+            args.db,
+            args.seed,
+            engine,
+            args.parallel,
+        )
+        print(report.format())
@@ -0,0 +1,486 @@
+# Discrete-event model of station throughput, for sizing fixtures and shared hardware
+import heapq
+import json
+import random
+import sqlite3
+from collections import deque
+from dataclasses import dataclass, field
+from os import PathLike
+from typing import Callable, Literal
+
+from filmmaker_rf_ate.config import Config
+from filmmaker_rf_ate.station.leases import ARDUINO, REFERENCE, TEST_RESOURCES
+from filmmaker_rf_ate.tests.test_order import DEFAULT_TEST_ORDER, plan_batch_order
+from filmmaker_rf_ate.tests.test_profiles import resolve_profile
+
+Strategy = Literal["serial", "parallel", "hot_swap"]
+STRATEGIES: tuple[Strategy, ...] = ("serial", "parallel", "hot_swap")
+OPERATOR = "operator"
+
+# Error code each test reports, used to find recorded failures
+TEST_ERROR_CODES = {
+    "firmware_version": "F",
+    "connection_stats": "C",
+    "rf_power": "R",
+    "battery": "B",
+}
+
+
+@dataclass
+class TestModel:
+    name: str
+    mean_duration: float
+    failure_rate: float = 0.0
+    resources: tuple[str, ...] = ()
+    # Relative spread of the default duration distribution
+    spread: float = 0.05
+    # Recorded durations to sample from instead, if any
+    durations: list[float] = field(default_factory=list)
+
+    def sample_duration(self, rng: random.Random) -> float:
+        if self.durations:
+            return rng.choice(self.durations)
+        return max(0.0, rng.gauss(self.mean_duration, self.mean_duration * self.spread))
+
+
+@dataclass
+class StationModel:
+    tests: list[TestModel]
+    slots: int = 4
+    references: int = 1
+    arduinos: int = 1
+    operators: int = 1
+    stop_on_fail: bool = True
+    # Seconds for an operator to take a tested unit out of a slot, and to put a new one in
+    unload_time: float = 10.0
+    load_time: float = 15.0
+
+
+@dataclass
+class CapacityReport:
+    strategy: Strategy
+    slots: int
+    references: int
+    arduinos: int
+    hours: float
+    units: int
+    passed: int
+    mean_cycle_time: float
+    # Busy fraction of each resource, slots included
+    utilisation: dict[str, float]
+
+    @property
+    def units_per_hour(self) -> float:
+        return self.units / self.hours if self.hours else 0.0
+
+    def format(self) -> str:
+        utilisation = ", ".join(
+            f"{resource} {fraction:.0%}"
+            for resource, fraction in self.utilisation.items()
+        )
+        return (
+            f"{self.strategy:<9} {self.slots} slot(s), {self.references} ref(s), "
+            f"{self.arduinos} arduino(s): {self.units_per_hour:6.1f} units/hour, "
+            f"cycle {self.mean_cycle_time:.0f}s, {utilisation}"
+        )
+
+
+def load_history(path: PathLike | str, limit: int = 10_000) -> dict[str, tuple]:
+    """
+    Reads recorded test durations and failure rates from a result store
+    @param path: result store database
+    @param limit: most recent units to read
+    @return: recorded durations and failure rate, keyed by test name
+    """
+    connection = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        rows = connection.execute(
+            "SELECT timings, error_code FROM units ORDER BY finished_at DESC LIMIT ?",
+            (limit,),
+        ).fetchall()
+    finally:
+        connection.close()
+
+    durations: dict[str, list[float]] = {}
+    failures: dict[str, int] = {}
+    for timings, error_code in rows:
+        for test, timing in json.loads(timings or "{}").items():
+            durations.setdefault(test, []).append(sum(timing["phases"].values()))
+            code = TEST_ERROR_CODES.get(test)
+            if code is not None and code in (error_code or ""):
+                failures[test] = failures.get(test, 0) + 1
+
+    return {
+        test: (test_durations, failures.get(test, 0) / len(test_durations))
+        for test, test_durations in durations.items()
+    }
+
+
+def model_from_config(
+    config: Config,
+    profile: str = None,
+    history: dict[str, tuple] = None,
+    **station,
+) -> StationModel:
+    """
+    Builds a station model running the configured test plan
+    @param config: station config
+    @param profile: test profile to run, defaults to the policy's default profile
+    @param history: recorded durations and failure rates from `load_history`. Tests without
+    history use the configured test history, with connection stats and RF power scaled to the
+    profile.
+    @param station: StationModel fields to override, e.g. slots or references
+    @return: station model
+    """
+    history = {} if history is None else history
+    test_config = config.tests
+    profile_config = resolve_profile(
+        test_config,
+        test_config.profile_policy.default_profile if profile is None else profile,
+    )
+    names = (
+        plan_batch_order(test_config.order, config.stop_on_fail) or DEFAULT_TEST_ORDER
+    )
+
+    base = test_config.connection_stats
+    rf_power = test_config.rf_power
+    scale = {
+        # Measurement time plus the fixed overhead of the configured history
+        "connection_stats": lambda duration: duration
+        - base.duration_short
+        - base.duration_long
+        + profile_config.duration_short
+        + profile_config.duration_long,
+        "rf_power": lambda duration: duration
+        * len(profile_config.channels)
+        * len(profile_config.antennae)
+        / (len(rf_power.channels) * len(rf_power.antennae)),
+    }
+
+    tests = []
+    for name in names:
+        recorded, recorded_failure_rate = history.get(name, ([], None))
+        configured = test_config.order.history.get(name)
+        mean_duration = 0.0 if configured is None else configured.duration
+        mean_duration = scale.get(name, lambda duration: duration)(mean_duration)
+        failure_rate = (
+            recorded_failure_rate
+            if recorded_failure_rate is not None
+            else (0.0 if configured is None else configured.failure_rate)
+        )
+        tests.append(
+            TestModel(
+                name,
+                sum(recorded) / len(recorded) if recorded else mean_duration,
+                failure_rate,
+                TEST_RESOURCES.get(name, ()),
+                durations=list(recorded),
+            )
+        )
+
+    return StationModel(tests, stop_on_fail=config.stop_on_fail, **station)
+
+
+class _Resource:
+    """
+    A pool of identical units of hardware, handed out first come first served
+    """
+
+    __slots__ = ("capacity", "in_use", "waiting", "busy", "changed_at")
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.in_use = 0
+        self.waiting: deque[Callable[[], None]] = deque()
+        self.busy = 0.0
+        self.changed_at = 0.0
+
+
+class _Simulation:
+    def __init__(self, model: StationModel, shift: float, seed: int):
+        self.model = model
+        self.shift = shift
+        self.now = 0.0
+        self.rng = random.Random(seed)
+        self.units = 0
+        self.passed = 0
+        self.cycle_time = 0.0
+        self._events: list[tuple[float, int, Callable[[], None]]] = []
+        self._sequence = 0
+        self.resources = {
+            REFERENCE: _Resource(model.references),
+            ARDUINO: _Resource(model.arduinos),
+            OPERATOR: _Resource(model.operators),
+            "slot": _Resource(model.slots),
+        }
+
+    def schedule(self, delay: float, callback: Callable[[], None]) -> None:
+        self._sequence += 1
+        heapq.heappush(self._events, (self.now + delay, self._sequence, callback))
+
+    def run(self) -> None:
+        while self._events:
+            time, _, callback = heapq.heappop(self._events)
+            if time > self.shift:
+                break
+            self.now = time
+            callback()
+
+    def _account(self, resource: _Resource) -> None:
+        resource.busy += resource.in_use * (self.now - resource.changed_at)
+        resource.changed_at = self.now
+
+    def acquire(self, name: str, then: Callable[[], None]) -> None:
+        resource = self.resources[name]
+        if resource.in_use < resource.capacity:
+            self._account(resource)
+            resource.in_use += 1
+            then()
+        else:
+            resource.waiting.append(then)
+
+    def release(self, name: str) -> None:
+        resource = self.resources[name]
+        if resource.waiting:
+            # Handed straight to the next in line, so in_use is unchanged
+            resource.waiting.popleft()()
+        else:
+            self._account(resource)
+            resource.in_use -= 1
+
+    def acquire_all(
+        self, names: tuple[str, ...], then: Callable[[], None], index: int = 0
+    ) -> None:
+        """
+        Acquires resources one at a time in sorted order, as the station's leases do
+        """
+        names = tuple(sorted(names))
+        if index == len(names):
+            then()
+            return
+        self.acquire(names[index], lambda: self.acquire_all(names, then, index + 1))
+
+    def operate(self, duration: float, then: Callable[[], None]) -> None:
+        def done():
+            self.release(OPERATOR)
+            then()
+
+        self.acquire(OPERATOR, lambda: self.schedule(duration, done))
+
+    def test_unit(self, then: Callable[[], None]) -> None:
+        """
+        Runs the test plan on one unit, then calls `then`
+        """
+        start = self.now
+        self._account(self.resources["slot"])
+        self.resources["slot"].in_use += 1
+        tests = self.model.tests
+        passed = [True]
+
+        def finish():
+            self._account(self.resources["slot"])
+            self.resources["slot"].in_use -= 1
+            self.units += 1
+            self.passed += passed[0]
+            self.cycle_time += self.now - start
+            then()
+
+        def run_test(index: int):
+            if index == len(tests) or (self.model.stop_on_fail and not passed[0]):
+                finish()
+                return
+
+            test = tests[index]
+
+            def done():
+                for resource in test.resources:
+                    self.release(resource)
+                if self.rng.random() < test.failure_rate:
+                    passed[0] = False
+                run_test(index + 1)
+
+            self.acquire_all(
+                test.resources,
+                lambda: self.schedule(test.sample_duration(self.rng), done),
+            )
+
+        run_test(0)
+
+    def utilisation(self) -> dict[str, float]:
+        utilisation = {}
+        for name, resource in self.resources.items():
+            self._account(resource)
+            capacity = resource.capacity * self.now
+            utilisation[name] = resource.busy / capacity if capacity else 0.0
+        return utilisation
+
+
+def _run_batches(simulation: _Simulation, parallel: bool) -> None:
+    slots = simulation.model.slots
+    model = simulation.model
+
+    def start_batch():
+        if parallel:
+            remaining = [slots]
+
+            def slot_done():
+                remaining[0] -= 1
+                if remaining[0] == 0:
+                    swap_all()
+
+            for _ in range(slots):
+                simulation.test_unit(slot_done)
+        else:
+
+            def run_slot(index: int):
+                if index == slots:
+                    swap_all()
+                else:
+                    simulation.test_unit(lambda: run_slot(index + 1))
+
+            run_slot(0)
+
+    def swap_all(first: bool = False):
+        remaining = [slots]
+
+        def swapped():
+            remaining[0] -= 1
+            if remaining[0] == 0:
+                start_batch()
+
+        duration = model.load_time + (0.0 if first else model.unload_time)
+        for _ in range(slots):
+            simulation.operate(duration, swapped)
+
+    swap_all(first=True)
+
+
+def _run_hot_swap(simulation: _Simulation) -> None:
+    model = simulation.model
+
+    def cycle(first: bool = False):
+        duration = model.load_time + (0.0 if first else model.unload_time)
+        simulation.operate(duration, lambda: simulation.test_unit(cycle))
+
+    for _ in range(model.slots):
+        cycle(first=True)
+
+
+def simulate(
+    model: StationModel,
+    strategy: Strategy = "parallel",
+    shift_hours: float = 8.0,
+    seed: int = 0,
+) -> CapacityReport:
+    """
+    Simulates a shift of the station
+    @param model: station to simulate
+    @param strategy: `serial` tests a loaded batch one slot at a time, `parallel` tests a loaded
+    batch all at once, `hot_swap` reloads and restarts each slot as soon as it finishes
+    @param shift_hours: length of the shift
+    @param seed: seed for durations and failures
+    @return: throughput and utilisation over the shift
+    """
+    simulation = _Simulation(model, shift_hours * 3600, seed)
+    if strategy == "hot_swap":
+        _run_hot_swap(simulation)
+    elif strategy in ("serial", "parallel"):
+        _run_batches(simulation, strategy == "parallel")
+    else:
+        raise ValueError(f"Unknown strategy `{strategy}`, expected one of {STRATEGIES}")
+
+    simulation.run()
+    simulation.now = simulation.shift
+
+    return CapacityReport(
+        strategy,
+        model.slots,
+        model.references,
+        model.arduinos,
+        shift_hours,
+        simulation.units,
+        simulation.passed,
+        simulation.cycle_time / simulation.units if simulation.units else 0.0,
+        simulation.utilisation(),
+    )
+
+
+def sweep(
+    config: Config,
+    slots: list[int],
+    references: list[int] = (1,),
+    arduinos: list[int] = (1,),
+    strategies: list[Strategy] = STRATEGIES,
+    shift_hours: float = 8.0,
+    history: dict[str, tuple] = None,
+    seed: int = 0,
+    **station,
+) -> list[CapacityReport]:
+    """
+    Simulates every combination of slot count, shared hardware and strategy
+    @return: one report per combination, best throughput first
+    """
+    reports = []
+    for slot_count in slots:
+        for reference_count in references:
+            for arduino_count in arduinos:
+                model = model_from_config(
+                    config,
+                    history=history,
+                    slots=slot_count,
+                    references=reference_count,
+                    arduinos=arduino_count,
+                    **station,
+                )
+                for strategy in strategies:
+                    reports.append(simulate(model, strategy, shift_hours, seed))
+
+    return sorted(reports, key=lambda report: report.units_per_hour, reverse=True)
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    from filmmaker_rf_ate.config import CONFIG
+
+    parser = argparse.ArgumentParser(
+        description="Predict station throughput for different fixtures and strategies"
+    )
+    parser.add_argument("--slots", type=int, nargs="+", default=[4])
+    parser.add_argument("--references", type=int, nargs="+", default=[1])
+    parser.add_argument("--arduinos", type=int, nargs="+", default=[1])
+    parser.add_argument(
+        "--strategies", nargs="+", choices=STRATEGIES, default=list(STRATEGIES)
+    )
+    parser.add_argument(
+        "--shift", type=float, default=8.0, help="shift length in hours"
+    )
+    parser.add_argument("--load-time", type=float, default=15.0)
+    parser.add_argument("--unload-time", type=float, default=10.0)
+    parser.add_argument("--operators", type=int, default=1)
+    parser.add_argument(
+        "--history", help="result store to take test durations and failure rates from"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    reports = sweep(
+        CONFIG,
+        args.slots,
+        args.references,
+        args.arduinos,
+        args.strategies,
+        args.shift,
+        None if args.history is None else load_history(args.history),
+        args.seed,
+        load_time=args.load_time,
+        unload_time=args.unload_time,
+        operators=args.operators,
+    )
+    for report in reports:
+        print(report.format())
+    print(
+        f"{len(reports)} configuration(s) simulated in {time.perf_counter() - start:.3f}s"
+    )
@@ -0,0 +1,452 @@
+# Stand-in devices for running tests without hardware
+import random
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+
+from functional_test_core.models import DeviceInfo
+from rode.devices.common.commands.basic_commands import CommonCommands
+from rode.devices.utils.versions import Version
+from rode.devices.wireless.commands.app_commands import (
+    AppCommands,
+    GetFuelGaugeCommand,
+)
+from rode.devices.wireless.commands.nvm_commands import NVMReadCommand
+from rode.devices.wireless.commands.radio_channels import RadioChannel
+from rode.devices.wireless.commands.radio_commands import (
+    RadioAntennaIndex,
+    RadioCommands,
+)
+
+from filmmaker_rf_ate.simulation.time_scale import scaled_wait
+
+
+def make_device_info(rode_device, name_short: str) -> DeviceInfo:
+    device = DeviceInfo(rode_device)
+    device.name_short = name_short
+    return device
+
+
+@dataclass
+class SimTiming:
+    command_latency: float = 0.005
+    power_on_delay: float = 0.5
+    reboot_delay: float = 3.0
+    flash_bytes_per_second: float = 64 * 1024
+    # Scales every simulated delay, including connection stats durations
+    time_scale: float = 1.0
+
+
+@dataclass
+class SimFaults:
+    os_error_rate: float = 0.0
+    hang_rate: float = 0.0
+    hang_duration: float = 3600.0
+    avg_rssi: float = -70.0
+    rssi_spread: float = 5.0
+    errors_per_second: float = 0.5
+    power_high: float = 4.0
+    power_low: float = -16.0
+    power_spread: float = 0.5
+    battery_soc: int = 80
+    charge_per_second: float = 0.01
+
+
+@dataclass
+class SimVersion:
+    version: Version
+
+    def __str__(self):
+        return str(self.version)
+
+
+@dataclass
+class SimChannelStats:
+    avg_rssi: float
+    audio_missed_errors: int
+    audio_crc_errors: int
+    beacon_errors: int
+
+
+@dataclass
+class SimConnectionStats:
+    ch1_stats: SimChannelStats
+    ch2_stats: SimChannelStats
+
+
+@dataclass
+class SimFuelGauge:
+    battery_soc: int
+    battery_voltage: float
+    battery_temp: float
+
+
+class SimulatedRfBench:
+    """
+    The RF power detector shared by every DUT in a fixture. Reports the output of whichever DUT
+    is in continuous wave mode.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._power: float | None = None
+
+    def set_power(self, power: float | None):
+        with self._lock:
+            self._power = power
+
+    def voltage(self) -> float:
+        with self._lock:
+            power = -40.0 if self._power is None else self._power
+        return (20 - power) / 40
+
+
+class SimulatedArduinoSerial:
+    """
+    Answers the RF ATE Arduino's serial protocol from a simulated RF bench
+    """
+
+    def __init__(self, bench: SimulatedRfBench, eol: bytes = b"\r\n", **kwargs):
+        self._bench = bench
+        self._eol = eol
+        self._responses: list[bytes] = []
+
+    def write(self, data: bytes) -> int:
+        message = data.decode("utf-8").strip()
+        if message.startswith("A"):
+            self._responses.append(f"{self._bench.voltage():.4f}".encode() + self._eol)
+        elif message.startswith("M"):
+            self._responses.append(b"OK" + self._eol)
+        return len(data)
+
+    def read_until(self, expected: bytes = b"\n", size: int = None) -> bytes:
+        return self._responses.pop(0) if self._responses else b""
+
+    def readlines(self) -> list[bytes]:
+        lines, self._responses = self._responses, []
+        return lines
+
+    def close(self):
+        pass
+
+
+class SimulatedWirelessDevice:
+    """
+    In-process Filmmaker 2 / Wireless GO 2 implementing the commands used by the RF ATE tests.
+    Command arguments are read from the attributes the rode command classes store them in.
+    """
+
+    def __init__(
+        self,
+        rfid: bytes,
+        bench: SimulatedRfBench = None,
+        timing: SimTiming = None,
+        faults: SimFaults = None,
+        app_version: str = "1.0.0",
+        radio_version: str = "1.0.0",
+        nvm: dict[int, bytes] = None,
+        seed: int = None,
+        serial_number: str = None,
+    ):
+        self.serial_number = serial_number
+        self.app_version = Version(app_version)
+        self.radio_version = Version(radio_version)
+        self._bench = SimulatedRfBench() if bench is None else bench
+        self._timing = SimTiming() if timing is None else timing
+        self._faults = SimFaults() if faults is None else faults
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._rfids = {0: rfid, 1: bytes(4), 2: bytes(4)}
+        self._nvm = {0x8: b"\x00\x04\x01\x00", 0xC: b"\x00\x00\x04\x01"}
+        self._nvm.update(nvm or {})
+        self._on_since: float | None = None
+        self._booting_until = 0.0
+        self._battery_soc = float(self._faults.battery_soc)
+        self._battery_at = time.monotonic()
+        # Flashed firmware, running from the next reset
+        self._pending_versions: dict[str, Version] = {}
+        self._handlers = None
+
+    def close(self):
+        # Every handle to a simulated device is the device itself, so there is nothing to free
+        pass
+
+    def _sleep(self, seconds: float):
+        if seconds > 0 and self._timing.time_scale > 0:
+            with scaled_wait():
+                time.sleep(seconds * self._timing.time_scale)
+
+    def _build_handlers(self) -> dict:
+        return {
+            type(AppCommands.set_system_state(True)): self._set_system_state,
+            type(AppCommands.system_is_on()): self._system_is_on,
+            type(CommonCommands.app_version()): lambda _: SimVersion(self.app_version),
+            type(AppCommands.radio_version()): lambda _: SimVersion(self.radio_version),
+            type(CommonCommands.reset()): self._reset,
+            type(RadioCommands.radio_get_rfid(0)): self._get_rfid,
+            type(RadioCommands.radio_set_rfid(0, bytes(4))): self._set_rfid,
+            type(
+                RadioCommands.radio_get_advanced_connection_stats(0, 1)
+            ): self._connection_stats,
+            type(
+                RadioCommands.radio_start_continuous_wave_test_mode_fixedfreq(
+                    RadioChannel.CHANNEL_0, RadioAntennaIndex.ANTENNA_1, 0x04
+                )
+            ): self._continuous_wave,
+            type(
+                RadioCommands.radio_start_continuous_receive_test_mode(
+                    RadioChannel.CHANNEL_0, RadioAntennaIndex.ANTENNA_1
+                )
+            ): self._continuous_receive,
+            GetFuelGaugeCommand: self._fuel_gauge,
+            NVMReadCommand: self._nvm_read,
+        }
+
+    def handle_command(self, command):
+        if self._handlers is None:
+            self._handlers = self._build_handlers()
+
+        self._sleep(self._timing.command_latency)
+
+        if self._random.random() < self._faults.hang_rate:
+            self._sleep(self._faults.hang_duration)
+
+        if time.monotonic() < self._booting_until:
+            raise OSError("Device is rebooting")
+
+        if self._random.random() < self._faults.os_error_rate:
+            raise OSError("Simulated HID error")
+
+        try:
+            handler = self._handlers[type(command)]
+        except KeyError:
+            raise NotImplementedError(
+                f"Simulated device does not implement `{type(command).__name__}`"
+            )
+
+        with self._lock:
+            return handler(command)
+
+    def flash(
+        self,
+        target: str,
+        data: bytes,
+        version: Version,
+        chunk_size: int = 4096,
+        progress=None,
+    ) -> None:
+        """
+        Receives a firmware image in chunks. The new version runs after the next reset.
+        """
+        if time.monotonic() < self._booting_until:
+            raise OSError("Device is rebooting")
+
+        for offset in range(0, len(data), chunk_size):
+            chunk = data[offset : offset + chunk_size]
+            self._sleep(
+                self._timing.command_latency
+                + len(chunk) / self._timing.flash_bytes_per_second
+            )
+            if self._random.random() < self._faults.os_error_rate:
+                raise OSError("Simulated HID error")
+            if progress is not None:
+                progress(offset + len(chunk))
+
+        with self._lock:
+            self._pending_versions[target] = Version(str(version))
+
+    def _is_on(self) -> bool:
+        return (
+            self._on_since is not None
+            and time.monotonic() - self._on_since
+            >= self._timing.power_on_delay * self._timing.time_scale
+        )
+
+    def _set_system_state(self, command):
+        if getattr(command, "state", True):
+            if self._on_since is None:
+                self._on_since = time.monotonic()
+        else:
+            self._on_since = None
+
+    def _system_is_on(self, command) -> bool:
+        return self._is_on()
+
+    def _reset(self, command):
+        self.app_version = self._pending_versions.pop("mcu", self.app_version)
+        self.radio_version = self._pending_versions.pop("nordic", self.radio_version)
+        self._on_since = None
+        self._rfids[1] = bytes(4)
+        self._bench.set_power(None)
+        self._booting_until = (
+            time.monotonic() + self._timing.reboot_delay * self._timing.time_scale
+        )
+
+    def _get_rfid(self, command) -> bytes:
+        return self._rfids.get(command.index, bytes(4))
+
+    def _set_rfid(self, command):
+        self._rfids[command.index] = bytes(command.rfid).ljust(4, b"\x00")
+
+    def _connection_stats(self, command) -> SimConnectionStats:
+        duration = command.duration
+        self._lock.release()
+        try:
+            self._sleep(duration)
+        finally:
+            self._lock.acquire()
+
+        def channel_stats() -> SimChannelStats:
+            errors = self._random.expovariate(1) * self._faults.errors_per_second
+            return SimChannelStats(
+                round(
+                    self._random.gauss(self._faults.avg_rssi, self._faults.rssi_spread)
+                ),
+                int(errors * duration * 0.5),
+                int(errors * duration * 0.3),
+                int(errors * duration * 0.2),
+            )
+
+        return SimConnectionStats(channel_stats(), channel_stats())
+
+    def _continuous_wave(self, command):
+        power = (
+            self._faults.power_high
+            if getattr(command, "power", 0x04) == 0x04
+            else self._faults.power_low
+        )
+        self._bench.set_power(self._random.gauss(power, self._faults.power_spread))
+
+    def _continuous_receive(self, command):
+        self._bench.set_power(None)
+
+    def _fuel_gauge(self, command) -> SimFuelGauge:
+        now = time.monotonic()
+        elapsed = (now - self._battery_at) / (self._timing.time_scale or 1)
+        self._battery_at = now
+        self._battery_soc = min(
+            100.0, self._battery_soc + elapsed * self._faults.charge_per_second
+        )
+        return SimFuelGauge(int(self._battery_soc), 3.7 + self._battery_soc / 200, 25.0)
+
+    def _nvm_read(self, command) -> bytes:
+        return self._nvm.get(command.address, bytes(command.length))
+
+
+@dataclass
+class SimulatedStation:
+    """
+    A fixture of simulated DUTs and a reference, sharing one simulated RF bench
+    """
+
+    dut_count: int = 4
+    hid_index: int = 8
+    timing: SimTiming = field(default_factory=SimTiming)
+    faults: SimFaults = field(default_factory=SimFaults)
+    seed: int = 0
+    app_version: str = "1.0.0"
+    radio_version: str = "1.0.0"
+
+    def __post_init__(self):
+        self.bench = SimulatedRfBench()
+        self.reference = SimulatedWirelessDevice(
+            b"\x80\x00\x00\x00",
+            self.bench,
+            self.timing,
+            SimFaults(),
+            seed=self.seed,
+            serial_number="REF0000",
+        )
+        self._units = 0
+        self.duts: list[SimulatedWirelessDevice | None] = [None] * self.dut_count
+        for slot in range(self.dut_count):
+            self.insert(slot)
+
+    def insert(self, slot: int) -> SimulatedWirelessDevice:
+        """
+        Puts a new unit in a slot, replacing any unit already there
+        @param slot: zero based slot index
+        @return: the new unit
+        """
+        self._units += 1
+        dut = SimulatedWirelessDevice(
+            self._units.to_bytes(4, "big"),
+            self.bench,
+            self.timing,
+            self.faults,
+            self.app_version,
+            self.radio_version,
+            seed=self.seed + self._units,
+            serial_number=f"SIM{self._units:04d}",
+        )
+        self.duts[slot] = dut
+        return dut
+
+    def remove(self, slot: int) -> None:
+        self.duts[slot] = None
+
+    def _hid_path(self, port: int) -> bytes:
+        path = bytearray(b"0" * (self.hid_index + 4))
+        path[self.hid_index] = ord(str(port))
+        return bytes(path)
+
+    def get_devices_by_hid(self, device_classes: list[type], session=None) -> dict:
+        """
+        Stands in for functional_test_core's get_devices_by_hid. The first class is the DUT class,
+        the second the reference class. DUT1 sits on hub port 4, DUT4 on port 1.
+        """
+        dut_class, ref_class = device_classes
+        return {
+            dut_class: {
+                self._hid_path(4 - slot): make_device_info(dut, f"dut{slot + 1}")
+                for slot, dut in enumerate(self.duts)
+                if dut is not None
+            },
+            ref_class: {
+                self._hid_path(0): make_device_info(self.reference, "reference")
+            },
+        }
+
+    def devices(self) -> tuple[DeviceInfo, dict[str, DeviceInfo]]:
+        """
+        The fixture's devices without going through get_devices, which only indexes the four
+        hub ports
+        @return: reference, and DUTs keyed by slot name
+        """
+        return make_device_info(self.reference, "reference"), {
+            f"dut{slot + 1}": make_device_info(dut, f"dut{slot + 1}")
+            for slot, dut in enumerate(self.duts)
+            if dut is not None
+        }
+
+    def serial_factory(self, **kwargs) -> SimulatedArduinoSerial:
+        return SimulatedArduinoSerial(self.bench)
+
+    def arduino_factory(self, port: str):
+        from filmmaker_rf_ate.arduino.arduino import RFATEArduino
+
+        return RFATEArduino(port, serial_factory=self.serial_factory)
+
+    def flasher(self, dut: DeviceInfo, image, chunk_size: int, progress) -> None:
+        """
+        Stands in for the station's firmware flasher
+        """
+        dut.rode_device.flash(
+            image.target, image.data, image.version, chunk_size, progress
+        )
+
+    @contextmanager
+    def install(self):
+        """
+        Routes get_devices to this station for the duration of the context
+        """
+        from filmmaker_rf_ate.utils import get_devices as get_devices_module
+
+        original = (get_devices_module.get_devices_by_hid, get_devices_module._system)
+        get_devices_module.get_devices_by_hid = self.get_devices_by_hid
+        get_devices_module._system = lambda: "Linux"
+        try:
+            yield self
+        finally:
+            get_devices_module.get_devices_by_hid, get_devices_module._system = original
@@ -0,0 +1,102 @@
+# Local stand-in for the MES result endpoint
+import gzip
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class MesStandIn:
+    """
+    Accepts batches of DUT records the way the MES does, keeping one copy of each record key.
+    Can be taken down, slowed or made to fail to exercise the upload queue.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        self.records: dict[str, dict] = {}
+        self.requests = 0
+        self.duplicates = 0
+        self.connections = 0
+        # Answer with this status instead of storing the batch, while set
+        self.fail_status: int | None = None
+        self.latency = 0.0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread: threading.Thread | None = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/records"
+
+    def start(self) -> "MesStandIn":
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, name="mes_stand_in", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def _handler_class(self):
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                super().setup()
+                with stand_in._lock:
+                    stand_in.connections += 1
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                if stand_in.latency:
+                    time.sleep(stand_in.latency)
+
+                status = stand_in.fail_status
+                if status is None:
+                    if self.headers.get("Content-Encoding") == "gzip":
+                        body = gzip.decompress(body)
+                    with stand_in._lock:
+                        stand_in.requests += 1
+                        for record in json.loads(body)["records"]:
+                            if record["record_key"] in stand_in.records:
+                                stand_in.duplicates += 1
+                            stand_in.records[record["record_key"]] = record
+                    status = 200
+
+                self.send_response(status)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run a local MES stand-in")
+    parser.add_argument("--port", type=int, default=8080)
+    args = parser.parse_args()
+
+    with MesStandIn(port=args.port) as mes:
+        print(f"Accepting records at {mes.url}")
+        try:
+            while True:
+                time.sleep(5)
+                print(f"{len(mes.records)} record(s) from {mes.requests} request(s)")
+        except KeyboardInterrupt:
+            pass
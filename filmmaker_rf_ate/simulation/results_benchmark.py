@@ -0,0 +1,241 @@
+# Memory and serialisation cost of a session's records, as DutRecords and as CompactRecords
+import gc
+import pickle
+import random
+import time
+import tracemalloc
+from dataclasses import dataclass
+
+from functional_test_core.models import TestInfo
+
+from filmmaker_rf_ate.results.compact import SessionResults
+from filmmaker_rf_ate.results.records import DutRecord, dumps
+from filmmaker_rf_ate.utils.identity import DutIdentity
+
+CHANNELS = ("CHANNEL_0", "CHANNEL_20", "CHANNEL_40", "CHANNEL_60", "CHANNEL_80")
+ANTENNAE = ("ANTENNA_1", "ANTENNA_2")
+
+
+def _passed(name: str, error_code: str, info: dict = None) -> TestInfo:
+    result = TestInfo(name, True, info=info)
+    result.error_code = error_code
+    return result
+
+
+def synthetic_record(rng: random.Random, windows: int = 1) -> DutRecord:
+    """
+    @return: a record shaped like a full profile run, with made up measurements
+    """
+    results = [
+        _passed(
+            "firmware_version",
+            "F",
+            info={"mcu": "1.2.3", "nordic": "0.4.1", "limits": {"mcu": "0.1.2"}},
+        ),
+        TestInfo("dut_paired", True, info={"found_rfid": rng.randbytes(4)}),
+        TestInfo("ref_paired", True, info={"found_rfid": rng.randbytes(4)}),
+        _passed("connection_stats_short_measured", "C"),
+    ]
+
+    rssi = [rng.randint(-80, -60) for _ in range(windows)]
+    info = {"measured_average": sum(rssi) / windows, "limits": {"min": -95}}
+    if windows > 1:
+        info["windows"] = {str(i): value for i, value in enumerate(rssi)}
+    results.append(_passed("min_rssi", "C", info=info))
+    results.append(_passed("connection_stats_long_measured", "C"))
+    for channel in ("ch1", "ch2"):
+        errors = [rng.randint(0, 40) for _ in range(windows)]
+        info = {"total": sum(errors), "allowed": 1000}
+        if windows > 1:
+            info["windows"] = {str(i): value for i, value in enumerate(errors)}
+        results.append(_passed(f"{channel}_total_errors", "C", info=info))
+
+    for antenna in ANTENNAE:
+        channels = {}
+        for channel in CHANNELS:
+            high = rng.gauss(4.0, 0.5)
+            low = rng.gauss(-16.0, 0.5)
+            channels[channel] = {
+                "power_high": high,
+                "power_low": low,
+                "pow_delta": abs(high - low),
+            }
+        results.append(
+            _passed(
+                f"{antenna}_avg_power",
+                "R",
+                info={
+                    "channels": channels,
+                    "limits": {"delta_power": {"min": 5.0}},
+                    "mean_delta_power": sum(
+                        channel["pow_delta"] for channel in channels.values()
+                    )
+                    / len(channels),
+                },
+            )
+        )
+
+    results.append(
+        _passed(
+            "battery_stats",
+            "B",
+            info={
+                "initial_percentage": 80,
+                "seconds_since_measurement": rng.uniform(300, 900),
+                "percentage": 81,
+                "voltage": rng.randint(3900, 4100),
+                "temperature": rng.randint(20, 30),
+            },
+        )
+    )
+
+    started_at = time.time()
+    return DutRecord(
+        "dut1",
+        DutIdentity(f"SIM{rng.randrange(10**6):06d}", rng.randbytes(4).hex()),
+        results,
+        started_at,
+        started_at + 650.0,
+        params={
+            "connection_stats": {
+                "duration_short": 120,
+                "duration_long": 500,
+                "min_rssi": -95,
+                "allowed_errors": 1000,
+                "windows": windows,
+                "profile": "full",
+            },
+            "rf_power": {"channels": list(CHANNELS), "profile": "full"},
+        },
+        timings={
+            "rf_power": {
+                "phases": {"test_routine": rng.uniform(30, 40)},
+                "commands": {"RadioGetRfId": {"count": 2, "seconds": 0.01}},
+                "sleep": 3.0,
+                "retries": {},
+            }
+        },
+        profile="full",
+    )
+
+
+@dataclass
+class ResultsBenchmarkReport:
+    units: int
+    record_bytes: int
+    compact_bytes: int
+    record_json_seconds: float
+    compact_json_seconds: float
+    record_pickle_bytes: int
+    compact_pickle_bytes: int
+    record_pickle_seconds: float
+    compact_pickle_seconds: float
+    compact_seconds: float
+
+    def format(self) -> str:
+        per_unit = 1 / self.units if self.units else 0.0
+        return "\n".join(
+            [
+                f"{self.units} unit(s)",
+                f"{'':<24} {'DutRecord':>14} {'CompactRecord':>14}",
+                f"{'Memory per unit':<24} {self.record_bytes * per_unit:>13.0f}B "
+                f"{self.compact_bytes * per_unit:>13.0f}B",
+                f"{'JSON per unit':<24} {self.record_json_seconds * per_unit * 1e6:>12.1f}us "
+                f"{self.compact_json_seconds * per_unit * 1e6:>12.1f}us",
+                f"{'Pickle per unit':<24} {self.record_pickle_bytes * per_unit:>13.0f}B "
+                f"{self.compact_pickle_bytes * per_unit:>13.0f}B",
+                f"{'Pickle time per unit':<24} {self.record_pickle_seconds * per_unit * 1e6:>12.1f}us "
+                f"{self.compact_pickle_seconds * per_unit * 1e6:>12.1f}us",
+                f"Compacting {self.compact_seconds * per_unit * 1e6:.1f}us per unit",
+            ]
+        )
+
+
+def _traced(build) -> tuple[object, int]:
+    """
+    @return: what `build` returned, and the memory it still holds
+    """
+    gc.collect()
+    tracemalloc.start()
+    try:
+        value = build()
+        gc.collect()
+        size, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return value, size
+
+
+def _timed(function) -> tuple[object, float]:
+    start = time.perf_counter()
+    value = function()
+    return value, time.perf_counter() - start
+
+
+def run_results_benchmark(
+    units: int = 10_000, windows: int = 1, seed: int = 0
+) -> ResultsBenchmarkReport:
+    """
+    @param units: records in the session
+    @param windows: connection stats windows per measurement
+    """
+    rng = random.Random(seed)
+    records, record_bytes = _traced(
+        lambda: [synthetic_record(rng, windows) for _ in range(units)]
+    )
+
+    def compact() -> SessionResults:
+        session = SessionResults()
+        for record in records:
+            session.append(record)
+        return session
+
+    def compact_fresh() -> SessionResults:
+        # Records built and dropped one by one, as a session would, so none of their memory
+        # is shared with `records`
+        fresh_rng = random.Random(seed)
+        session = SessionResults()
+        for _ in range(units):
+            session.append(synthetic_record(fresh_rng, windows))
+        return session
+
+    session, compact_seconds = _timed(compact)
+    _, compact_bytes = _traced(compact_fresh)
+
+    _, record_json_seconds = _timed(
+        lambda: [dumps(record.to_dict()) for record in records]
+    )
+    _, compact_json_seconds = _timed(
+        lambda: [dumps(record.to_dict()) for record in session]
+    )
+    record_pickle, record_pickle_seconds = _timed(lambda: pickle.dumps(records))
+    compact_pickle, compact_pickle_seconds = _timed(lambda: pickle.dumps(list(session)))
+
+    return ResultsBenchmarkReport(
+        units,
+        record_bytes,
+        compact_bytes,
+        record_json_seconds,
+        compact_json_seconds,
+        len(record_pickle),
+        len(compact_pickle),
+        record_pickle_seconds,
+        compact_pickle_seconds,
+        compact_seconds,
+    )
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Compare the memory and serialisation cost of session records"
+    )
+    parser.add_argument("-n", "--units", type=int, default=10_000)
+    parser.add_argument(
+        "-w", "--windows", type=int, default=1, help="connection stats windows"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    print(run_results_benchmark(args.units, args.windows, args.seed).format())
@@ -0,0 +1,80 @@
+# Shortens waits when replaying or simulating devices, and keeps track of the time they took
+import threading
+import time
+from contextlib import contextmanager
+
+_sleep_scale = 1.0
+
+
+def set_sleep_scale(scale: float) -> None:
+    """
+    Scales every instrumented sleep, e.g. 0 to skip them when replaying or simulating devices
+    """
+    global _sleep_scale
+    _sleep_scale = scale
+
+
+def sleep_scale() -> float:
+    return _sleep_scale
+
+
+class WaitClock:
+    """
+    Adds up the time during which at least one thread or task is in a scaled wait, so waits that
+    overlap, e.g. on different slots, count once. A run with scaled waits can then report the
+    time it would have taken unscaled.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._waiters = 0
+        self._since = 0.0
+        self.waited = 0.0
+
+    @contextmanager
+    def waiting(self):
+        with self._lock:
+            if not self._waiters:
+                self._since = time.perf_counter()
+            self._waiters += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._waiters -= 1
+                if not self._waiters:
+                    self.waited += time.perf_counter() - self._since
+
+    def unscaled(self, wall_seconds: float, scale: float) -> float:
+        """
+        @param wall_seconds: duration of the run
+        @param scale: factor the waits were scaled by
+        @return: duration of the run with its waits at full length
+        """
+        if scale <= 0:
+            return wall_seconds
+        return wall_seconds + self.waited * (1 / scale - 1)
+
+
+_wait_clock: WaitClock | None = None
+
+
+def set_wait_clock(clock: WaitClock | None) -> None:
+    """
+    Times every scaled wait, instrumented sleeps and simulated device delays, on `clock`
+    """
+    global _wait_clock
+    _wait_clock = clock
+
+
+@contextmanager
+def scaled_wait():
+    """
+    Marks a wait that is shortened by the sleep or simulation time scale
+    """
+    clock = _wait_clock
+    if clock is None:
+        yield
+    else:
+        with clock.waiting():
+            yield
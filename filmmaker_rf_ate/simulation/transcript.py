@@ -0,0 +1,407 @@
+# Records HID and serial traffic to a transcript, and replays transcripts without hardware
+import dataclasses
+import gzip
+import importlib
+import json
+import threading
+import time
+from collections import defaultdict, deque
+from enum import Enum
+from functools import wraps
+from os import PathLike
+
+from functional_test_core.models import DeviceInfo
+
+from filmmaker_rf_ate.arduino.arduino import RFATEArduino
+from filmmaker_rf_ate.simulation.devices import make_device_info
+
+ARDUINO_CHANNEL = "arduino"
+
+
+# Packages whose classes a transcript may rebuild responses and exceptions from
+TRUSTED_PACKAGES = ("rode", "filmmaker_rf_ate")
+
+
+class ReplayMismatch(Exception):
+    pass
+
+
+def _class_path(cls: type) -> str:
+    return f"{cls.__module__}:{cls.__qualname__}"
+
+
+def _trusted_class(path: str, base: type = object) -> type:
+    """
+    Looks up a class recorded in a transcript. Only rode and RF ATE classes, and built-in
+    exceptions, are allowed, so a transcript cannot make the replay import or call anything else.
+    """
+    module, _, qualname = path.partition(":")
+    trusted = module.split(".")[0] in TRUSTED_PACKAGES or (
+        module == "builtins" and issubclass(base, BaseException)
+    )
+    if not trusted:
+        raise ReplayMismatch(f"Transcript refers to untrusted class `{path}`")
+
+    cls = importlib.import_module(module)
+    for name in qualname.split("."):
+        cls = getattr(cls, name)
+    if not isinstance(cls, type) or not issubclass(cls, base):
+        raise ReplayMismatch(f"Transcript refers to `{path}`, not a {base.__name__}")
+    return cls
+
+
+def encode(value):
+    """
+    @return: a JSON-compatible form of a payload. Anything other than JSON scalars and lists is
+    tagged with its type, e.g. `{"bytes": "0a1b"}`.
+    """
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, (bytes, bytearray)):
+        return {"bytes": value.hex()}
+    if isinstance(value, list):
+        return [encode(item) for item in value]
+    if isinstance(value, tuple):
+        return {"tuple": [encode(item) for item in value]}
+    if isinstance(value, dict):
+        return {"dict": [[encode(key), encode(item)] for key, item in value.items()]}
+    if isinstance(value, Enum):
+        return {"enum": _class_path(type(value)), "name": value.name}
+    if isinstance(value, BaseException):
+        return {"exception": _class_path(type(value)), "args": encode(list(value.args))}
+
+    if dataclasses.is_dataclass(value):
+        state = {
+            field.name: getattr(value, field.name)
+            for field in dataclasses.fields(value)
+        }
+    elif hasattr(value, "__dict__"):
+        state = vars(value)
+    else:
+        raise TypeError(f"Cannot record a `{type(value).__name__}`")
+    return {
+        "object": _class_path(type(value)),
+        "state": {name: encode(item) for name, item in state.items()},
+    }
+
+
+def decode(value):
+    """
+    Rebuilds a payload from its `encode`d form
+    """
+    if isinstance(value, list):
+        return [decode(item) for item in value]
+    if not isinstance(value, dict):
+        return value
+
+    if "bytes" in value:
+        return bytes.fromhex(value["bytes"])
+    if "tuple" in value:
+        return tuple(decode(item) for item in value["tuple"])
+    if "dict" in value:
+        return {decode(key): decode(item) for key, item in value["dict"]}
+    if "enum" in value:
+        return _trusted_class(value["enum"], Enum)[value["name"]]
+    if "exception" in value:
+        cls = _trusted_class(value["exception"], BaseException)
+        args = decode(value["args"])
+        try:
+            return cls(*args)
+        except TypeError:
+            exception = cls.__new__(cls)
+            exception.args = tuple(args)
+            return exception
+
+    cls = _trusted_class(value["object"])
+    rebuilt = cls.__new__(cls)
+    for name, item in value["state"].items():
+        # Also sets the fields of frozen dataclasses
+        object.__setattr__(rebuilt, name, decode(item))
+    return rebuilt
+
+
+class TranscriptWriter:
+    """
+    Appends timestamped events to a gzipped JSON Lines file, one event per line as
+    `{"t": seconds since start, "channel": ..., "operation": ..., "payload": ...}`. Payloads are
+    stored with `encode`.
+    """
+
+    def __init__(self, path: PathLike | str):
+        self._file = gzip.open(path, "wt", encoding="utf-8")
+        self._lock = threading.Lock()
+        self._start = time.perf_counter()
+        self._devices = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def write(self, channel: str, operation: str, payload, timestamp: float = None):
+        timestamp = time.perf_counter() if timestamp is None else timestamp
+        line = json.dumps(
+            {
+                "t": timestamp - self._start,
+                "channel": channel,
+                "operation": operation,
+                "payload": encode(payload),
+            },
+            separators=(",", ":"),
+        )
+        with self._lock:
+            self._file.write(line + "\n")
+
+    def close(self):
+        for rode_device in self._devices:
+            if (
+                rode_device._transcript is not None
+                and rode_device._transcript[0] is self
+            ):
+                rode_device._transcript = None
+        self._devices.clear()
+        with self._lock:
+            self._file.close()
+
+    def record_plan(self, channel: str, **plan) -> None:
+        """
+        Records how a DUT's test plan was built (profile, order) so replays build the same plan
+        """
+        self.write(channel, "plan", plan)
+
+    def record_device(self, device: DeviceInfo, channel: str) -> None:
+        """
+        Records every command sent to a device and its response or exception, until this
+        transcript is closed. Safe to call with a device a closed transcript recorded.
+        """
+        rode_device = device.rode_device
+        rode_device._transcript = (self, channel)
+        self._devices.append(rode_device)
+        if getattr(rode_device, "_recorded", False):
+            return
+
+        handle_command = rode_device.handle_command
+
+        @wraps(handle_command)
+        def recorded_handle_command(command, *args, **kwargs):
+            transcript = rode_device._transcript
+            if transcript is None:
+                return handle_command(command, *args, **kwargs)
+
+            writer, channel = transcript
+            start = time.perf_counter()
+            try:
+                response = handle_command(command, *args, **kwargs)
+            except Exception as e:
+                writer.write(
+                    channel,
+                    "command",
+                    (type(command).__name__, None, e, time.perf_counter() - start),
+                    start,
+                )
+                raise
+
+            writer.write(
+                channel,
+                "command",
+                (type(command).__name__, response, None, time.perf_counter() - start),
+                start,
+            )
+            return response
+
+        rode_device.handle_command = recorded_handle_command
+        rode_device._recorded = True
+
+    def serial_factory(self, **kwargs) -> "RecordingSerial":
+        from serial import Serial
+
+        return RecordingSerial(Serial(**kwargs), self)
+
+    def arduino_factory(self, port: str) -> RFATEArduino:
+        return RFATEArduino(port, serial_factory=self.serial_factory)
+
+
+class RecordingSerial:
+    def __init__(self, serial, writer: TranscriptWriter):
+        self._serial = serial
+        self._writer = writer
+
+    def write(self, data: bytes) -> int:
+        self._writer.write(ARDUINO_CHANNEL, "write", data)
+        return self._serial.write(data)
+
+    def read_until(self, expected: bytes = b"\n", size: int = None) -> bytes:
+        start = time.perf_counter()
+        data = self._serial.read_until(expected, size)
+        self._writer.write(
+            ARDUINO_CHANNEL, "read", (data, time.perf_counter() - start), start
+        )
+        return data
+
+    def readlines(self) -> list[bytes]:
+        start = time.perf_counter()
+        lines = self._serial.readlines()
+        self._writer.write(
+            ARDUINO_CHANNEL, "readlines", (lines, time.perf_counter() - start), start
+        )
+        return lines
+
+    def close(self):
+        self._serial.close()
+
+
+def read_transcript(path: PathLike | str):
+    """
+    @return: the transcript's events as `(seconds since start, channel, operation, payload)`
+    """
+    with gzip.open(path, "rt", encoding="utf-8") as file:
+        for line in file:
+            if line.strip():
+                event = json.loads(line)
+                yield (
+                    event["t"],
+                    event["channel"],
+                    event["operation"],
+                    decode(event["payload"]),
+                )
+
+
+class ReplaySession:
+    """
+    Serves recorded responses back, per channel, in the order they were recorded. With
+    `realtime`, each response is delayed by its recorded duration.
+    """
+
+    def __init__(self, path: PathLike | str, realtime: bool = False):
+        self.realtime = realtime
+        self._events: dict[str, deque] = defaultdict(deque)
+        self.plans: dict[str, dict] = {}
+
+        for _, channel, operation, payload in read_transcript(path):
+            if operation == "plan":
+                self.plans[channel] = payload
+            else:
+                self._events[channel].append((operation, payload))
+
+    @property
+    def channels(self) -> list[str]:
+        return [channel for channel in self._events if channel != ARDUINO_CHANNEL]
+
+    def next_event(self, channel: str, operation: str):
+        try:
+            recorded_operation, payload = self._events[channel].popleft()
+        except IndexError:
+            raise ReplayMismatch(
+                f"Transcript for `{channel}` exhausted, expected `{operation}`"
+            )
+
+        if recorded_operation != operation:
+            raise ReplayMismatch(
+                f"Expected `{recorded_operation}` on `{channel}`, got `{operation}`"
+            )
+
+        return payload
+
+    def device(self, channel: str) -> DeviceInfo:
+        return make_device_info(ReplayDevice(self, channel), channel)
+
+    def serial_factory(self, **kwargs) -> "ReplaySerial":
+        return ReplaySerial(self)
+
+    def arduino_factory(self, port: str) -> RFATEArduino:
+        return RFATEArduino(port, serial_factory=self.serial_factory)
+
+
+class ReplayDevice:
+    def __init__(self, session: ReplaySession, channel: str):
+        self._session = session
+        self._channel = channel
+
+    def handle_command(self, command, *args, **kwargs):
+        command_type, response, exception, duration = self._session.next_event(
+            self._channel, "command"
+        )
+        if command_type != type(command).__name__:
+            raise ReplayMismatch(
+                f"Expected `{command_type}` on `{self._channel}`, got `{type(command).__name__}`"
+            )
+
+        if self._session.realtime:
+            time.sleep(duration)
+
+        if exception is not None:
+            raise exception
+
+        return response
+
+
+class ReplaySerial:
+    def __init__(self, session: ReplaySession):
+        self._session = session
+
+    def write(self, data: bytes) -> int:
+        recorded = self._session.next_event(ARDUINO_CHANNEL, "write")
+        if recorded != data:
+            raise ReplayMismatch(f"Expected Arduino write {recorded!r}, got {data!r}")
+        return len(data)
+
+    def read_until(self, expected: bytes = b"\n", size: int = None) -> bytes:
+        data, duration = self._session.next_event(ARDUINO_CHANNEL, "read")
+        if self._session.realtime:
+            time.sleep(duration)
+        return data
+
+    def readlines(self) -> list[bytes]:
+        lines, duration = self._session.next_event(ARDUINO_CHANNEL, "readlines")
+        if self._session.realtime:
+            time.sleep(duration)
+        return lines
+
+    def close(self):
+        pass
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from functional_test_core.models.utils import spprint_devices
+
+    from filmmaker_rf_ate.config import CONFIG
+    from filmmaker_rf_ate.simulation.time_scale import set_sleep_scale
+    from filmmaker_rf_ate.tests.test_factory import test_factory
+    from filmmaker_rf_ate.utils.instrumentation import StationMetrics
+
+    parser = argparse.ArgumentParser(description="Replay a recorded test session")
+    parser.add_argument("transcript")
+    parser.add_argument(
+        "--realtime", action="store_true", help="replay at the recorded timing"
+    )
+    args = parser.parse_args()
+
+    session = ReplaySession(args.transcript, realtime=args.realtime)
+    if not args.realtime:
+        set_sleep_scale(0)
+
+    metrics = StationMetrics()
+    reference = session.device("reference")
+    dut_channels = [channel for channel in session.channels if channel != "reference"]
+    start = time.perf_counter()
+    for channel in dut_channels:
+        dut = session.device(channel)
+        plan = session.plans.get(channel, {})
+        test_handler = test_factory(
+            reference,
+            dut,
+            CONFIG,
+            plan.get("stop_on_fail", CONFIG.stop_on_fail),
+            plan.get("order"),
+            plan.get("profile"),
+            metrics,
+            session.arduino_factory,
+        )
+        test_handler.execute_tests()
+        print(spprint_devices(dut))
+
+    print(f"Replayed {len(dut_channels)} DUT(s) in {time.perf_counter() - start:.3f}s")
+    print(metrics.to_prometheus())
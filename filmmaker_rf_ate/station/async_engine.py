@@ -0,0 +1,197 @@
+# Runs every slot of a batch on one event loop
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Callable
+
+from functional_test_core.device_test import DeviceTest
+from functional_test_core.device_test.observer import Observer
+from functional_test_core.models import DeviceInfo, TestInfo
+
+from filmmaker_rf_ate.station.leases import REFERENCE, AsyncResourceLeases
+from filmmaker_rf_ate.station.station import (
+    SLOT_ERROR_CODE,
+    SlotResult,
+    Station,
+    failed_result,
+)
+from filmmaker_rf_ate.tests.async_test import run_blocking
+from filmmaker_rf_ate.tests.test_order import plan_batch_order
+from filmmaker_rf_ate.utils.observer_dispatch import dispatch_observer
+from filmmaker_rf_ate.utils.warm_up import WarmDut
+
+
+async def execute_test(test: DeviceTest) -> list[TestInfo]:
+    """
+    Runs a test's async variant, or the whole sync test on the loop's executor if it has none
+    """
+    execute_test_async = getattr(test, "execute_test_async", None)
+    if execute_test_async is not None:
+        return await execute_test_async()
+    return await run_blocking(test.execute_test)
+
+
+class AsyncStation:
+    """
+    Runs batches with all slots on one event loop, in place of a thread per slot. Tests with async
+    phases wait cooperatively; other tests, and the blocking HID and serial transfers, run on a
+    thread pool shared by every slot.
+    """
+
+    def __init__(self, station: Station, max_workers: int = 8):
+        """
+        @param station: station whose config, stores and metrics the batches use
+        @param max_workers: threads available for blocking calls, across all slots
+        """
+        self._station = station
+        self._logger = logging.getLogger("async_engine")
+        # Kept for every batch, like asyncio.Runner, which needs Python 3.11
+        self._loop = asyncio.new_event_loop()
+        self._loop.set_default_executor(
+            ThreadPoolExecutor(max_workers, thread_name_prefix="async_engine")
+        )
+
+    @property
+    def station(self) -> Station:
+        return self._station
+
+    def close(self):
+        try:
+            self._loop.run_until_complete(self._loop.shutdown_asyncgens())
+            self._loop.run_until_complete(self._loop.shutdown_default_executor())
+        finally:
+            self._loop.close()
+
+    def run_batch(
+        self,
+        ref: DeviceInfo,
+        duts: dict[str, DeviceInfo],
+        observers: dict[str, Observer] = None,
+        on_result: Callable[[SlotResult], None] = None,
+        on_test: Callable[[str, DeviceTest, list[TestInfo]], None] = None,
+        retest_failed: bool = False,
+        warm: dict[str, WarmDut] = None,
+    ) -> list[SlotResult]:
+        """
+        Blocking entry point to `run_batch_async`, taking the same arguments as Station.run_batch
+        """
+        return self._loop.run_until_complete(
+            self.run_batch_async(
+                ref, duts, observers, on_result, on_test, retest_failed, warm
+            )
+        )
+
+    async def run_batch_async(
+        self,
+        ref: DeviceInfo,
+        duts: dict[str, DeviceInfo],
+        observers: dict[str, Observer] = None,
+        on_result: Callable[[SlotResult], None] = None,
+        on_test: Callable[[str, DeviceTest, list[TestInfo]], None] = None,
+        retest_failed: bool = False,
+        warm: dict[str, WarmDut] = None,
+    ) -> list[SlotResult]:
+        """
+        Tests every DUT in the batch at once, taking turns on the reference and Arduino
+        @param ref: reference device
+        @param duts: DUTs keyed by slot name
+        @param observers: observer to attach to each slot's tests
+        @param on_result: called as each slot finishes
+        @param on_test: called with the slot, test and its results as each test finishes
+        @param retest_failed: only rerun the tests each DUT failed or did not reach last time
+        @param warm: DUTs already warmed up, keyed by slot, whose reads the tests reuse
+        @return: results of each slot, in slot order
+        """
+        station = self._station
+        config = station.config
+        observers = {} if observers is None else observers
+        warm = {} if warm is None else dict(warm)
+        firmware_updates = await run_blocking(station.update_firmware, duts, observers)
+        for slot, report in firmware_updates.items():
+            if report.updated:
+                # Versions read while warming up are out of date
+                warm.pop(slot, None)
+        test_order = plan_batch_order(config.tests.order, config.stop_on_fail)
+        await run_blocking(station.power_on_batch, {**duts, REFERENCE: ref})
+
+        transcript = station.open_transcript(len(duts) > 1)
+        arduino_factory = None
+        if transcript is not None:
+            transcript.record_device(ref, "reference")
+            arduino_factory = transcript.arduino_factory
+
+        leases = AsyncResourceLeases(metrics=station.metrics)
+
+        async def run_slot(slot: str, dut: DeviceInfo) -> SlotResult:
+            observer = observers.get(slot)
+            # Every slot shares the loop, so a slow observer would hold up all of them
+            dispatcher = dispatch_observer(
+                observer, config.observer_dispatch, f"observer-{slot}"
+            )
+            if dispatcher is not None:
+                observer = dispatcher
+
+            try:
+                plan = await run_blocking(
+                    partial(
+                        station.plan_slot,
+                        ref,
+                        slot,
+                        dut,
+                        test_order,
+                        observer,
+                        arduino_factory,
+                        transcript,
+                        on_test=on_test,
+                        retest_failed=retest_failed,
+                        warm=warm.get(slot),
+                        asynchronous=True,
+                    )
+                )
+
+                started_at = time.time()
+                results = list(plan.skipped)
+                for test in plan.test_handler.tests:
+                    if observer is not None:
+                        test.add_observer(observer)
+                    async with leases.lease_test(test):
+                        test_results = await execute_test(test)
+                    results.extend(test_results)
+                    if config.stop_on_fail and not all(
+                        result.passed for result in test_results
+                    ):
+                        break
+                finished_at = time.time()
+            finally:
+                if dispatcher is not None:
+                    await run_blocking(dispatcher.close)
+
+            return await run_blocking(
+                station.finish_slot, plan, results, started_at, finished_at
+            )
+
+        async def run(slot: str, dut: DeviceInfo) -> SlotResult:
+            try:
+                slot_result = await run_slot(slot, dut)
+            except Exception as e:
+                # Reported as a failed slot, so it does not take the other slots' results with it
+                self._logger.exception(f"{slot} failed to run")
+                slot_result = failed_result(
+                    slot, dut, "slot", {"exception": repr(e)}, SLOT_ERROR_CODE
+                )
+            slot_result.firmware_update = firmware_updates.get(slot)
+            if on_result is not None:
+                on_result(slot_result)
+            return slot_result
+
+        try:
+            return list(
+                await asyncio.gather(*(run(slot, dut) for slot, dut in duts.items()))
+            )
+        finally:
+            if transcript is not None:
+                transcript.close()
+
+            station.write_metrics()
@@ -0,0 +1,305 @@
+# Headless station runner streaming JSON Lines events to stdout. Must never import Kivy.
+import sys
+import threading
+import time
+from functools import partial
+from typing import TextIO
+
+from functional_test_core.device_test import DeviceTest
+from functional_test_core.device_test.observer import Message, Observable, Observer
+from functional_test_core.models import TestInfo
+
+from filmmaker_rf_ate.config import Config
+from filmmaker_rf_ate.results.records import dumps, flatten_measurements
+from filmmaker_rf_ate.station.hot_swap import HotSwapRunner
+from filmmaker_rf_ate.station.station import SlotResult, Station
+from filmmaker_rf_ate.utils.device_tracker import DeviceTracker
+
+
+class EventWriter:
+    """
+    Writes one JSON object per line. Lines from concurrent slots never interleave.
+    """
+
+    def __init__(self, stream: TextIO = sys.stdout):
+        self._stream = stream
+        self._lock = threading.Lock()
+
+    def emit(self, event: str, **fields) -> None:
+        line = dumps({"event": event, "time": time.time(), **fields})
+        with self._lock:
+            self._stream.write(line + "\n")
+            self._stream.flush()
+
+
+class EventObserver(Observer):
+    def __init__(self, writer: EventWriter, slot: str):
+        super().__init__()
+        self._writer = writer
+        self._slot = slot
+
+    def update(self, observable: Observable, message: Message, *args, **kwargs):
+        self._writer.emit(
+            "message",
+            slot=self._slot,
+            test=message.name,
+            status=message.status,
+            content=message.content,
+        )
+
+
+def emit_test(
+    writer: EventWriter, slot: str, test: DeviceTest, results: list[TestInfo]
+) -> None:
+    writer.emit(
+        "test",
+        slot=slot,
+        test=test.name,
+        passed=all(result.passed for result in results),
+        error_code="".join(
+            [result.error_code for result in results if not result.passed]
+        ),
+        results=[
+            {
+                "name": result.name,
+                "passed": result.passed,
+                "measurements": flatten_measurements(result.name, result.info),
+            }
+            for result in results
+        ],
+        timing=getattr(test, "timing", None),
+    )
+
+
+def emit_slot(writer: EventWriter, slot_result: SlotResult) -> None:
+    report = slot_result.firmware_update
+    if report is not None and (report.updated or report.error):
+        writer.emit(
+            "firmware_update",
+            slot=slot_result.slot,
+            verified=report.verified,
+            versions=report.versions,
+            error=report.error,
+            flashed=[
+                {
+                    "target": flash.target,
+                    "from": flash.from_version,
+                    "to": flash.to_version,
+                    "bytes": flash.size,
+                    "seconds": flash.seconds,
+                    "bytes_per_second": flash.throughput,
+                }
+                for flash in report.flashed
+            ],
+        )
+
+    writer.emit(
+        "slot",
+        slot=slot_result.slot,
+        serial=slot_result.identity.serial,
+        rfid=slot_result.identity.rfid,
+        profile=slot_result.profile,
+        passed=slot_result.passed,
+        error_code=slot_result.error_code,
+        duration=slot_result.finished_at - slot_result.started_at,
+    )
+
+
+def run_batches(
+    config: Config,
+    writer: EventWriter,
+    batches: int = 1,
+    interval: float = 0.0,
+    parallel: bool = True,
+    station: Station = None,
+    retest_failed: bool = False,
+) -> bool:
+    """
+    Scans for devices and tests every connected slot, once per batch
+    @param config: station config
+    @param writer: event output
+    @param batches: number of batches, 0 to run until interrupted
+    @param interval: seconds to wait between batches
+    @param parallel: test slots at once rather than in turn
+    @param station: station to run on. Defaults to one recording to the configured database.
+    @param retest_failed: only rerun the tests each DUT failed or did not reach last time
+    @return: True if every unit passed
+    """
+    station = Station.from_config(config) if station is None else station
+
+    on_test = partial(emit_test, writer)
+    on_result = partial(emit_slot, writer)
+    # Keeps one handle per device across batches
+    devices = DeviceTracker(config)
+
+    all_passed = True
+    batch = 0
+    try:
+        while batches == 0 or batch < batches:
+            batch += 1
+            ref, slot_duts = devices.scan(retries=5)
+            if ref is None:
+                writer.emit("error", batch=batch, message="Reference device not found")
+                return False
+
+            writer.emit("batch_start", batch=batch, slots=list(slot_duts))
+
+            start = time.perf_counter()
+            slot_results = station.run_batch(
+                ref,
+                slot_duts,
+                {slot: EventObserver(writer, slot) for slot in slot_duts},
+                on_result,
+                parallel,
+                on_test,
+                retest_failed,
+            )
+            passed = [
+                slot_result.slot for slot_result in slot_results if slot_result.passed
+            ]
+            failed = [
+                slot_result.slot
+                for slot_result in slot_results
+                if not slot_result.passed
+            ]
+            all_passed = all_passed and not failed
+            writer.emit(
+                "batch_end",
+                batch=batch,
+                passed=passed,
+                failed=failed,
+                duration=time.perf_counter() - start,
+            )
+
+            if interval and (batches == 0 or batch < batches):
+                time.sleep(interval)
+    finally:
+        devices.close()
+        station.close()
+
+    return all_passed
+
+
+def run_continuous(
+    config: Config, writer: EventWriter, station: Station = None
+) -> None:
+    """
+    Tests each slot as DUTs are inserted, until interrupted
+    @param config: station config
+    @param writer: event output
+    @param station: station to run on. Defaults to one recording to the configured database.
+    """
+    station = Station.from_config(config) if station is None else station
+    runner = HotSwapRunner(
+        station,
+        observer_factory=partial(EventObserver, writer),
+        on_start=lambda slot, dut: writer.emit("slot_start", slot=slot),
+        on_result=partial(emit_slot, writer),
+        on_empty=lambda slot: writer.emit("slot_empty", slot=slot),
+        on_test=partial(emit_test, writer),
+    )
+    runner.start()
+    try:
+        while runner.running:
+            time.sleep(0.5)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        runner.stop()
+        station.close()
+
+
+def main(argv: list[str] = None) -> int:
+    import argparse
+    import logging
+
+    from filmmaker_rf_ate.config import CONFIG
+
+    parser = argparse.ArgumentParser(
+        description="Run RF ATE batches without the GUI, printing JSON Lines events"
+    )
+    parser.add_argument(
+        "-b", "--batches", type=int, default=1, help="0 runs until interrupted"
+    )
+    parser.add_argument(
+        "-i", "--interval", type=float, default=0.0, help="seconds between batches"
+    )
+    parser.add_argument(
+        "--serial", action="store_true", help="test slots one at a time"
+    )
+    parser.add_argument(
+        "--retest-failed",
+        action="store_true",
+        help="only rerun the tests each DUT failed or did not reach last time",
+    )
+    parser.add_argument(
+        "--continuous",
+        action="store_true",
+        help="test each slot as DUTs are inserted, until interrupted",
+    )
+    parser.add_argument(
+        "--simulate",
+        action="store_true",
+        help="run against simulated devices instead of hardware",
+    )
+    parser.add_argument(
+        "--time-scale",
+        type=float,
+        default=0.01,
+        help="simulated time per second of station time",
+    )
+    parser.add_argument("-v", "--verbose", action="store_true")
+    args = parser.parse_args(argv)
+
+    # stdout carries events only
+    logging.basicConfig(
+        stream=sys.stderr, level=logging.INFO if args.verbose else logging.WARNING
+    )
+
+    writer = EventWriter()
+    if not args.simulate:
+        if args.continuous:
+            run_continuous(CONFIG, writer)
+            return 0
+
+        passed = run_batches(
+            CONFIG,
+            writer,
+            args.batches,
+            args.interval,
+            not args.serial,
+            retest_failed=args.retest_failed,
+        )
+        return 0 if passed else 1
+
+    from filmmaker_rf_ate.simulation.devices import SimTiming, SimulatedStation
+    from filmmaker_rf_ate.simulation.time_scale import set_sleep_scale
+
+    simulation = SimulatedStation(
+        hid_index=CONFIG.hid_index, timing=SimTiming(time_scale=args.time_scale)
+    )
+    set_sleep_scale(args.time_scale)
+    station = Station(
+        CONFIG,
+        arduino_factory=simulation.arduino_factory,
+        flasher=simulation.flasher,
+    )
+    with simulation.install():
+        if args.continuous:
+            run_continuous(CONFIG, writer, station)
+            return 0
+
+        passed = run_batches(
+            CONFIG,
+            writer,
+            args.batches,
+            args.interval,
+            not args.serial,
+            station,
+            args.retest_failed,
+        )
+    return 0 if passed else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
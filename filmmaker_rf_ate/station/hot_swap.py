@@ -0,0 +1,201 @@
+# Tests each slot as soon as a DUT is inserted, independently of the other slots
+import logging
+import threading
+from dataclasses import dataclass
+from enum import Enum
+from typing import Callable
+
+from functional_test_core.device_test import DeviceTest
+from functional_test_core.device_test.observer import Observer
+from functional_test_core.models import DeviceInfo, TestInfo
+
+from filmmaker_rf_ate.station.leases import ResourceLeases
+from filmmaker_rf_ate.station.station import SlotResult, Station
+from filmmaker_rf_ate.tests.test_order import plan_batch_order
+from filmmaker_rf_ate.utils.device_tracker import DEFAULT_SLOTS, DeviceTracker
+
+
+class SlotState(Enum):
+    EMPTY = "empty"
+    RUNNING = "running"
+    # Finished, waiting for the DUT to be removed
+    DONE = "done"
+
+
+@dataclass
+class _Slot:
+    name: str
+    state: SlotState = SlotState.EMPTY
+    serial: str | None = None
+    thread: threading.Thread | None = None
+
+
+def _serial_number(dut: DeviceInfo) -> str | None:
+    return getattr(dut.rode_device, "serial_number", None)
+
+
+class HotSwapRunner:
+    """
+    Polls for devices and starts a run on a slot when a DUT appears in it. A finished slot is
+    freed once its DUT is removed, or replaced by a unit with a different serial number. Slots
+    lease the reference and Arduino per test, so they never wait for each other to finish.
+    Running slots keep the device handles they started with.
+    """
+
+    def __init__(
+        self,
+        station: Station,
+        slots: tuple[str, ...] = DEFAULT_SLOTS,
+        observer_factory: Callable[[str], Observer] = None,
+        on_start: Callable[[str, DeviceInfo], None] = None,
+        on_result: Callable[[SlotResult], None] = None,
+        on_empty: Callable[[str], None] = None,
+        on_test: Callable[[str, DeviceTest, list[TestInfo]], None] = None,
+        poll_interval: float = None,
+        devices: DeviceTracker = None,
+    ):
+        """
+        @param devices: tracker to scan with, if shared. By default the runner has its own and
+        closes its handles once stopped.
+        """
+        config = station.config
+        self._station = station
+        self._slots = [_Slot(name) for name in slots]
+        self._observer_factory = observer_factory
+        self._on_start = on_start
+        self._on_result = on_result
+        self._on_empty = on_empty
+        self._on_test = on_test
+        self._poll_interval = (
+            config.hot_swap_poll_interval if poll_interval is None else poll_interval
+        )
+        self._test_order = plan_batch_order(config.tests.order, config.stop_on_fail)
+        self._leases = ResourceLeases(metrics=station.metrics)
+        self._owns_devices = devices is None
+        self._devices = DeviceTracker(config, slots) if devices is None else devices
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._logger = logging.getLogger("hot_swap")
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def slot_states(self) -> dict[str, SlotState]:
+        with self._lock:
+            return {slot.name: slot.state for slot in self._slots}
+
+    def start(self) -> None:
+        if self.running:
+            return
+
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._poll_loop, name="hot_swap", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self, wait: bool = True) -> None:
+        """
+        Stops starting new runs. Runs in progress are left to finish.
+        @param wait: block until the poller and all runs in progress have finished, then close
+        the device handles
+        """
+        self._stop.set()
+        if not wait:
+            return
+
+        if self._thread is not None:
+            self._thread.join()
+        for slot in self._slots:
+            if slot.thread is not None:
+                slot.thread.join()
+        if self._owns_devices:
+            self._devices.close()
+
+    def _poll_loop(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self.poll()
+            except Exception:
+                self._logger.exception("Device poll failed")
+            self._stop.wait(self._poll_interval)
+
+    def poll(self) -> None:
+        """
+        Scans once and starts or frees slots to match the devices found
+        """
+        with self._lock:
+            running = [
+                slot.name for slot in self._slots if slot.state is SlotState.RUNNING
+            ]
+        ref, duts = self._devices.scan(running)
+        if ref is None:
+            self._logger.warning("Reference unit not found! Check connection.")
+            return
+
+        for slot in self._slots:
+            dut = duts.get(slot.name)
+            with self._lock:
+                state = slot.state
+                if state is SlotState.RUNNING:
+                    continue
+
+                if dut is None:
+                    if state is SlotState.DONE:
+                        slot.state = SlotState.EMPTY
+                        slot.serial = None
+                    else:
+                        continue
+                elif state is SlotState.DONE and (
+                    slot.serial is None or _serial_number(dut) == slot.serial
+                ):
+                    continue
+                else:
+                    slot.state = SlotState.RUNNING
+                    slot.serial = _serial_number(dut)
+                    slot.thread = threading.Thread(
+                        target=self._run_slot,
+                        args=(slot, ref, dut),
+                        name=f"slot-{slot.name}",
+                        daemon=True,
+                    )
+
+            if dut is None:
+                if self._on_empty is not None:
+                    self._on_empty(slot.name)
+                continue
+
+            if self._on_start is not None:
+                self._on_start(slot.name, dut)
+            slot.thread.start()
+
+    def _run_slot(self, slot: _Slot, ref: DeviceInfo, dut: DeviceInfo) -> None:
+        try:
+            observer = (
+                None
+                if self._observer_factory is None
+                else self._observer_factory(slot.name)
+            )
+            firmware_update = self._station.update_firmware(
+                {slot.name: dut}, {slot.name: observer}
+            ).get(slot.name)
+            slot_result = self._station.run_slot(
+                ref,
+                slot.name,
+                dut,
+                self._test_order,
+                observer,
+                leases=self._leases,
+                on_test=self._on_test,
+            )
+            slot_result.firmware_update = firmware_update
+            if self._on_result is not None:
+                self._on_result(slot_result)
+        except Exception:
+            self._logger.exception(f"Run on {slot.name} failed")
+        finally:
+            with self._lock:
+                slot.state = SlotState.DONE
+            self._station.write_metrics()
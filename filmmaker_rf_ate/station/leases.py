@@ -0,0 +1,104 @@
+# Serialises access to station hardware shared between slots
+import asyncio
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+
+from functional_test_core.device_test import DeviceTest
+
+from filmmaker_rf_ate.utils.instrumentation import METRICS, StationMetrics
+from filmmaker_rf_ate.utils.test_hooks import wrap_execute
+
+REFERENCE = "reference"
+ARDUINO = "arduino"
+RESOURCES = (REFERENCE, ARDUINO)
+
+# Shared hardware each test holds for its whole run
+TEST_RESOURCES: dict[str, tuple[str, ...]] = {
+    "connection_stats": (REFERENCE,),
+    "rf_power": (ARDUINO,),
+}
+
+
+class ResourceLeases:
+    """
+    One lock per shared resource. Resources are always acquired in sorted order, so slots
+    leasing several resources cannot deadlock.
+    """
+
+    def __init__(
+        self,
+        resources: tuple[str, ...] = RESOURCES,
+        metrics: StationMetrics = METRICS,
+        locks: dict = None,
+    ):
+        """
+        @param locks: locks to use, keyed by resource, e.g. to share the resources with other
+        processes. Defaults to a new lock per resource.
+        """
+        self._locks = (
+            {resource: threading.Lock() for resource in resources}
+            if locks is None
+            else locks
+        )
+        self._metrics = metrics
+
+    @contextmanager
+    def lease(self, *resources: str):
+        acquired = []
+        try:
+            for resource in sorted(set(resources)):
+                start = time.perf_counter()
+                self._locks[resource].acquire()
+                acquired.append(resource)
+                self._metrics.observe_lease_wait(resource, time.perf_counter() - start)
+            yield
+        finally:
+            for resource in reversed(acquired):
+                self._locks[resource].release()
+
+    def guard_test(self, test: DeviceTest) -> None:
+        """
+        Makes a test hold the resources it uses for the duration of each run
+        """
+        resources = TEST_RESOURCES.get(test.name)
+        if not resources:
+            return
+
+        # Async runs hold their resources through AsyncResourceLeases instead
+        wrap_execute(test, around=lambda: self.lease(*resources), asynchronous=False)
+
+
+class AsyncResourceLeases:
+    """
+    ResourceLeases for slots sharing an event loop. Waiting for a lease yields to the other slots
+    instead of blocking the loop.
+    """
+
+    def __init__(
+        self,
+        resources: tuple[str, ...] = RESOURCES,
+        metrics: StationMetrics = METRICS,
+    ):
+        self._locks = {resource: asyncio.Lock() for resource in resources}
+        self._metrics = metrics
+
+    @asynccontextmanager
+    async def lease(self, *resources: str):
+        acquired = []
+        try:
+            for resource in sorted(set(resources)):
+                start = time.perf_counter()
+                await self._locks[resource].acquire()
+                acquired.append(resource)
+                self._metrics.observe_lease_wait(resource, time.perf_counter() - start)
+            yield
+        finally:
+            for resource in reversed(acquired):
+                self._locks[resource].release()
+
+    def lease_test(self, test: DeviceTest):
+        """
+        @return: context holding the resources a test uses for its run
+        """
+        return self.lease(*TEST_RESOURCES.get(test.name, ()))
@@ -0,0 +1,136 @@
+# Live per-slot status in shared memory, written by slot workers and read by the UI
+import struct
+import threading
+import time
+from dataclasses import dataclass
+from enum import IntEnum
+from multiprocessing import shared_memory
+
+# seq, state, leases, pid, updated_at, tests_done, test, message
+_FORMAT = struct.Struct("<IBBxxidH32s192s")
+_RECORD_SIZE = 256
+_READ_ATTEMPTS = 1000
+
+
+class SlotState(IntEnum):
+    STOPPED = 0
+    IDLE = 1
+    RUNNING = 2
+    PASSED = 3
+    FAILED = 4
+    CRASHED = 5
+
+
+@dataclass
+class SlotStatus:
+    state: SlotState
+    # Bits per shared resource, in leases.RESOURCES order, set while the slot acquires or
+    # holds it. See workers._lease_bits.
+    leases: int
+    pid: int
+    updated_at: float
+    tests_done: int
+    test: str
+    message: str
+
+
+class SlotStatusBlock:
+    """
+    Fixed size status record per slot in a shared memory block. One process writes each record,
+    and any number read it in place. Records carry a sequence number that is odd while a write is
+    in progress, so readers retry instead of seeing a torn record.
+    """
+
+    def __init__(self, slots: int, name: str = None):
+        """
+        @param slots: number of records
+        @param name: name of an existing block to attach to. Creates a new block if not given.
+        """
+        self._slots = slots
+        self._owner = name is None
+        self._memory = (
+            shared_memory.SharedMemory(create=True, size=slots * _RECORD_SIZE)
+            if self._owner
+            else shared_memory.SharedMemory(name=name)
+        )
+        if self._owner:
+            self._memory.buf[: slots * _RECORD_SIZE] = bytes(slots * _RECORD_SIZE)
+        # Held across a read and write to update a record atomically within this process
+        self.lock = threading.RLock()
+
+    @property
+    def name(self) -> str:
+        return self._memory.name
+
+    def write(self, index: int, **fields) -> None:
+        """
+        Updates some fields of a slot's record. Only one process may write each record.
+        """
+        with self.lock:
+            self._write(index, fields)
+
+    def _write(self, index: int, fields: dict) -> None:
+        status = self.read(index)
+        for key, value in fields.items():
+            setattr(status, key, value)
+
+        buf = self._memory.buf
+        offset = index * _RECORD_SIZE
+        (seq,) = struct.unpack_from("<I", buf, offset)
+        # Already odd if a writer died mid write and this process took the record over
+        seq += 1 - seq % 2
+        struct.pack_into("<I", buf, offset, seq)
+        _FORMAT.pack_into(
+            buf,
+            offset,
+            seq,
+            status.state,
+            status.leases,
+            status.pid,
+            time.time(),
+            status.tests_done,
+            status.test.encode()[:32],
+            status.message.encode()[:192],
+        )
+        struct.pack_into("<I", buf, offset, seq + 1)
+
+    def read(self, index: int) -> SlotStatus:
+        if not 0 <= index < self._slots:
+            raise IndexError(index)
+
+        for _ in range(_READ_ATTEMPTS):
+            (
+                seq,
+                state,
+                leases,
+                pid,
+                updated_at,
+                tests_done,
+                test,
+                message,
+            ) = _FORMAT.unpack_from(self._memory.buf, index * _RECORD_SIZE)
+            (seq_after,) = struct.unpack_from(
+                "<I", self._memory.buf, index * _RECORD_SIZE
+            )
+            if seq % 2 == 0 and seq == seq_after:
+                break
+            time.sleep(0)
+
+        # Past the attempts, the writer died mid write and the record is returned as it is
+        return SlotStatus(
+            SlotState(state),
+            leases,
+            pid,
+            updated_at,
+            tests_done,
+            test.rstrip(b"\x00").decode(errors="replace"),
+            message.rstrip(b"\x00").decode(errors="replace"),
+        )
+
+    def close(self) -> None:
+        """
+        Detaches from the block, and frees it if this process created it
+        """
+        self._memory.close()
+        if self._owner:
+            self._memory.unlink()
@@ -0,0 +1,623 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable
+
+from functional_test_core.device_test import DeviceTest, TestHandler
+from functional_test_core.device_test.observer import Message, Observer
+from functional_test_core.models import DeviceInfo, TestInfo
+
+from filmmaker_rf_ate.arduino.arduino import RFATEArduino
+from filmmaker_rf_ate.config import Config
+from filmmaker_rf_ate.results import (
+    CheckpointStore,
+    DutRecord,
+    ResultStore,
+    SessionResults,
+    UploadQueue,
+)
+from filmmaker_rf_ate.results.records import dumps
+from filmmaker_rf_ate.simulation.transcript import TranscriptWriter
+from filmmaker_rf_ate.station.leases import REFERENCE, ResourceLeases
+from filmmaker_rf_ate.tests.test_factory import test_factory
+from filmmaker_rf_ate.tests.test_order import plan_batch_order
+from filmmaker_rf_ate.tests.test_profiles import ProfileSelector
+from filmmaker_rf_ate.utils.firmware_update import (
+    TARGETS,
+    FirmwareImageCache,
+    FirmwareUpdateReport,
+    Flasher,
+    update_firmware,
+)
+from filmmaker_rf_ate.utils.broadcast import power_on_all, read_identities
+from filmmaker_rf_ate.utils.identity import DutIdentity, read_identity
+from filmmaker_rf_ate.utils.instrumentation import METRICS, StationMetrics
+from filmmaker_rf_ate.utils.observer_dispatch import dispatching
+from filmmaker_rf_ate.utils.test_hooks import wrap_execute
+from filmmaker_rf_ate.utils.warm_up import WarmDut
+from filmmaker_rf_ate.utils.window_tests import all_tests, own_results
+
+SLOT_ERROR_CODE = "E"
+
+
+@dataclass
+class SlotResult:
+    slot: str
+    dut: DeviceInfo
+    results: list[TestInfo]
+    profile: str
+    identity: DutIdentity = None
+    started_at: float = None
+    finished_at: float = None
+    firmware_update: FirmwareUpdateReport = None
+
+    @property
+    def passed(self) -> bool:
+        return all(result.passed for result in self.results)
+
+    @property
+    def error_code(self) -> str:
+        return "".join(
+            [result.error_code for result in self.results if not result.passed]
+        )
+
+
+@dataclass
+class SlotPlan:
+    slot: str
+    dut: DeviceInfo
+    profile: str
+    test_handler: TestHandler
+    # Results of the tests dropped from the plan because they were checkpointed
+    skipped: list[TestInfo]
+    checkpoint_identity: DutIdentity | None = None
+
+
+class Station:
+    """
+    Runs batches of DUTs against the shared reference, and keeps the state that outlives a batch:
+    the profile policy, result and checkpoint stores and metrics
+    """
+
+    def __init__(
+        self,
+        config: Config,
+        result_store: ResultStore | None = None,
+        metrics: StationMetrics = METRICS,
+        arduino_factory: Callable[[str], RFATEArduino] = RFATEArduino,
+        checkpoint_store: CheckpointStore | None = None,
+        flasher: Flasher | None = None,
+        upload_queue: UploadQueue | None = None,
+        session: SessionResults | None = None,
+    ):
+        """
+        @param flasher: transfers firmware images for updates. Only the simulator has one, so
+        updates are skipped without it.
+        @param session: keeps every record of the session in memory, if given
+        """
+        self._config = config
+        self._result_store = result_store
+        self._upload_queue = upload_queue
+        self._session = session
+        self._checkpoint_store = checkpoint_store
+        self._metrics = metrics
+        self._arduino_factory = arduino_factory
+        self._flasher = flasher
+        self._firmware_images = FirmwareImageCache()
+        self._profile_selector = ProfileSelector(config.tests)
+        self._logger = logging.getLogger("station")
+        if config.firmware_update.enabled and flasher is None:
+            self._logger.warning(
+                "Firmware updates are enabled, but only work with the simulator's flasher. "
+                "Skipping them."
+            )
+
+    @classmethod
+    def from_config(cls, config: Config, **kwargs) -> "Station":
+        """
+        Creates a station recording results, and checkpoints if enabled, to the configured database,
+        and uploading results to the MES if enabled
+        """
+        upload_config = config.upload
+        return cls(
+            config,
+            ResultStore(config.results_db),
+            checkpoint_store=CheckpointStore(config.results_db)
+            if config.checkpoints.enabled
+            else None,
+            upload_queue=UploadQueue(
+                config.results_db,
+                upload_config.url,
+                upload_config.batch_size,
+                upload_config.timeout,
+                max_backoff=upload_config.max_backoff,
+                headers=upload_config.headers,
+            )
+            if upload_config.enabled
+            else None,
+            **kwargs,
+        )
+
+    @property
+    def config(self) -> Config:
+        return self._config
+
+    @property
+    def metrics(self) -> StationMetrics:
+        return self._metrics
+
+    @property
+    def session(self) -> SessionResults | None:
+        return self._session
+
+    def close(self):
+        if self._result_store is not None:
+            self._result_store.close()
+        if self._checkpoint_store is not None:
+            self._checkpoint_store.close()
+        if self._upload_queue is not None:
+            self._upload_queue.close(self._config.upload.timeout)
+
+    def record(self, record: DutRecord) -> None:
+        """
+        Stores a DUT record, and queues it for upload if enabled
+        """
+        if self._session is not None:
+            self._session.append(record)
+        if self._result_store is not None:
+            self._result_store.record(record)
+        if self._upload_queue is not None:
+            self._upload_queue.record(record)
+
+    def write_metrics(self):
+        if self._config.metrics_file:
+            self._metrics.write_prometheus(self._config.metrics_file)
+
+    def power_on_batch(self, devices: dict[str, DeviceInfo]) -> None:
+        """
+        Powers every device on at once if the config asks for it, logging those that stay off
+        @param devices: devices keyed by slot name
+        """
+        if not self._config.batch_power_on:
+            return
+
+        for slot, result in power_on_all(devices).items():
+            if not (result.ok and result.response):
+                self._logger.warning(
+                    f"{slot} did not power on: {result.error or 'still off'}"
+                )
+
+    def update_firmware(
+        self, duts: dict[str, DeviceInfo], observers: dict[str, Observer] = None
+    ) -> dict[str, FirmwareUpdateReport]:
+        """
+        Flashes every DUT below the minimum firmware version, all slots at once
+        @param duts: DUTs keyed by slot name
+        @param observers: observer to tell about each slot's update
+        @return: update reports keyed by slot, empty if updates are disabled or there is no
+        flasher
+        """
+        update_config = self._config.firmware_update
+        if not update_config.enabled or self._flasher is None or not duts:
+            return {}
+
+        observers = {} if observers is None else observers
+        images = {}
+        for target in TARGETS:
+            path = getattr(update_config, f"{target}_image")
+            version = getattr(update_config, f"{target}_version")
+            if path and version is not None:
+                images[target] = self._firmware_images.get(target, path, version)
+        min_versions = {
+            "mcu": self._config.tests.firmware.min_mcu_version,
+            "nordic": self._config.tests.firmware.min_nordic_version,
+        }
+
+        def update(slot: str, dut: DeviceInfo) -> FirmwareUpdateReport:
+            report = update_firmware(
+                slot,
+                dut,
+                images,
+                min_versions,
+                self._flasher,
+                update_config.chunk_size,
+                update_config.reboot_timeout,
+            )
+            observer = observers.get(slot)
+            if observer is not None and report.updated:
+                rates = ", ".join(
+                    f"{flash.target} {flash.to_version} at "
+                    f"{flash.throughput / 1024:.1f} KiB/s"
+                    for flash in report.flashed
+                )
+                observer.update(
+                    None,
+                    Message(
+                        "running" if report.verified else "fail",
+                        "firmware_update",
+                        f"Updated {rates}"
+                        if report.verified
+                        else f"Firmware update failed: {report.error or report.versions}",
+                    ),
+                )
+            return report
+
+        with ThreadPoolExecutor(
+            min(update_config.max_parallel, len(duts)),
+            thread_name_prefix="firmware_update",
+        ) as executor:
+            futures = {
+                slot: executor.submit(update, slot, dut) for slot, dut in duts.items()
+            }
+        return {slot: future.result() for slot, future in futures.items()}
+
+    def open_transcript(self, concurrent: bool = False) -> TranscriptWriter | None:
+        """
+        @param concurrent: whether the batch tests several slots at once
+        @return: a transcript for the batch, or None if transcripts are off
+        """
+        if not self._config.transcript_dir:
+            return None
+        if concurrent:
+            # Slots would interleave on the reference and Arduino, which replay cannot untangle
+            self._logger.warning("Not recording a transcript of a concurrent batch")
+            return None
+
+        transcript_dir = Path(self._config.transcript_dir)
+        transcript_dir.mkdir(parents=True, exist_ok=True)
+        return TranscriptWriter(
+            transcript_dir / f"batch-{time.strftime('%Y%m%d-%H%M%S')}.jsonl.gz"
+        )
+
+    def run_batch(
+        self,
+        ref: DeviceInfo,
+        duts: dict[str, DeviceInfo],
+        observers: dict[str, Observer] = None,
+        on_result: Callable[[SlotResult], None] = None,
+        parallel: bool = False,
+        on_test: Callable[[str, DeviceTest, list[TestInfo]], None] = None,
+        retest_failed: bool = False,
+        warm: dict[str, WarmDut] = None,
+    ) -> list[SlotResult]:
+        """
+        Tests each DUT in the batch
+        @param ref: reference device
+        @param duts: DUTs keyed by slot name
+        @param observers: observer to attach to each slot's tests
+        @param on_result: called as each slot finishes
+        @param parallel: test all slots at once, taking turns on the reference and Arduino
+        @param on_test: called with the slot, test and its results as each test finishes
+        @param retest_failed: only rerun the tests each DUT failed or did not reach last time
+        @param warm: DUTs already warmed up, keyed by slot, whose reads the tests reuse
+        @return: results of each slot, in slot order
+        """
+        observers = {} if observers is None else observers
+        warm = {} if warm is None else dict(warm)
+        firmware_updates = self.update_firmware(duts, observers)
+        for slot, report in firmware_updates.items():
+            if report.updated:
+                # Versions read while warming up are out of date
+                warm.pop(slot, None)
+        test_order = plan_batch_order(
+            self._config.tests.order, self._config.stop_on_fail
+        )
+
+        self.power_on_batch({**duts, REFERENCE: ref})
+
+        # Read together up front, rather than by each slot in turn
+        identities = (
+            read_identities(
+                {slot: dut for slot, dut in duts.items() if slot not in warm}
+            )
+            if self._checkpoint_store is not None and self._config.checkpoints.enabled
+            else {}
+        )
+
+        concurrent = parallel and len(duts) > 1
+        transcript = self.open_transcript(concurrent)
+        arduino_factory = self._arduino_factory
+        if transcript is not None:
+            transcript.record_device(ref, "reference")
+            arduino_factory = transcript.arduino_factory
+
+        leases = ResourceLeases(metrics=self._metrics) if parallel else None
+
+        def run(slot: str, dut: DeviceInfo) -> SlotResult:
+            try:
+                slot_result = self.run_slot(
+                    ref,
+                    slot,
+                    dut,
+                    test_order,
+                    observers.get(slot),
+                    arduino_factory,
+                    transcript,
+                    leases,
+                    on_test,
+                    retest_failed,
+                    warm.get(slot),
+                    identities.get(slot),
+                )
+            except Exception as e:
+                # Reported as a failed slot, so it does not take the other slots' results with it
+                self._logger.exception(f"{slot} failed to run")
+                slot_result = failed_result(
+                    slot, dut, "slot", {"exception": repr(e)}, SLOT_ERROR_CODE
+                )
+            slot_result.firmware_update = firmware_updates.get(slot)
+            if on_result is not None:
+                on_result(slot_result)
+            return slot_result
+
+        try:
+            if concurrent:
+                with ThreadPoolExecutor(
+                    len(duts), thread_name_prefix="slot"
+                ) as executor:
+                    futures = [
+                        executor.submit(run, slot, dut) for slot, dut in duts.items()
+                    ]
+                slot_results = [future.result() for future in futures]
+            else:
+                slot_results = [run(slot, dut) for slot, dut in duts.items()]
+        finally:
+            if transcript is not None:
+                transcript.close()
+
+            self.write_metrics()
+
+        return slot_results
+
+    def run_slot(
+        self,
+        ref: DeviceInfo,
+        slot: str,
+        dut: DeviceInfo,
+        test_order: list[str] | None = None,
+        observer: Observer = None,
+        arduino_factory: Callable[[str], RFATEArduino] = None,
+        transcript: TranscriptWriter = None,
+        leases: ResourceLeases = None,
+        on_test: Callable[[str, DeviceTest, list[TestInfo]], None] = None,
+        retest_failed: bool = False,
+        warm: WarmDut = None,
+        identity: DutIdentity = None,
+    ) -> SlotResult:
+        with dispatching(
+            observer, self._config.observer_dispatch, f"observer-{slot}"
+        ) as observer:
+            plan = self.plan_slot(
+                ref,
+                slot,
+                dut,
+                test_order,
+                observer,
+                arduino_factory,
+                transcript,
+                leases,
+                on_test,
+                retest_failed,
+                warm,
+                identity=identity,
+            )
+
+            started_at = time.time()
+            results = [*plan.skipped, *plan.test_handler.execute_tests()]
+            finished_at = time.time()
+
+        return self.finish_slot(plan, results, started_at, finished_at)
+
+    def plan_slot(
+        self,
+        ref: DeviceInfo,
+        slot: str,
+        dut: DeviceInfo,
+        test_order: list[str] | None = None,
+        observer: Observer = None,
+        arduino_factory: Callable[[str], RFATEArduino] = None,
+        transcript: TranscriptWriter = None,
+        leases: ResourceLeases = None,
+        on_test: Callable[[str, DeviceTest, list[TestInfo]], None] = None,
+        retest_failed: bool = False,
+        warm: WarmDut = None,
+        asynchronous: bool = False,
+        identity: DutIdentity = None,
+    ) -> SlotPlan:
+        """
+        Picks a profile and builds the slot's tests, dropping any that are checkpointed
+        @param asynchronous: build the tests' async variants, for the asyncio engine
+        @param identity: the DUT's identity, if already read
+        @return: plan to execute, then pass to `finish_slot`
+        """
+        profile, reason = self._profile_selector.select()
+        self._logger.info(f"Running profile `{profile}` on {slot} ({reason})")
+
+        if transcript is not None:
+            transcript.record_device(dut, slot)
+            transcript.record_plan(
+                slot,
+                stop_on_fail=self._config.stop_on_fail,
+                order=test_order,
+                profile=profile,
+            )
+
+        test_handler = test_factory(
+            ref,
+            dut,
+            self._config,
+            self._config.stop_on_fail,
+            test_order,
+            profile,
+            self._metrics,
+            self._arduino_factory if arduino_factory is None else arduino_factory,
+            warm,
+            asynchronous,
+        )
+        if observer is not None:
+            test_handler.add_observer(observer)
+
+        checkpoint_identity = None
+        skipped = []
+        if self._checkpoint_store is not None and self._config.checkpoints.enabled:
+            if warm is not None:
+                checkpoint_identity = warm.identity
+            elif identity is not None:
+                checkpoint_identity = identity
+            else:
+                checkpoint_identity = read_identity(dut)
+            skipped = self._skip_checkpointed(
+                test_handler, checkpoint_identity, retest_failed, observer
+            )
+
+        for test in all_tests(test_handler.tests):
+            if checkpoint_identity is not None:
+                _checkpoint_test(test, checkpoint_identity, self._checkpoint_store)
+            if leases is not None and test in test_handler.tests:
+                leases.guard_test(test)
+            if on_test is not None:
+                _report_test(test, slot, on_test)
+
+        return SlotPlan(slot, dut, profile, test_handler, skipped, checkpoint_identity)
+
+    def finish_slot(
+        self,
+        plan: SlotPlan,
+        results: list[TestInfo],
+        started_at: float,
+        finished_at: float,
+    ) -> SlotResult:
+        """
+        Records the results of an executed plan
+        @param results: checkpointed results followed by those of the tests that ran
+        """
+        identity = read_identity(plan.dut)
+        self._profile_selector.record(results)
+
+        if plan.checkpoint_identity is not None:
+            self._checkpoint_store.complete(
+                plan.checkpoint_identity, all(result.passed for result in results)
+            )
+
+        if any(
+            sink is not None
+            for sink in (self._result_store, self._upload_queue, self._session)
+        ):
+            self.record(
+                DutRecord.from_test_handler(
+                    plan.slot,
+                    identity,
+                    plan.test_handler,
+                    results,
+                    started_at,
+                    finished_at,
+                    plan.profile,
+                )
+            )
+
+        return SlotResult(
+            plan.slot,
+            plan.dut,
+            results,
+            plan.profile,
+            identity,
+            started_at,
+            finished_at,
+        )
+
+    def _skip_checkpointed(
+        self,
+        test_handler,
+        identity: DutIdentity,
+        retest_failed: bool,
+        observer: Observer = None,
+    ) -> list[TestInfo]:
+        """
+        Removes tests the DUT already passed, with the same parameters, from the plan
+        @return: the checkpointed results of the removed tests
+        """
+        checkpoint_config = self._config.checkpoints
+        checkpoints = self._checkpoint_store.load(
+            identity,
+            checkpoint_config.retest_window
+            if retest_failed
+            else checkpoint_config.resume_window,
+            include_complete=retest_failed,
+        )
+
+        skipped = []
+
+        def skip(test: DeviceTest) -> bool:
+            checkpoint = checkpoints.get(test.name)
+            if (
+                checkpoint is None
+                or not checkpoint.passed
+                or checkpoint.params != dumps(getattr(test, "_test_params", {}))
+            ):
+                return False
+
+            skipped.extend(checkpoint.results)
+            age = time.time() - checkpoint.finished_at
+            self._logger.info(f"Skipping `{test.name}`, passed {age:.0f}s ago")
+            if observer is not None:
+                observer.update(
+                    test,
+                    Message("pass", test.name, f"Passed {age:.0f}s ago, skipped"),
+                )
+            return True
+
+        remaining = []
+        for test in test_handler.tests:
+            window_tests = getattr(test, "window_tests", None)
+            if window_tests:
+                window_tests[:] = [
+                    window_test for window_test in window_tests if not skip(window_test)
+                ]
+
+            if not skip(test):
+                remaining.append(test)
+            elif window_tests:
+                # Nothing to hide them behind, so they run in turn instead
+                remaining.extend(window_tests)
+                window_tests.clear()
+
+        test_handler.tests = remaining
+        return skipped
+
+
+def failed_result(
+    slot: str, dut: DeviceInfo, name: str, info: dict, error_code: str
+) -> SlotResult:
+    """
+    @return: result of a slot that could not be tested, as a single failed test
+    """
+    result = TestInfo(name, False, info=info)
+    result.error_code = error_code
+    now = time.time()
+    return SlotResult(slot, dut, [result], "", started_at=now, finished_at=now)
+
+
+def _checkpoint_test(
+    test: DeviceTest, identity: DutIdentity, checkpoint_store: CheckpointStore
+) -> None:
+    wrap_execute(
+        test,
+        after=lambda results: checkpoint_store.save(
+            identity,
+            test.name,
+            getattr(test, "_test_params", {}),
+            own_results(test, results),
+        ),
+    )
+
+
+def _report_test(
+    test: DeviceTest,
+    slot: str,
+    on_test: Callable[[str, DeviceTest, list[TestInfo]], None],
+) -> None:
+    wrap_execute(
+        test, after=lambda results: on_test(slot, test, own_results(test, results))
+    )
@@ -0,0 +1,171 @@
+# Prepares DUTs inserted into free slots between batches
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from functional_test_core.models import DeviceInfo
+from rode.core.custom_exceptions import ErrorStatus, NackStatus
+
+from filmmaker_rf_ate.config import Config
+from filmmaker_rf_ate.utils.device_tracker import DEFAULT_SLOTS, DeviceTracker
+from filmmaker_rf_ate.utils.warm_up import WarmDut, warm_up
+
+
+class WarmUp:
+    """
+    Polls for DUTs in free slots between batches and warms each new one up on a background
+    thread, so the next batch starts with power on and the version and identity reads already
+    done. Polling pauses from `take` until every slot of the batch is released, and a released
+    DUT is not warmed up again until it is replaced.
+    """
+
+    def __init__(
+        self,
+        config: Config,
+        slots: tuple[str, ...] = DEFAULT_SLOTS,
+        poll_interval: float = None,
+        max_age: float = 600.0,
+        devices: DeviceTracker = None,
+    ):
+        """
+        @param devices: tracker to scan with, shared with whatever else polls the devices.
+        Defaults to a new one, closed on `stop`.
+        """
+        self._slots = slots
+        self._poll_interval = (
+            config.hot_swap_poll_interval if poll_interval is None else poll_interval
+        )
+        self._max_age = max_age
+        self._owns_devices = devices is None
+        self._devices = DeviceTracker(config, slots) if devices is None else devices
+        self._condition = threading.Condition()
+        self._warm: dict[str, WarmDut] = {}
+        self._warming: set[str] = set()
+        self._busy: set[str] = set()
+        self._tested: dict[str, str | None] = {}
+        self._executor: ThreadPoolExecutor | None = None
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._logger = logging.getLogger("warm_up")
+
+    def start(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+
+        self._stop.clear()
+        self._executor = ThreadPoolExecutor(
+            len(self._slots), thread_name_prefix="warm_up"
+        )
+        self._thread = threading.Thread(
+            target=self._poll_loop, name="warm_up_poll", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        if self._executor is not None:
+            # Warm ups in progress still hold their DUTs
+            self._executor.shutdown(wait=True, cancel_futures=True)
+        with self._condition:
+            self._warm.clear()
+            self._warming.clear()
+        if self._owns_devices:
+            self._devices.close()
+
+    def take(self, duts: dict[str, DeviceInfo]) -> dict[str, WarmDut]:
+        """
+        Marks the slots of a batch busy, pausing polling, and hands over what was read ahead of
+        their DUTs. Waits for warm ups still in progress on those DUTs, so they are not sent
+        commands by the warm up and the tests at once.
+        @param duts: every DUT in the batch, keyed by slot
+        @return: warmed up DUTs keyed by slot, for the slots that have been warmed up recently
+        """
+        with self._condition:
+            self._busy.update(duts)
+            self._condition.wait_for(lambda: not self._warming & set(duts))
+
+            now = time.time()
+            warm = {}
+            for slot, dut in duts.items():
+                warm_dut = self._warm.pop(slot, None)
+                if (
+                    warm_dut is not None
+                    and warm_dut.dut is dut
+                    and now - warm_dut.warmed_at <= self._max_age
+                ):
+                    warm[slot] = warm_dut
+            return warm
+
+    def release(self, slot: str, dut: DeviceInfo = None) -> None:
+        """
+        Frees a slot after its run. The DUT that was tested is not warmed up again.
+        """
+        with self._condition:
+            self._busy.discard(slot)
+            self._tested[slot] = (
+                None if dut is None else getattr(dut.rode_device, "serial_number", None)
+            )
+
+    def _poll_loop(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self.poll()
+            except Exception:
+                self._logger.exception("Device poll failed")
+            self._stop.wait(self._poll_interval)
+
+    def poll(self) -> None:
+        with self._condition:
+            if self._busy:
+                return
+            warming = set(self._warming)
+
+        ref, duts = self._devices.scan(warming)
+        if ref is None:
+            return
+
+        with self._condition:
+            if self._busy:
+                return
+
+            for slot in self._slots:
+                if slot in self._warming:
+                    continue
+
+                dut = duts.get(slot)
+                if dut is None:
+                    # Removed, so whatever is inserted next is new
+                    self._warm.pop(slot, None)
+                    self._tested.pop(slot, None)
+                    continue
+
+                serial = getattr(dut.rode_device, "serial_number", None)
+                if slot in self._tested and (
+                    self._tested[slot] is None or self._tested[slot] == serial
+                ):
+                    continue
+
+                warm_dut = self._warm.get(slot)
+                if warm_dut is not None and warm_dut.dut is dut:
+                    continue
+
+                self._warm.pop(slot, None)
+                self._warming.add(slot)
+                self._executor.submit(self._warm_up, slot, dut)
+
+    def _warm_up(self, slot: str, dut: DeviceInfo) -> None:
+        warm_dut = None
+        try:
+            warm_dut = warm_up(dut)
+        except (OSError, NackStatus, ErrorStatus) as e:
+            self._logger.warning(f"Failed to warm up {slot}: {e}")
+        finally:
+            with self._condition:
+                self._warming.discard(slot)
+                if warm_dut is not None:
+                    self._warm[slot] = warm_dut
+                    self._logger.info(f"{slot} warmed up ({warm_dut.identity.serial})")
+                self._condition.notify_all()
@@ -0,0 +1,510 @@
+# Runs each slot in its own process, so a crash in one slot leaves the others running
+import copy
+import logging
+import multiprocessing
+import os
+import threading
+import time
+import traceback
+from dataclasses import dataclass
+from typing import Callable
+
+from functional_test_core.device_test import DeviceTest
+from functional_test_core.device_test.observer import Message, Observable, Observer
+from functional_test_core.models import DeviceInfo, TestInfo
+
+from filmmaker_rf_ate.config import Config
+from filmmaker_rf_ate.results import CheckpointStore, DutRecord
+from filmmaker_rf_ate.station.leases import REFERENCE, RESOURCES, ResourceLeases
+from filmmaker_rf_ate.station.slot_status import (
+    SlotState,
+    SlotStatus,
+    SlotStatusBlock,
+)
+from filmmaker_rf_ate.station.station import SlotResult, Station, failed_result
+from filmmaker_rf_ate.tests.test_order import plan_batch_order
+from filmmaker_rf_ate.utils.device_tracker import DeviceTracker
+from filmmaker_rf_ate.utils.instrumentation import StationMetrics
+
+WORKER_ERROR_CODE = "W"
+
+# Opens a worker's device handles, given the slots and the worker's own slot
+DeviceSource = Callable[[Config, tuple[str, ...], str], DeviceTracker]
+
+
+def slot_devices(config: Config, slots: tuple[str, ...], slot: str) -> DeviceTracker:
+    """
+    Default device source, keeping handles to the reference and the DUT in the worker's slot only
+    """
+    return DeviceTracker(config, slots, tracked=(slot,))
+
+
+def _lease_bits(resource: str) -> tuple[int, int]:
+    """
+    @return: status bits set while a slot is acquiring or holding the resource, and while it
+    holds it
+    """
+    bit = RESOURCES.index(resource)
+    return 1 << bit, 1 << (bit + len(RESOURCES))
+
+
+@dataclass
+class TestSummary:
+    """
+    What the station process gets to see of a test run in a worker
+    """
+
+    name: str
+    error_code: str
+    timing: dict | None = None
+
+
+class _TrackedLock:
+    """
+    Cross process lock that records in the status block whether the slot may hold it, so the
+    station can free it if the worker dies holding it. The acquiring bit is set before
+    acquiring and cleared after releasing, and the held bit is set in between.
+    """
+
+    def __init__(self, lock, status: SlotStatusBlock, index: int, resource: str):
+        self._lock = lock
+        self._status = status
+        self._index = index
+        self._acquiring, self._held = _lease_bits(resource)
+
+    def _update(self, set_bits: int = 0, clear_bits: int = 0) -> None:
+        with self._status.lock:
+            leases = self._status.read(self._index).leases
+            self._status.write(self._index, leases=(leases | set_bits) & ~clear_bits)
+
+    def acquire(self):
+        self._update(set_bits=self._acquiring)
+        self._lock.acquire()
+        self._update(set_bits=self._held)
+
+    def release(self):
+        self._update(clear_bits=self._held)
+        self._lock.release()
+        self._update(clear_bits=self._acquiring)
+
+
+class _ForwardEvents(Observer):
+    def __init__(self, slot: str, index: int, events, status: SlotStatusBlock):
+        super().__init__()
+        self._slot = slot
+        self._index = index
+        self._events = events
+        self._status = status
+
+    def update(self, observable: Observable, message: Message, *args, **kwargs):
+        self._status.write(
+            self._index, test=message.name or "", message=message.content or ""
+        )
+        self._events.put(
+            ("message", self._slot, message.status, message.name, message.content)
+        )
+
+
+class _ForwardRecords:
+    """
+    Result store stand in that hands records to the station process, which owns the databases
+    """
+
+    def __init__(self, slot: str, events):
+        self._slot = slot
+        self._events = events
+
+    def record(self, record: DutRecord) -> None:
+        self._events.put(("record", self._slot, record))
+
+    def close(self):
+        pass
+
+
+def _worker_main(
+    slot: str,
+    index: int,
+    slots: tuple[str, ...],
+    config: Config,
+    device_source: DeviceSource,
+    commands,
+    events,
+    status_name: str,
+    locks: dict,
+    station_kwargs: dict,
+) -> None:
+    status = SlotStatusBlock(len(slots), status_name)
+    status.write(index, state=SlotState.IDLE, pid=os.getpid(), leases=0)
+    devices = device_source(config, slots, slot)
+
+    config = copy.copy(config)
+    # Each worker would otherwise overwrite the station's metrics and transcript files
+    config.metrics_file = None
+    config.transcript_dir = None
+    station = Station(
+        config,
+        _ForwardRecords(slot, events),
+        checkpoint_store=CheckpointStore(config.results_db)
+        if config.checkpoints.enabled
+        else None,
+        # Drained after each batch and merged into the station's metrics
+        metrics=StationMetrics(),
+        **station_kwargs,
+    )
+    leases = ResourceLeases(
+        metrics=station.metrics,
+        locks={
+            resource: _TrackedLock(lock, status, index, resource)
+            for resource, lock in locks.items()
+        },
+    )
+    observer = _ForwardEvents(slot, index, events, status)
+
+    def on_test(slot: str, test: DeviceTest, results: list[TestInfo]) -> None:
+        with status.lock:
+            status.write(index, tests_done=status.read(index).tests_done + 1)
+        events.put(
+            (
+                "test",
+                slot,
+                TestSummary(test.name, test.error_code, getattr(test, "timing", None)),
+                results,
+            )
+        )
+
+    events.put(("ready", slot, os.getpid()))
+    try:
+        while True:
+            command = commands.get()
+            if command is None:
+                break
+
+            batch, retest_failed = command
+            status.write(
+                index, state=SlotState.RUNNING, tests_done=0, test="", message=""
+            )
+            try:
+                ref, duts = devices.scan()
+                dut = duts.get(slot)
+                if ref is None or dut is None:
+                    raise LookupError(f"No DUT found in {slot}")
+
+                firmware_updates = station.update_firmware(
+                    {slot: dut}, {slot: observer}
+                )
+                # Other workers share the reference, so it is powered on under its lease
+                with leases.lease(REFERENCE):
+                    station.power_on_batch({slot: dut, REFERENCE: ref})
+                slot_result = station.run_slot(
+                    ref,
+                    slot,
+                    dut,
+                    plan_batch_order(config.tests.order, config.stop_on_fail),
+                    observer,
+                    leases=leases,
+                    on_test=on_test,
+                    retest_failed=retest_failed,
+                )
+                slot_result.firmware_update = firmware_updates.get(slot)
+                # Devices stay in the worker
+                slot_result.dut = None
+                error = None
+            except Exception:
+                slot_result = None
+                error = traceback.format_exc()
+
+            passed = slot_result is not None and slot_result.passed
+            status.write(index, state=SlotState.PASSED if passed else SlotState.FAILED)
+            events.put(
+                ("result", slot, batch, slot_result, error, station.metrics.drain())
+            )
+    finally:
+        station.close()
+        devices.close()
+        status.write(index, state=SlotState.STOPPED)
+        status.close()
+
+
+class _Worker:
+    def __init__(self, process: multiprocessing.Process, commands):
+        self.process = process
+        self.commands = commands
+        self.restarts = 0
+
+
+class WorkerPool:
+    """
+    One worker process per slot, each running its slot's tests against its own device handles.
+    Workers stream messages, test results and DUT records back over a queue, and publish live
+    status to a shared memory block. The station process keeps the result store, upload queue
+    and metrics. A worker that dies is reported as a failed slot, any shared hardware it held is
+    freed, and it is restarted before the next batch.
+    """
+
+    def __init__(
+        self,
+        station: Station,
+        slots: tuple[str, ...],
+        device_source: DeviceSource = slot_devices,
+        station_kwargs: dict = None,
+    ):
+        """
+        @param station: station that records the workers' results
+        @param slots: slot names, one worker each
+        @param device_source: module level function a worker calls once to get the tracker it
+        finds its devices with. The tracker is scanned before each batch and closed when the
+        worker stops.
+        @param station_kwargs: extra arguments for each worker's Station, e.g. its Arduino
+        factory. Must be picklable.
+        """
+        self._station = station
+        self._config = station.config
+        self._slots = tuple(slots)
+        self._device_source = device_source
+        self._station_kwargs = {} if station_kwargs is None else station_kwargs
+        self._context = multiprocessing.get_context("spawn")
+        self._events = self._context.Queue()
+        self._locks = {resource: self._context.Lock() for resource in RESOURCES}
+        self._status: SlotStatusBlock | None = None
+        self._workers: dict[str, _Worker] = {}
+        self._reader: threading.Thread | None = None
+        self._lock = threading.Lock()
+        self._results = threading.Condition(self._lock)
+        self._batch = 0
+        self._pending: dict[str, tuple] = {}
+        self._observers: dict[str, Observer] = {}
+        self._on_test: Callable[[str, TestSummary, list[TestInfo]], None] | None = None
+        self._logger = logging.getLogger("worker_pool")
+
+    @property
+    def slots(self) -> tuple[str, ...]:
+        return self._slots
+
+    def start(self) -> "WorkerPool":
+        self._status = SlotStatusBlock(len(self._slots))
+        self._reader = threading.Thread(
+            target=self._read_events, name="worker_events", daemon=True
+        )
+        self._reader.start()
+        for slot in self._slots:
+            self._start_worker(slot)
+        return self
+
+    def stop(self) -> None:
+        for worker in self._workers.values():
+            if worker.process.is_alive():
+                worker.commands.put(None)
+        for worker in self._workers.values():
+            worker.process.join(self._config.workers.stop_timeout)
+            if worker.process.is_alive():
+                worker.process.terminate()
+                worker.process.join()
+        self._workers.clear()
+
+        self._events.put(None)
+        self._reader.join()
+        self._status.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def status(self, slot: str) -> SlotStatus:
+        """
+        @return: the slot's live status, read straight from shared memory
+        """
+        return self._status.read(self._slots.index(slot))
+
+    def is_alive(self, slot: str) -> bool:
+        worker = self._workers.get(slot)
+        return worker is not None and worker.process.is_alive()
+
+    def restart(self, slot: str) -> None:
+        """
+        Replaces a slot's worker with a fresh process, killing the old one if it is still running
+        """
+        worker = self._workers.get(slot)
+        restarts = 0
+        if worker is not None:
+            restarts = worker.restarts + 1
+            if worker.process.is_alive():
+                worker.process.terminate()
+            worker.process.join()
+            self._release_leases(slot)
+
+        self._start_worker(slot)
+        self._workers[slot].restarts = restarts
+
+    def _start_worker(self, slot: str) -> None:
+        index = self._slots.index(slot)
+        commands = self._context.Queue()
+        process = self._context.Process(
+            target=_worker_main,
+            args=(
+                slot,
+                index,
+                self._slots,
+                self._config,
+                self._device_source,
+                commands,
+                self._events,
+                self._status.name,
+                self._locks,
+                self._station_kwargs,
+            ),
+            name=f"slot-{slot}",
+            daemon=True,
+        )
+        process.start()
+        self._workers[slot] = _Worker(process, commands)
+
+    def _release_leases(self, slot: str) -> None:
+        index = self._slots.index(slot)
+        leases = self._status.read(index).leases
+        for resource in RESOURCES:
+            acquiring, held = _lease_bits(resource)
+            if leases & held or (
+                leases & acquiring and self._held_by_dead(index, resource)
+            ):
+                self._logger.warning(f"Freeing `{resource}` held by dead {slot} worker")
+                self._locks[resource].release()
+        self._status.write(index, state=SlotState.CRASHED, leases=0)
+
+    def _held_by_dead(self, index: int, resource: str, timeout: float = 1) -> bool:
+        """
+        Works out whether a worker that died between setting its acquiring bit and its held bit,
+        or between clearing them, took the lock with it
+        @return: True if the lock stays taken for `timeout` seconds without another slot
+        recording that it holds it
+        """
+        lock = self._locks[resource]
+        _, held = _lease_bits(resource)
+        others = [i for i in range(len(self._slots)) if i != index]
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if lock.acquire(block=False):
+                lock.release()
+                return False
+            if any(self._status.read(i).leases & held for i in others):
+                return False
+            time.sleep(0.01)
+        return True
+
+    def _read_events(self) -> None:
+        while True:
+            event = self._events.get()
+            if event is None:
+                return
+
+            kind, slot, *payload = event
+            try:
+                if kind == "message":
+                    observer = self._observers.get(slot)
+                    if observer is not None:
+                        observer.update(None, Message(*payload))
+                elif kind == "test":
+                    if self._on_test is not None:
+                        self._on_test(slot, *payload)
+                elif kind == "record":
+                    self._station.record(*payload)
+                elif kind == "result":
+                    batch, slot_result, error, metrics = payload
+                    self._station.metrics.merge(metrics)
+                    with self._results:
+                        if batch == self._batch:
+                            self._pending[slot] = (slot_result, error)
+                            self._results.notify_all()
+                elif kind == "ready":
+                    self._logger.info(f"{slot} worker started, pid {payload[0]}")
+            except Exception:
+                self._logger.exception(f"Failed to handle `{kind}` from {slot} worker")
+
+    def run_batch(
+        self,
+        duts: dict[str, DeviceInfo],
+        observers: dict[str, Observer] = None,
+        on_result: Callable[[SlotResult], None] = None,
+        on_test: Callable[[str, TestSummary, list[TestInfo]], None] = None,
+        retest_failed: bool = False,
+    ) -> list[SlotResult]:
+        """
+        Tests the DUTs in the given slots, each in its slot's worker. Dead workers are restarted
+        first.
+        @param duts: DUTs keyed by slot name. Workers open their own handles, so these only label
+        the results.
+        @param observers: observer to pass each slot's messages to
+        @param on_result: called as each slot finishes
+        @param on_test: called with the slot, a summary of the test and its results as each test
+        finishes
+        @param retest_failed: only rerun the tests each DUT failed or did not reach last time
+        @return: results of each slot, in slot order
+        """
+        for slot in duts:
+            if not self.is_alive(slot):
+                self.restart(slot)
+
+        with self._results:
+            self._batch += 1
+            batch = self._batch
+            self._pending = {}
+            self._observers = {} if observers is None else dict(observers)
+            self._on_test = on_test
+
+        for slot in duts:
+            self._workers[slot].commands.put((batch, retest_failed))
+
+        slot_results = {}
+        dead_since: dict[str, float] = {}
+        while len(slot_results) < len(duts):
+            with self._results:
+                self._results.wait(0.5)
+                finished = dict(self._pending)
+
+            for slot, dut in duts.items():
+                if slot in slot_results:
+                    continue
+
+                if slot in finished:
+                    slot_result, error = finished[slot]
+                    if slot_result is None:
+                        slot_result = failed_result(
+                            slot, dut, "worker", {"exception": error}, WORKER_ERROR_CODE
+                        )
+                    slot_result.dut = dut
+                elif not self.is_alive(slot):
+                    # Give the reader a moment for a result sent just before the worker exited
+                    if (
+                        time.monotonic() - dead_since.setdefault(slot, time.monotonic())
+                        < 1
+                    ):
+                        continue
+
+                    exitcode = self._workers[slot].process.exitcode
+                    self._logger.error(f"{slot} worker died with exit code {exitcode}")
+                    self._release_leases(slot)
+                    slot_result = failed_result(
+                        slot,
+                        dut,
+                        "worker_crashed",
+                        {"exitcode": exitcode},
+                        WORKER_ERROR_CODE,
+                    )
+                    observer = self._observers.get(slot)
+                    if observer is not None:
+                        observer.update(
+                            None,
+                            Message(
+                                "fail", "worker", f"Worker died (exit code {exitcode})"
+                            ),
+                        )
+                else:
+                    continue
+
+                slot_results[slot] = slot_result
+                if on_result is not None:
+                    on_result(slot_result)
+
+        self._station.write_metrics()
+        return [slot_results[slot] for slot in duts]
@@ -0,0 +1,120 @@
+# Device tests whose phases can be awaited, so many DUTs can share one event loop
+import asyncio
+import traceback
+
+from functional_test_core.device_test import DeviceTest
+from functional_test_core.models import DeviceInfo, TestInfo
+from rode.devices.common.commands.basic_commands import CommonCommands
+from rode.devices.wireless.commands.app_commands import AppCommands
+
+from filmmaker_rf_ate.utils.async_command import async_command
+from filmmaker_rf_ate.utils.instrumentation import (
+    async_sleep,
+    bind_context,
+    record_retry,
+)
+
+
+async def run_blocking(function, *args):
+    """
+    Runs a blocking function on the loop's executor, accounted to the running test
+    """
+    return await asyncio.get_running_loop().run_in_executor(
+        None, bind_context(function), *args
+    )
+
+
+def _bridged(phase: str):
+    async def routine(self):
+        return await run_blocking(getattr(self, phase))
+
+    routine.__name__ = f"{phase}_async"
+    # Marks phases that run the sync phase on a thread, which is already instrumented
+    routine.bridged = True
+    return routine
+
+
+class AsyncDeviceTest(DeviceTest):
+    """
+    DeviceTest with awaitable phases. Each async phase defaults to running its sync counterpart on
+    an executor, so a subclass only overrides the phases that spend their time waiting.
+    """
+
+    pre_test_routine_async = _bridged("pre_test_routine")
+    test_routine_async = _bridged("test_routine")
+    post_test_routine_async = _bridged("post_test_routine")
+
+    async def execute_test_async(self) -> list[TestInfo]:
+        try:
+            await self.pre_test_routine_async()
+            results = await self.test_routine_async()
+        except Exception:
+            results = [
+                TestInfo(self.name, False, info={"exception": traceback.format_exc()})
+            ]
+
+        try:
+            await self.post_test_routine_async()
+        except Exception:
+            results.append(
+                TestInfo(
+                    f"{self.name}_teardown",
+                    False,
+                    info={"exception": traceback.format_exc()},
+                )
+            )
+
+        for result in results:
+            result.error_code = self.error_code
+
+        passed = all(result.passed for result in results)
+        self.notify_observers(
+            self._create_message(
+                "pass" if passed else "fail",
+                f"{self.name} {'passed' if passed else 'failed'}",
+            )
+        )
+        return results
+
+
+async def power_on_async(
+    devices: list[DeviceInfo], retries: int = 5, poll_interval: float = 1.0
+) -> None:
+    """
+    Turns devices on and waits, without blocking the loop, until they all report being on
+    """
+    for device in devices:
+        await async_command(device, AppCommands.set_system_state(True))
+
+    for i in range(retries):
+        try:
+            for device in devices:
+                assert await async_command(
+                    device, AppCommands.system_is_on()
+                ), f"{device.name_short or 'Device'} could not be powered on"
+            return
+        except (AssertionError, OSError):
+            if i + 1 >= retries:
+                raise
+
+            record_retry("power_on")
+            await async_sleep(poll_interval)
+
+
+async def wait_for_reset_async(
+    device: DeviceInfo, retries: int = 20, poll_interval: float = 1.0
+) -> None:
+    """
+    Resets a device and waits, without blocking the loop, until it answers again
+    """
+    await async_command(device, CommonCommands.reset())
+    for i in range(retries):
+        try:
+            await async_command(device, CommonCommands.app_version())
+            return
+        except OSError:
+            if i + 1 >= retries:
+                raise
+
+            record_retry("reset")
+            await async_sleep(poll_interval)
@@ -16,9 +16,11 @@ class BatteryTest(DeviceTest):
         wireless: DeviceInfo,
         initial_measurement_time: datetime | None = None,
         initial_battery_info: FuelGaugeData | None = None,
+        profile: str = None,
     ):
         super().__init__("battery", wireless, error_code="B")
         self._wireless = wireless
+        self._test_params = {"profile": profile}
         self._initial_timestamp = (
             datetime.now()
             if initial_measurement_time is None
@@ -1,13 +1,26 @@
-import time
 import traceback
+from statistics import mean
 from typing import Literal
 
 from functional_test_core.device_test import DeviceTest
+from functional_test_core.device_test.observer import Message, Observable, Observer
 from functional_test_core.models import DeviceInfo, TestInfo
 from rode.core.custom_exceptions import NackStatus, ErrorStatus
 from rode.devices.wireless.commands.app_commands import AppCommands
 from rode.devices.wireless.commands.radio_commands import RadioCommands
 
+from filmmaker_rf_ate.utils.async_command import submit_call
+from filmmaker_rf_ate.utils.retry import wait_until
+
+
+class _ForwardMessages(Observer):
+    def __init__(self, test: DeviceTest):
+        super().__init__()
+        self._test = test
+
+    def update(self, observable: Observable, message: Message, *args, **kwargs):
+        self._test.notify_observers(message)
+
 
 class ConnectionStatsTest(DeviceTest):
     def __init__(
@@ -19,7 +32,14 @@ class ConnectionStatsTest(DeviceTest):
         duration_long: int = 500,
         min_rssi: int = -95,
         allowed_errors: int = 1000,
+        windows: int = 1,
+        profile: str = None,
     ):
+        """
+        @param windows: take each measurement as this many back-to-back reads, storing each
+        window's readings alongside the totals
+        @param profile: test profile the parameters were chosen by
+        """
         super().__init__("connection_stats", wireless, error_code="C")
         self._dut = wireless
         self._reference = reference
@@ -28,12 +48,15 @@ class ConnectionStatsTest(DeviceTest):
         self._duration_long = duration_long
         self._min_rssi = min_rssi
         self._allowed_errors = allowed_errors
+        self._windows = windows
 
         self._test_params = {
             "duration_short": self._duration_short,
             "duration_long": self._duration_long,
             "min_rssi": self._min_rssi,
             "allowed_errors": self._allowed_errors,
+            "windows": self._windows,
+            "profile": profile,
         }
 
         if self._gender == "tx":
@@ -47,6 +70,75 @@ class ConnectionStatsTest(DeviceTest):
                 f"Unexpected gender `{self._gender}`, expected `rx` or `tx`"
             )
 
+        self.window_tests: list[DeviceTest] = []
+        self._window_stop_on_fail = True
+        self.window_results: list[TestInfo] = []
+        self._window_ran = False
+
+    def add_window_tests(
+        self, tests: list[DeviceTest], stop_on_fail: bool = True
+    ) -> None:
+        """
+        Runs tests on the DUT while the long measurement is in progress, hiding their time behind
+        it. Their results are returned after this test's own.
+        @param tests: tests to run, in order
+        @param stop_on_fail: skip the remaining tests once one fails
+        """
+        for test in tests:
+            test.add_observer(_ForwardMessages(self))
+        self.window_tests.extend(tests)
+        self._window_stop_on_fail = stop_on_fail
+
+    def _run_window_tests(self) -> None:
+        self._window_ran = True
+        for test in self.window_tests:
+            results = test.execute_test()
+            self.window_results.extend(results)
+            if self._window_stop_on_fail and not all(
+                result.passed for result in results
+            ):
+                break
+
+    def _measure(self, duration: int) -> list:
+        """
+        Reads connection stats over `duration` seconds, split into whole second windows
+        @return: stats of each window, in order
+        """
+        windows = max(min(self._windows, duration), 1)
+        return [
+            self._dut.rode_device.handle_command(
+                RadioCommands.radio_get_advanced_connection_stats(
+                    0, duration // windows + (i < duration % windows)
+                )
+            )
+            for i in range(windows)
+        ]
+
+    @staticmethod
+    def _window_info(info: dict, values: list) -> dict:
+        if len(values) > 1:
+            info["windows"] = {str(i): value for i, value in enumerate(values)}
+        return info
+
+    def execute_test(self) -> list[TestInfo]:
+        self.window_results = []
+        self._window_ran = False
+
+        results = super().execute_test()
+
+        # The measurement window was never reached
+        if (
+            self.window_tests
+            and not self._window_ran
+            and not (
+                self._window_stop_on_fail
+                and not all(result.passed for result in results)
+            )
+        ):
+            self._run_window_tests()
+
+        return [*results, *self.window_results]
+
     def pre_test_routine(self) -> None:
         self.notify_observers(
             self._create_message(
@@ -57,23 +149,15 @@ class ConnectionStatsTest(DeviceTest):
         self._dut.rode_device.handle_command(AppCommands.set_system_state(True))
         self._reference.rode_device.handle_command(AppCommands.set_system_state(True))
 
-        retries = 10
-        sleep_time = 1
-        for i in range(retries):
-            try:
-                assert self._dut.rode_device.handle_command(
-                    AppCommands.system_is_on()
-                ), "DUT could not be powered on"
-                assert self._reference.rode_device.handle_command(
-                    AppCommands.system_is_on()
-                ), "Reference could not be powered on"
-                return
-            except (AssertionError, OSError)as e:
-                if i + 1 >= retries:
-                    raise e
-
-                time.sleep(sleep_time)
-                continue
+        def powered_on():
+            assert self._dut.rode_device.handle_command(
+                AppCommands.system_is_on()
+            ), "DUT could not be powered on"
+            assert self._reference.rode_device.handle_command(
+                AppCommands.system_is_on()
+            ), "Reference could not be powered on"
+
+        wait_until(powered_on, "power_on", retries=10)
 
     def test_routine(self) -> list[TestInfo]:
         ret = []
@@ -136,11 +220,7 @@ class ConnectionStatsTest(DeviceTest):
             ),
         )
         try:
-            conn_stats_short = self._dut.rode_device.handle_command(
-                RadioCommands.radio_get_advanced_connection_stats(
-                    0, self._duration_short
-                )
-            )
+            conn_stats_short = self._measure(self._duration_short)
         except (NackStatus, ErrorStatus) as e:
             self.notify_observers(
                 self._create_message(
@@ -159,7 +239,7 @@ class ConnectionStatsTest(DeviceTest):
             )
             return ret
 
-        conn_stats_retrieved = conn_stats_short is not None
+        conn_stats_retrieved = all(stats is not None for stats in conn_stats_short)
         ret.append(TestInfo("connection_stats_short_measured", conn_stats_retrieved))
 
         if not conn_stats_retrieved:
@@ -171,25 +251,29 @@ class ConnectionStatsTest(DeviceTest):
             )
             return ret
 
-        rssi_passed = conn_stats_short.ch1_stats.avg_rssi >= self._min_rssi
+        window_rssi = [stats.ch1_stats.avg_rssi for stats in conn_stats_short]
+        avg_rssi = mean(window_rssi)
+        rssi_passed = avg_rssi >= self._min_rssi
         info = {
-            "measured_average": conn_stats_short.ch1_stats.avg_rssi,
+            "measured_average": avg_rssi,
             "limits": {"min": self._min_rssi},
         }
-        ret.append(TestInfo("min_rssi", rssi_passed, info=info))
+        ret.append(
+            TestInfo("min_rssi", rssi_passed, info=self._window_info(info, window_rssi))
+        )
 
         if not rssi_passed:
             self.notify_observers(
                 self._create_message(
                     "fail",
-                    f"Min RSSI failed. Measured {conn_stats_short.ch1_stats.avg_rssi}, < {self._min_rssi}",
+                    f"Min RSSI failed. Measured {avg_rssi}, < {self._min_rssi}",
                 ),
             )
         else:
             self.notify_observers(
                 self._create_message(
                     "pass",
-                    f"Min RSSI passed! Measured {conn_stats_short.ch1_stats.avg_rssi}, >= {self._min_rssi}",
+                    f"Min RSSI passed! Measured {avg_rssi}, >= {self._min_rssi}",
                 ),
             )
 
@@ -201,11 +285,12 @@ class ConnectionStatsTest(DeviceTest):
             ),
         )
         try:
-            conn_stats_long = self._dut.rode_device.handle_command(
-                RadioCommands.radio_get_advanced_connection_stats(
-                    0, self._duration_long
-                )
-            )
+            if self.window_tests:
+                pending = submit_call(self._measure, self._duration_long)
+                self._run_window_tests()
+                conn_stats_long = pending.result()
+            else:
+                conn_stats_long = self._measure(self._duration_long)
         except (NackStatus, ErrorStatus) as e:
             self.notify_observers(
                 self._create_message(
@@ -224,7 +309,7 @@ class ConnectionStatsTest(DeviceTest):
             )
             return ret
 
-        conn_stats_retrieved = conn_stats_long is not None
+        conn_stats_retrieved = all(stats is not None for stats in conn_stats_long)
         ret.append(TestInfo("connection_stats_long_measured", conn_stats_retrieved))
         if not conn_stats_retrieved:
             self.notify_observers(
@@ -235,14 +320,22 @@ class ConnectionStatsTest(DeviceTest):
             )
             return ret
 
-        ch1_total_errors = (
-            conn_stats_long.ch1_stats.audio_missed_errors
-            + conn_stats_long.ch1_stats.audio_crc_errors
-            + conn_stats_long.ch1_stats.beacon_errors
-        )
+        ch1_window_errors = [
+            stats.ch1_stats.audio_missed_errors
+            + stats.ch1_stats.audio_crc_errors
+            + stats.ch1_stats.beacon_errors
+            for stats in conn_stats_long
+        ]
+        ch1_total_errors = sum(ch1_window_errors)
         ch1_errors_passed = ch1_total_errors < self._allowed_errors
         info = {"total": ch1_total_errors, "allowed": self._allowed_errors}
-        ret.append(TestInfo("ch1_total_errors", ch1_errors_passed, info=info))
+        ret.append(
+            TestInfo(
+                "ch1_total_errors",
+                ch1_errors_passed,
+                info=self._window_info(info, ch1_window_errors),
+            )
+        )
 
         if not ch1_errors_passed:
             self.notify_observers(
@@ -259,14 +352,22 @@ class ConnectionStatsTest(DeviceTest):
                 ),
             )
 
-        ch2_total_errors = (
-            conn_stats_long.ch1_stats.audio_missed_errors
-            + conn_stats_long.ch1_stats.audio_crc_errors
-            + conn_stats_long.ch1_stats.beacon_errors
-        )
+        ch2_window_errors = [
+            stats.ch2_stats.audio_missed_errors
+            + stats.ch2_stats.audio_crc_errors
+            + stats.ch2_stats.beacon_errors
+            for stats in conn_stats_long
+        ]
+        ch2_total_errors = sum(ch2_window_errors)
         ch2_errors_passed = ch2_total_errors < self._allowed_errors
         info = {"total": ch2_total_errors, "allowed": self._allowed_errors}
-        ret.append(TestInfo("ch2_total_errors", ch2_errors_passed, info=info))
+        ret.append(
+            TestInfo(
+                "ch2_total_errors",
+                ch2_errors_passed,
+                info=self._window_info(info, ch2_window_errors),
+            )
+        )
 
         if not ch2_errors_passed:
             self.notify_observers(
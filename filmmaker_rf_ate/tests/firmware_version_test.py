@@ -12,22 +12,31 @@ class FirmwareVersionTest(DeviceTest):
         wireless: DeviceInfo,
         min_firmware_version: Version,
         min_nordic_version: Version,
+        firmware_version=None,
+        nordic_version=None,
+        profile: str = None,
     ):
         super().__init__("firmware_version", wireless, error_code="F")
         self._wireless = wireless
         self._min_firmware_version = min_firmware_version
         self._min_nordic_version = min_nordic_version
+        # Versions read ahead of time, e.g. while warming up the DUT
+        self._firmware_version = firmware_version
+        self._nordic_version = nordic_version
 
         self._test_params = {
             "min_firmware_version": str(self._min_firmware_version),
             "min_nordic_version": str(self._min_nordic_version),
+            "profile": profile,
         }
 
     def test_routine(self) -> list[TestInfo]:
         ret = []
 
-        firmware_version = self._wireless.rode_device.handle_command(
-            CommonCommands.app_version()
+        firmware_version = (
+            self._wireless.rode_device.handle_command(CommonCommands.app_version())
+            if self._firmware_version is None
+            else self._firmware_version
         )
         passed = firmware_version.version >= self._min_firmware_version
         info = {
@@ -51,8 +60,10 @@ class FirmwareVersionTest(DeviceTest):
                 ),
             )
 
-        nordic_version = self._wireless.rode_device.handle_command(
-            AppCommands.radio_version()
+        nordic_version = (
+            self._wireless.rode_device.handle_command(AppCommands.radio_version())
+            if self._nordic_version is None
+            else self._nordic_version
         )
         passed = nordic_version.version >= self._min_nordic_version
         info = {"found": str(nordic_version), "minimum": str(self._min_nordic_version)}
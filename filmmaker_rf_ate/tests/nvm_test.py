@@ -5,7 +5,13 @@ from rode.devices.wireless.commands.nvm_commands import NVMReadCommand
 
 
 class NvmTest(DeviceTest):
-    def __init__(self, wireless: DeviceInfo, address: int, expected_values: bytes):
+    def __init__(
+        self,
+        wireless: DeviceInfo,
+        address: int,
+        expected_values: bytes,
+        profile: str = None,
+    ):
         super().__init__("nvm_test", wireless, error_code="N")
         self._wireless = wireless
         self._nvm_address = address
@@ -14,6 +20,7 @@ class NvmTest(DeviceTest):
         self._test_params = {
             "nvm_address": self._nvm_address,
             "expected_nvm_values": self._exp_nvm_values,
+            "profile": profile,
         }
 
     def test_routine(self) -> list[TestInfo]:
@@ -1,7 +1,7 @@
-import time
 from statistics import mean
+from typing import Callable, Generator
+
 from functional_test_core.device_test import DeviceTest
-from functional_test_core.device_test.device_test import DeviceTestTeardownError
 from functional_test_core.device_test.observer import Message
 from functional_test_core.models import DeviceInfo, TestInfo
 from rode.devices.wireless.commands.app_commands import AppCommands
@@ -12,12 +12,21 @@ from rode.devices.wireless.commands.radio_commands import (
 from rode.devices.wireless.commands.radio_channels import RadioChannel
 from rode.devices.common.commands.basic_commands import CommonCommands
 
-from filmmaker_rf_ate.arduino.arduino import RFATEArduino
+from filmmaker_rf_ate.arduino.arduino import AsyncRFATEArduino, RFATEArduino
 from filmmaker_rf_ate.config.tests import AntennaConfig
+from filmmaker_rf_ate.tests.async_test import (
+    AsyncDeviceTest,
+    power_on_async,
+    run_blocking,
+    wait_for_reset_async,
+)
+from filmmaker_rf_ate.utils.async_command import async_command
+from filmmaker_rf_ate.utils.instrumentation import async_sleep, sleep
+from filmmaker_rf_ate.utils.retry import wait_until
 
 
-class TestSetupException(Exception):
-    pass
+# Transmit power levels each channel is measured at
+POWER_LEVELS = (("high", 0x04), ("low", 0xEC))
 
 
 class RFPowerTest(DeviceTest):
@@ -27,10 +36,16 @@ class RFPowerTest(DeviceTest):
         com_port: str,
         channels: list[RadioChannel] = None,
         antennae_min_delta: list[AntennaConfig] = None,
+        arduino_factory: Callable[[str], RFATEArduino] = RFATEArduino,
+        profile: str = None,
     ):
+        """
+        @param profile: test profile the parameters were chosen by
+        """
         super().__init__("rf_power", wireless, error_code="R")
         self._dut = wireless
         self._com_port = com_port
+        self._arduino_factory = arduino_factory
         self._channels = (
             [
                 RadioChannel.CHANNEL_0,
@@ -53,6 +68,7 @@ class RFPowerTest(DeviceTest):
 
         self._test_params = {
             "channels": [channel.name for channel in self._channels],
+            "profile": profile,
         }
 
     def pre_test_routine(self) -> None:
@@ -63,109 +79,107 @@ class RFPowerTest(DeviceTest):
             ),
         )
         self._dut.rode_device.handle_command(AppCommands.set_system_state(True))
-        exc = None
-        for i in range(5):
-            try:
-                assert self._dut.rode_device.handle_command(
-                    AppCommands.system_is_on()
-                ), "DUT could not be powered on"
-                return
-            except (AssertionError, OSError) as e:
-                exc = e
-                time.sleep(1)
-
-        raise (
-            exc
-            if exc
-            else TestSetupException("Could not power on device, retries exceeded")
-        )
-
-    def test_routine(self) -> list[TestInfo]:
-        ret = []
 
-        with RFATEArduino(self._com_port) as ard:
-            ard.set_mode("M")
+        def powered_on():
+            assert self._dut.rode_device.handle_command(
+                AppCommands.system_is_on()
+            ), "DUT could not be powered on"
 
-            info = {}
-            for antenna_config in self._antennae_min_delta:
-                high_power_results = []
-                low_power_results = []
-                delta_power_results = []
+        wait_until(powered_on, "power_on", retries=5)
 
-                antenna_info = {}
+    def test_routine(self) -> list[TestInfo]:
+        with self._arduino_factory(self._com_port) as ard:
+            ard.set_mode("M")
 
-                for channel in self._channels:
-                    self.notify_observers(
-                        Message(
-                            "running",
-                            self.name,
-                            f"Testing power high on antennae {antenna_config.antenna} @ {channel.name}",
-                        )
-                    )
+            measurements = self._measurements()
+            try:
+                antenna, channel, power_level = next(measurements)
+                while True:
                     self._dut.rode_device.handle_command(
                         RadioCommands.radio_start_continuous_wave_test_mode_fixedfreq(
-                            channel, antenna_config.antenna, 0x04
+                            channel, antenna, power_level
                         )
                     )
-                    pow_high = ard.get_radio_power()
-                    high_power_results.append(pow_high)
-                    self.notify_observers(
-                        Message(
-                            "running",
-                            self.name,
-                            f"Antenna {antenna_config.antenna} power high measured at {pow_high} dBm",
-                        )
-                    )
-                    time.sleep(0.3)  # very important delay, has to be 0.3s , not 1.0s
+                    power = ard.get_radio_power()
+                    sleep(0.3)  # very important delay, has to be 0.3s , not 1.0s
+                    antenna, channel, power_level = measurements.send(power)
+            except StopIteration as done:
+                ret = done.value
+
+            ard.set_mode("P")
+
+        return ret
+
+    def _measurements(
+        self,
+    ) -> Generator[tuple[RadioAntennaIndex, RadioChannel, int], float, list[TestInfo]]:
+        """
+        Steps through every antenna, channel and power level, shared by the sync and async tests,
+        which do the transmitting and measuring. Yields the antenna, channel and power level to
+        transmit at, and takes the power measured in return.
+        @return: the result of each antenna
+        """
+        ret = []
+        for antenna_config in self._antennae_min_delta:
+            antenna = antenna_config.antenna
+            delta_power_results = []
+            antenna_info = {}
 
+            for channel in self._channels:
+                powers = {}
+                for level, power_level in POWER_LEVELS:
                     self.notify_observers(
                         Message(
                             "running",
                             self.name,
-                            f"Testing power low on antennae {antenna_config.antenna} @ {channel.name}",
+                            f"Testing power {level} on antennae {antenna} @ {channel.name}",
                         )
                     )
-                    self._dut.rode_device.handle_command(
-                        RadioCommands.radio_start_continuous_wave_test_mode_fixedfreq(
-                            channel, antenna_config.antenna, 0xEC
-                        )
-                    )
-                    pow_low = ard.get_radio_power()
-                    low_power_results.append(pow_low)
-                    time.sleep(0.3)  # very important delay, has to be 0.3s , not 1.0s
-
-                    delta_pow = abs(pow_high - pow_low)
-                    delta_power_results.append(delta_pow)
+                    powers[level] = yield antenna, channel, power_level
                     self.notify_observers(
                         Message(
                             "running",
                             self.name,
-                            f"Antenna {antenna_config.antenna} power delta measured at {delta_pow} dBm",
+                            f"Antenna {antenna} power {level} measured at {powers[level]} dBm",
                         )
                     )
-                    antenna_info[channel.name] = {
-                        "power_high": pow_high,
-                        "power_low": pow_low,
-                        "pow_delta": delta_pow,
-                    }
-
-                avg_pow = mean(delta_power_results)
-                passed = avg_pow > antenna_config.min_delta
-                info = {
-                    "channels": antenna_info,
-                    "limits": {"delta_power": {"min": antenna_config.min_delta}},
-                    "mean_delta_power": avg_pow,
-                }
-                ret.append(
-                    TestInfo(
-                        f"{antenna_config.antenna.name}_avg_power", passed, info=info
+
+                delta_pow = abs(powers["high"] - powers["low"])
+                delta_power_results.append(delta_pow)
+                self.notify_observers(
+                    Message(
+                        "running",
+                        self.name,
+                        f"Antenna {antenna} power delta measured at {delta_pow} dBm",
                     )
                 )
+                antenna_info[channel.name] = {
+                    "power_high": powers["high"],
+                    "power_low": powers["low"],
+                    "pow_delta": delta_pow,
+                }
 
-            ard.set_mode("P")
+            ret.append(
+                self._antenna_result(antenna_config, antenna_info, delta_power_results)
+            )
 
         return ret
 
+    @staticmethod
+    def _antenna_result(
+        antenna_config: AntennaConfig,
+        antenna_info: dict,
+        delta_power_results: list[float],
+    ) -> TestInfo:
+        avg_pow = mean(delta_power_results)
+        passed = avg_pow > antenna_config.min_delta
+        info = {
+            "channels": antenna_info,
+            "limits": {"delta_power": {"min": antenna_config.min_delta}},
+            "mean_delta_power": avg_pow,
+        }
+        return TestInfo(f"{antenna_config.antenna.name}_avg_power", passed, info=info)
+
     def post_test_routine(self) -> None:
         self._dut.rode_device.handle_command(
             RadioCommands.radio_start_continuous_receive_test_mode(
@@ -188,31 +202,92 @@ class RFPowerTest(DeviceTest):
         self._dut.rode_device.handle_command(CommonCommands.reset())
 
         # Confirm device rebooted
-        exc = None
-
-        for i in range(20):
-            try:
-                self._dut.rode_device.handle_command(CommonCommands.app_version())
-                self.notify_observers(
-                    Message(
-                        "running",
-                        self.name,
-                        "Resetting complete!",
-                    )
+        try:
+            wait_until(
+                lambda: self._dut.rode_device.handle_command(
+                    CommonCommands.app_version()
+                ),
+                "reset",
+                retries=20,
+                exceptions=(OSError,),
+            )
+        except OSError:
+            self.notify_observers(
+                Message(
+                    "fail",
+                    self.name,
+                    "Resetting failed!",
                 )
-                return
-            except OSError as e:
-                exc = e
-                time.sleep(1)
+            )
+            raise
 
         self.notify_observers(
             Message(
-                "fail",
+                "running",
                 self.name,
-                "Resetting failed!",
+                "Resetting complete!",
             )
         )
-        raise exc if exc else DeviceTestTeardownError()
+
+
+class AsyncRFPowerTest(AsyncDeviceTest, RFPowerTest):
+    """
+    RFPowerTest whose power on, settling and reset waits yield the event loop to other slots
+    """
+
+    async def pre_test_routine_async(self) -> None:
+        self.notify_observers(
+            self._create_message(
+                "running",
+                "Powering on devices...",
+            ),
+        )
+        await power_on_async([self._dut])
+
+    async def test_routine_async(self) -> list[TestInfo]:
+        ard = AsyncRFATEArduino(
+            await run_blocking(self._arduino_factory, self._com_port)
+        )
+        async with ard:
+            await ard.set_mode("M")
+
+            measurements = self._measurements()
+            try:
+                antenna, channel, power_level = next(measurements)
+                while True:
+                    await async_command(
+                        self._dut,
+                        RadioCommands.radio_start_continuous_wave_test_mode_fixedfreq(
+                            channel, antenna, power_level
+                        ),
+                    )
+                    power = await ard.get_radio_power()
+                    await async_sleep(0.3)  # very important delay, has to be 0.3s
+                    antenna, channel, power_level = measurements.send(power)
+            except StopIteration as done:
+                ret = done.value
+
+            await ard.set_mode("P")
+
+        return ret
+
+    async def post_test_routine_async(self) -> None:
+        for antenna in (RadioAntennaIndex.ANTENNA_1, RadioAntennaIndex.ANTENNA_2):
+            await async_command(
+                self._dut,
+                RadioCommands.radio_start_continuous_receive_test_mode(
+                    RadioChannel.CHANNEL_0, antenna
+                ),
+            )
+        self.notify_observers(Message("running", self.name, "Resetting DUT..."))
+
+        try:
+            await wait_for_reset_async(self._dut)
+        except OSError:
+            self.notify_observers(Message("fail", self.name, "Resetting failed!"))
+            raise
+
+        self.notify_observers(Message("running", self.name, "Resetting complete!"))
 
 
 if __name__ == "__main__":
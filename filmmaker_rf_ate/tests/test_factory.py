@@ -1,3 +1,7 @@
+from dataclasses import replace
+from datetime import datetime
+from typing import Callable
+
 from functional_test_core.device_test import TestHandler
 from functional_test_core.mock import (
     MockDeviceTestTimerExecution,
@@ -6,11 +10,21 @@ from functional_test_core.mock import (
 )
 from functional_test_core.models import DeviceInfo
 
+from filmmaker_rf_ate.arduino.arduino import RFATEArduino
 from filmmaker_rf_ate.config import Config
 from filmmaker_rf_ate.tests.battery_test import BatteryTest
 from filmmaker_rf_ate.tests.connection_stats_test import ConnectionStatsTest
 from filmmaker_rf_ate.tests.firmware_version_test import FirmwareVersionTest
-from filmmaker_rf_ate.tests.rf_power_test import RFPowerTest
+from filmmaker_rf_ate.tests.rf_power_test import AsyncRFPowerTest, RFPowerTest
+from filmmaker_rf_ate.tests.test_profiles import resolve_profile
+from filmmaker_rf_ate.utils.instrumentation import (
+    StationMetrics,
+    instrument_device,
+    instrument_test,
+)
+from filmmaker_rf_ate.utils.retry import add_command_retries, resolve_policies
+from filmmaker_rf_ate.utils.warm_up import WarmDut
+from filmmaker_rf_ate.utils.watchdog import guard_test, make_cancellable
 
 
 def mock_test_factory(ref: DeviceInfo, dut: DeviceInfo) -> TestHandler:
@@ -33,13 +47,54 @@ def mock_test_factory(ref: DeviceInfo, dut: DeviceInfo) -> TestHandler:
 
 
 def test_factory(
-    ref: DeviceInfo, dut: DeviceInfo, config: Config, stop_on_fail: bool = True
+    ref: DeviceInfo,
+    dut: DeviceInfo,
+    config: Config,
+    stop_on_fail: bool = True,
+    order: list[str] = None,
+    profile: str = None,
+    metrics: StationMetrics = None,
+    arduino_factory: Callable[[str], RFATEArduino] = RFATEArduino,
+    warm: WarmDut = None,
+    asynchronous: bool = False,
 ) -> TestHandler:
+    """
+    @param asynchronous: use the tests' async variants where they have one, for the asyncio engine
+    """
+    profile = (
+        config.tests.profile_policy.default_profile if profile is None else profile
+    )
+    profile_config = resolve_profile(config.tests, profile)
+
+    watchdog = config.tests.watchdog
+    if watchdog.enabled:
+        make_cancellable(dut)
+        make_cancellable(ref)
+
+    if metrics is not None:
+        instrument_device(dut, metrics)
+        instrument_device(ref, metrics)
+
+    if config.command_retries.enabled:
+        policies = resolve_policies(config.command_retries.policies)
+        add_command_retries(dut, policies)
+        add_command_retries(ref, policies)
+
+    # An old reading would stretch the time the battery is checked over
+    warm_battery = (
+        warm is not None
+        and (datetime.now() - warm.battery_time).total_seconds()
+        <= config.tests.battery.max_baseline_age
+    )
+
     tests = [
         FirmwareVersionTest(
             dut,
             config.tests.firmware.min_mcu_version,
             config.tests.firmware.min_nordic_version,
+            None if warm is None else warm.firmware_version,
+            None if warm is None else warm.nordic_version,
+            profile,
         ),
         # NvmTest(
         #     dut,
@@ -50,20 +105,59 @@ def test_factory(
             dut,
             ref,
             config.gender,
-            config.tests.connection_stats.duration_short,
-            config.tests.connection_stats.duration_long,
+            profile_config.duration_short,
+            profile_config.duration_long,
             config.tests.connection_stats.min_rssi,
-            config.tests.connection_stats.allowed_errors,
+            profile_config.allowed_errors,
+            config.tests.connection_stats.windows,
+            profile,
         ),
-        RFPowerTest(
+        (AsyncRFPowerTest if asynchronous else RFPowerTest)(
             dut,
             config.arduino_com_port,
-            config.tests.rf_power.channels,
-            config.tests.rf_power.antennae,
+            profile_config.channels,
+            profile_config.antennae,
+            arduino_factory,
+            profile,
         ),
-        BatteryTest(dut),
+        BatteryTest(dut, warm.battery_time, warm.battery_info, profile)
+        if warm_battery
+        else BatteryTest(dut, profile=profile),
     ]
 
+    for test in tests:
+        if watchdog.enabled and test.name in watchdog.tests:
+            timeouts = watchdog.tests[test.name]
+            if test.name == "connection_stats" and timeouts.test_routine is not None:
+                timeouts = replace(
+                    timeouts,
+                    test_routine=timeouts.test_routine
+                    + profile_config.duration_short
+                    + profile_config.duration_long,
+                )
+            guard_test(test, timeouts)
+        if metrics is not None:
+            instrument_test(test, metrics)
+
+    if order:
+        tests.sort(
+            key=lambda test: order.index(test.name)
+            if test.name in order
+            else len(order)
+        )
+
+    window_tests = [
+        test
+        for test in tests
+        if test.name in config.tests.connection_stats.window_tests
+    ]
+    if window_tests:
+        connection_stats = next(
+            test for test in tests if test.name == "connection_stats"
+        )
+        connection_stats.add_window_tests(window_tests, stop_on_fail)
+        tests = [test for test in tests if test not in window_tests]
+
     th = TestHandler(verbose=False, tests=tests, stop_on_fail=stop_on_fail)
 
     return th
@@ -73,6 +167,7 @@ if __name__ == "__main__":
     from filmmaker_rf_ate.config import CONFIG
     from filmmaker_rf_ate.utils.get_devices import get_devices
     from functional_test_core.models.utils import spprint_devices
+    from filmmaker_rf_ate.tests.test_order import plan_batch_order
     import logging
 
     logger = logging.getLogger()
@@ -83,7 +178,13 @@ if __name__ == "__main__":
         CONFIG.device_classes.dut, CONFIG.device_classes.ref, hid_index=CONFIG.hid_index
     )
 
-    th = test_factory(ref, dut, CONFIG, stop_on_fail=CONFIG.stop_on_fail)
+    th = test_factory(
+        ref,
+        dut,
+        CONFIG,
+        stop_on_fail=CONFIG.stop_on_fail,
+        order=plan_batch_order(CONFIG.tests.order, CONFIG.stop_on_fail),
+    )
 
     results = th.execute_tests()
     print(spprint_devices(dut))
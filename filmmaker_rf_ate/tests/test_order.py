@@ -0,0 +1,121 @@
+# Orders tests so that failing units are rejected as early as possible
+import logging
+from dataclasses import dataclass
+
+from filmmaker_rf_ate.config.tests import TestHistoryConfig, TestOrderConfig
+
+DEFAULT_TEST_ORDER = ["firmware_version", "connection_stats", "rf_power", "battery"]
+
+
+@dataclass
+class TestOrder:
+    names: list[str]
+    expected_duration: float
+    baseline_duration: float
+
+    @property
+    def expected_saving(self) -> float:
+        return self.baseline_duration - self.expected_duration
+
+
+def expected_duration(names: list[str], history: dict[str, TestHistoryConfig]) -> float:
+    """
+    Expected time until the first failure (or the end of the plan) when tests stop on fail
+    @param names: test names in execution order
+    @param history: recorded duration and failure rate per test
+    @return: expected duration in seconds
+    """
+    expected = 0.0
+    p_reached = 1.0
+    for name in names:
+        test_history = history.get(name)
+        if test_history is None:
+            continue
+
+        expected += p_reached * test_history.duration
+        p_reached *= 1 - test_history.failure_rate
+
+    return expected
+
+
+def _cost_ratio(test_history: TestHistoryConfig | None) -> float:
+    if test_history is None or test_history.failure_rate <= 0:
+        return float("inf")
+
+    return test_history.duration / test_history.failure_rate
+
+
+def plan_test_order(
+    names: list[str], history: dict[str, TestHistoryConfig]
+) -> TestOrder:
+    """
+    Greedily orders tests by duration per unit of failure probability, the optimal order for
+    independent tests, while respecting each test's declared dependencies and minimum start time.
+    @param names: test names in their fixed order
+    @param history: recorded duration and failure rate per test
+    @return: chosen order along with its expected duration and that of the fixed order
+    """
+    remaining = list(names)
+    ordered = []
+    elapsed = 0.0
+
+    while remaining:
+        ready = [
+            name
+            for name in remaining
+            if all(
+                dep in ordered or dep not in names
+                for dep in (history[name].after if name in history else [])
+            )
+        ]
+        if not ready:
+            raise ValueError(f"Circular test dependencies between {remaining}")
+
+        started = [
+            name
+            for name in ready
+            if name not in history or history[name].min_start_time <= elapsed
+        ]
+        if started:
+            chosen = min(started, key=lambda name: _cost_ratio(history.get(name)))
+        else:
+            # Nothing can start yet, so run the test that becomes available soonest
+            chosen = min(ready, key=lambda name: history[name].min_start_time)
+
+        ordered.append(chosen)
+        remaining.remove(chosen)
+        elapsed += history[chosen].duration if chosen in history else 0.0
+
+    return TestOrder(
+        ordered,
+        expected_duration(ordered, history),
+        expected_duration(list(names), history),
+    )
+
+
+def plan_batch_order(
+    order_config: TestOrderConfig, stop_on_fail: bool, names: list[str] = None
+) -> list[str] | None:
+    """
+    Chooses and logs the test order for a batch
+    @return: test names in execution order, or None to keep the fixed order
+    """
+    if order_config.mode != "fail_fast":
+        return None
+
+    logger = logging.getLogger("test_order")
+    test_order = plan_test_order(
+        DEFAULT_TEST_ORDER if names is None else names, order_config.history
+    )
+
+    logger.info(
+        f"Test order: {', '.join(test_order.names)}. Expected {test_order.expected_duration:.1f}s "
+        f"per unit vs {test_order.baseline_duration:.1f}s fixed "
+        f"(saving {test_order.expected_saving:.1f}s)"
+    )
+    if not stop_on_fail:
+        logger.warning(
+            "stop_on_fail is disabled, failing units will still run the full test plan"
+        )
+
+    return test_order.names
@@ -0,0 +1,129 @@
+# Chooses which test profile each unit runs
+import threading
+
+from functional_test_core.models import TestInfo
+
+from filmmaker_rf_ate.config.tests import (
+    ProfilePolicyConfig,
+    TestConfig,
+    TestProfileConfig,
+)
+
+
+def resolve_profile(test_config: TestConfig, profile: str) -> TestProfileConfig:
+    """
+    Fills any settings a profile leaves unset from the base test config
+    @param test_config: base test config
+    @param profile: name of the profile
+    @return: profile with every setting populated
+    """
+    try:
+        overrides = test_config.profiles[profile]
+    except KeyError:
+        raise ValueError(
+            f"Unknown test profile `{profile}`, expected one of {list(test_config.profiles)}"
+        )
+
+    connection_stats = test_config.connection_stats
+    rf_power = test_config.rf_power
+
+    return TestProfileConfig(
+        duration_short=connection_stats.duration_short
+        if overrides.duration_short is None
+        else overrides.duration_short,
+        duration_long=connection_stats.duration_long
+        if overrides.duration_long is None
+        else overrides.duration_long,
+        allowed_errors=connection_stats.allowed_errors
+        if overrides.allowed_errors is None
+        else overrides.allowed_errors,
+        channels=rf_power.channels
+        if overrides.channels is None
+        else overrides.channels,
+        antennae=rf_power.antennae
+        if overrides.antennae is None
+        else overrides.antennae,
+    )
+
+
+class ProfileSelector:
+    """
+    Runs the screen profile on most units, and the full or audit profile on every Nth unit and
+    on the units following a marginal result. Selection only depends on the order units are tested.
+    """
+
+    def __init__(self, test_config: TestConfig):
+        self._test_config = test_config
+        self._policy: ProfilePolicyConfig = test_config.profile_policy
+        self._unit_count = 0
+        self._full_remaining = 0
+        self._lock = threading.Lock()
+
+    def select(self) -> tuple[str, str]:
+        """
+        @return: profile name for the next unit, and the reason it was chosen
+        """
+        with self._lock:
+            self._unit_count += 1
+
+            if not self._policy.enabled:
+                return self._policy.default_profile, "default"
+
+            if (
+                self._policy.audit_every
+                and self._unit_count % self._policy.audit_every == 0
+            ):
+                selected = (
+                    self._policy.audit_profile,
+                    f"every {self._policy.audit_every}",
+                )
+            elif (
+                self._policy.full_every
+                and self._unit_count % self._policy.full_every == 0
+            ):
+                selected = self._policy.full_profile, f"every {self._policy.full_every}"
+            elif self._full_remaining > 0:
+                selected = self._policy.full_profile, "marginal"
+            else:
+                return self._policy.screen_profile, "screen"
+
+            self._full_remaining = max(self._full_remaining - 1, 0)
+            return selected
+
+    def record(self, results: list[TestInfo]) -> bool:
+        """
+        Checks a unit's results for marginal measurements
+        @return: true if any measurement was marginal
+        """
+        marginal = any(self._is_marginal(result) for result in results)
+
+        if marginal:
+            with self._lock:
+                self._full_remaining = self._policy.full_after_marginal
+
+        return marginal
+
+    def _is_marginal(self, result: TestInfo) -> bool:
+        info = result.info or {}
+        if not result.passed:
+            return False
+
+        if result.name == "min_rssi":
+            return (
+                info["measured_average"] - info["limits"]["min"]
+                < self._policy.rssi_margin
+            )
+
+        if result.name in ("ch1_total_errors", "ch2_total_errors"):
+            return (
+                info["allowed"] - info["total"]
+                < self._policy.errors_margin * info["allowed"]
+            )
+
+        if "mean_delta_power" in info:
+            return (
+                info["mean_delta_power"] - info["limits"]["delta_power"]["min"]
+                < self._policy.delta_power_margin
+            )
+
+        return False
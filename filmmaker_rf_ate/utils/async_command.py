@@ -0,0 +1,62 @@
+# Sends long running device commands without holding up the calling thread
+import asyncio
+import threading
+from concurrent.futures import Executor, Future
+from functools import partial
+from typing import Callable
+
+from functional_test_core.models import DeviceInfo
+
+from filmmaker_rf_ate.utils.instrumentation import bind_context
+
+
+def submit_call(function: Callable, *args) -> Future:
+    """
+    Calls a function on a helper thread and returns at once, so the caller can carry on talking
+    to the device until it needs the result. The call is accounted to the running test, and is
+    cancelled along with it.
+    @param function: typically sends one or more device commands
+    @param args: arguments for the function
+    @return: future resolving to what the function returns
+    """
+    future = Future()
+
+    def run():
+        if not future.set_running_or_notify_cancel():
+            return
+
+        try:
+            future.set_result(function(*args))
+        except BaseException as e:
+            future.set_exception(e)
+
+    threading.Thread(
+        target=bind_context(run),
+        name=f"command-{getattr(function, '__name__', 'call')}",
+        daemon=True,
+    ).start()
+    return future
+
+
+def submit_command(device: DeviceInfo, command) -> Future:
+    """
+    Sends a command on a helper thread and returns at once, like `submit_call`
+    @param device: device to send the command to
+    @param command: rode command
+    @return: future resolving to the command's response
+    """
+    return submit_call(device.rode_device.handle_command, command)
+
+
+async def async_command(device: DeviceInfo, command, executor: Executor = None):
+    """
+    Awaitable device command. HID transfers block, so the command runs on an executor while the
+    event loop carries on with other slots. Accounted to, and cancelled with, the running test.
+    @param device: device to send the command to
+    @param command: rode command
+    @param executor: executor to run the command on, the loop's default if not given
+    @return: the command's response
+    """
+    return await asyncio.get_running_loop().run_in_executor(
+        executor, bind_context(partial(device.rode_device.handle_command, command))
+    )
@@ -0,0 +1,136 @@
+# Sends the same command to several devices at once
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Any, Callable
+
+from functional_test_core.models import DeviceInfo
+from rode.devices.wireless.commands.app_commands import AppCommands
+
+from filmmaker_rf_ate.utils.identity import DutIdentity, read_identity
+from filmmaker_rf_ate.utils.instrumentation import bind_context, record_retry, sleep
+
+
+@dataclass
+class BroadcastResult:
+    response: Any = None
+    error: BaseException | None = None
+    seconds: float = 0.0
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def broadcast_call(
+    devices: dict[str, DeviceInfo],
+    function: Callable[[DeviceInfo], Any],
+    timeout: float = None,
+) -> dict[str, BroadcastResult]:
+    """
+    Calls a function on every device at once, one thread each, and collects what each returned
+    or raised. HID transfers cannot be interrupted, so a device that overruns the timeout is
+    reported as a TimeoutError and its thread left to finish in the background.
+    @param devices: devices keyed by slot name
+    @param function: called with each device
+    @param timeout: seconds to wait for each device, or None to wait for all
+    @return: outcome keyed by slot name
+    """
+    if not devices:
+        return {}
+
+    def timed(slot: str, device: DeviceInfo):
+        start = time.perf_counter()
+        try:
+            return function(device)
+        finally:
+            seconds[slot] = time.perf_counter() - start
+
+    seconds: dict[str, float] = {}
+    start = time.perf_counter()
+    executor = ThreadPoolExecutor(len(devices), thread_name_prefix="broadcast")
+    try:
+        futures = {
+            slot: executor.submit(bind_context(timed), slot, device)
+            for slot, device in devices.items()
+        }
+        wait(futures.values(), timeout)
+    finally:
+        executor.shutdown(wait=False)
+
+    results = {}
+    for slot, future in futures.items():
+        elapsed = seconds.get(slot, time.perf_counter() - start)
+        if not future.done():
+            results[slot] = BroadcastResult(
+                error=TimeoutError(f"{slot} did not answer within {timeout}s"),
+                seconds=elapsed,
+            )
+        elif future.exception() is not None:
+            results[slot] = BroadcastResult(error=future.exception(), seconds=elapsed)
+        else:
+            results[slot] = BroadcastResult(future.result(), seconds=elapsed)
+    return results
+
+
+def broadcast(
+    devices: dict[str, DeviceInfo],
+    command_factory: Callable[..., Any],
+    *args,
+    timeout: float = None,
+) -> dict[str, BroadcastResult]:
+    """
+    Sends one command to every device at once. Each device gets its own command object.
+    e.g. `broadcast(duts, AppCommands.set_system_state, True)`
+    @param devices: devices keyed by slot name
+    @param command_factory: builds the command, e.g. a rode command helper
+    @param args: arguments for the command factory
+    @param timeout: seconds to wait for each device, or None to wait for all
+    @return: response or error keyed by slot name
+    """
+    return broadcast_call(
+        devices,
+        lambda device: device.rode_device.handle_command(command_factory(*args)),
+        timeout,
+    )
+
+
+def power_on_all(
+    devices: dict[str, DeviceInfo],
+    retries: int = 10,
+    poll_interval: float = 1.0,
+    timeout: float = None,
+) -> dict[str, BroadcastResult]:
+    """
+    Turns every device on at once, then polls them together until they all report being on
+    @return: outcome keyed by slot name, whose response is True once the device is on
+    """
+    results = broadcast(devices, AppCommands.set_system_state, True, timeout=timeout)
+    waiting = {slot: devices[slot] for slot, result in results.items() if result.ok}
+    for i in range(retries):
+        polls = broadcast(waiting, AppCommands.system_is_on, timeout=timeout)
+        for slot, result in polls.items():
+            results[slot] = result
+            if result.ok and result.response:
+                del waiting[slot]
+
+        if not waiting or i + 1 >= retries:
+            break
+
+        record_retry("power_on")
+        sleep(poll_interval)
+
+    return results
+
+
+def read_identities(
+    devices: dict[str, DeviceInfo], timeout: float = None
+) -> dict[str, DutIdentity]:
+    """
+    Identifies every device at once
+    @return: identity keyed by slot name. Both fields are None for a device that did not answer.
+    """
+    return {
+        slot: result.response if result.ok else DutIdentity(None, None)
+        for slot, result in broadcast_call(devices, read_identity, timeout).items()
+    }
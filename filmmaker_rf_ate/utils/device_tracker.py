@@ -0,0 +1,116 @@
+# Keeps one HID handle per connected device across repeated scans
+import logging
+import threading
+
+from functional_test_core.models import DeviceInfo
+
+from filmmaker_rf_ate.config import Config
+from filmmaker_rf_ate.utils.get_devices import close_device, get_devices
+
+DEFAULT_SLOTS = ("dut1", "dut2", "dut3", "dut4")
+
+
+def _serial_number(device: DeviceInfo) -> str | None:
+    return getattr(device.rode_device, "serial_number", None)
+
+
+def _same_device(held: DeviceInfo | None, found: DeviceInfo | None) -> bool:
+    if held is None or found is None:
+        return False
+    serial = _serial_number(held)
+    return serial is not None and serial == _serial_number(found)
+
+
+class DeviceTracker:
+    """
+    Scans for the reference and DUTs, keeping the handle it already holds for a device that is
+    still connected and closing the new one, so each device has one open handle however often
+    it is polled. Handles of devices that were removed or replaced are closed, except for slots
+    whose handles are in use.
+    """
+
+    def __init__(
+        self,
+        config: Config,
+        slots: tuple[str, ...] = DEFAULT_SLOTS,
+        tracked: tuple[str, ...] = None,
+    ):
+        """
+        @param slots: slot names, assigned to the DUTs found in order
+        @param tracked: slots to keep handles for. DUTs found in other slots are closed as soon
+        as they are opened. Defaults to every slot.
+        """
+        self._config = config
+        self._slots = slots
+        self._tracked = set(slots if tracked is None else tracked)
+        self._lock = threading.Lock()
+        self._ref: DeviceInfo | None = None
+        self._duts: dict[str, DeviceInfo] = {}
+        self._logger = logging.getLogger("device_tracker")
+
+    @property
+    def slots(self) -> tuple[str, ...]:
+        return self._slots
+
+    def scan(
+        self, in_use=(), retries: int = 0
+    ) -> tuple[DeviceInfo | None, dict[str, DeviceInfo]]:
+        """
+        Enumerates the connected devices once
+        @param in_use: slots being tested, whose DUTs are returned as held whatever the scan
+        finds. While any slot is in use, the reference handle is kept too.
+        @param retries: passed to get_devices
+        @return: reference, or None if it is not connected, and the DUTs found keyed by slot
+        """
+        in_use = set(in_use)
+        with self._lock:
+            try:
+                ref, *duts = get_devices(
+                    self._config.device_classes.dut,
+                    self._config.device_classes.ref,
+                    hid_index=self._config.hid_index,
+                    retries=retries,
+                )
+            except AssertionError:
+                ref, duts = None, []
+
+            self._ref = self._keep(self._ref, ref, bool(in_use))
+            for slot, dut in zip(self._slots, duts + [None] * len(self._slots)):
+                if slot not in self._tracked:
+                    if dut is not None:
+                        close_device(dut)
+                    continue
+                held = self._keep(self._duts.get(slot), dut, slot in in_use)
+                if held is None:
+                    self._duts.pop(slot, None)
+                else:
+                    self._duts[slot] = held
+
+            return None if ref is None else self._ref, dict(self._duts)
+
+    def _keep(
+        self, held: DeviceInfo | None, found: DeviceInfo | None, in_use: bool
+    ) -> DeviceInfo | None:
+        """
+        @return: whichever of the held and newly opened handles to keep, having closed the other
+        """
+        if held is None:
+            return found
+        if in_use or _same_device(held, found):
+            if found is not None:
+                close_device(found)
+            return held
+
+        close_device(held)
+        return found
+
+    def close(self) -> None:
+        """
+        Closes every handle held. Only call once nothing is using them.
+        """
+        with self._lock:
+            for device in (self._ref, *self._duts.values()):
+                if device is not None:
+                    close_device(device)
+            self._ref = None
+            self._duts.clear()
@@ -0,0 +1,179 @@
+# Brings DUTs below the minimum firmware version up to date before they are tested. There is no
+# flasher for real devices yet, so this only runs against the simulator's.
+import hashlib
+import logging
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable
+
+from functional_test_core.models import DeviceInfo
+from rode.core.custom_exceptions import ErrorStatus, NackStatus
+from rode.devices.common.commands.basic_commands import CommonCommands
+from rode.devices.utils.versions import Version
+from rode.devices.wireless.commands.app_commands import AppCommands
+
+from filmmaker_rf_ate.utils.instrumentation import sleep
+
+TARGETS = ("mcu", "nordic")
+
+
+@dataclass(frozen=True)
+class FirmwareImage:
+    target: str
+    version: Version
+    data: bytes = field(repr=False)
+    sha256: str
+
+
+class FirmwareImageCache:
+    """
+    Firmware images, read from disk once per session and shared by every slot
+    """
+
+    def __init__(self):
+        self._images: dict[tuple[str, str, str], FirmwareImage] = {}
+        self._lock = threading.Lock()
+
+    def get(self, target: str, path: str, version: Version) -> FirmwareImage:
+        key = (target, str(Path(path).resolve()), str(version))
+        with self._lock:
+            image = self._images.get(key)
+            if image is None:
+                data = Path(path).read_bytes()
+                image = FirmwareImage(
+                    target, version, data, hashlib.sha256(data).hexdigest()
+                )
+                self._images[key] = image
+            return image
+
+
+# Transfers an image to a DUT in chunks, calling back with the bytes sent so far
+Flasher = Callable[[DeviceInfo, FirmwareImage, int, Callable[[int], None]], None]
+
+
+@dataclass
+class FlashResult:
+    target: str
+    from_version: str
+    to_version: str
+    size: int
+    seconds: float
+
+    @property
+    def throughput(self) -> float:
+        """
+        @return: transfer rate in bytes per second
+        """
+        return self.size / self.seconds if self.seconds > 0 else float("inf")
+
+
+@dataclass
+class FirmwareUpdateReport:
+    slot: str
+    flashed: list[FlashResult]
+    # Versions found after any update, keyed by target
+    versions: dict[str, str]
+    verified: bool
+    error: str | None = None
+
+    @property
+    def updated(self) -> bool:
+        return bool(self.flashed)
+
+
+def read_versions(dut: DeviceInfo) -> dict[str, Version]:
+    device = dut.rode_device
+    return {
+        "mcu": device.handle_command(CommonCommands.app_version()).version,
+        "nordic": device.handle_command(AppCommands.radio_version()).version,
+    }
+
+
+def wait_for_reboot(
+    dut: DeviceInfo, timeout: float, poll_interval: float = 0.5
+) -> dict[str, Version]:
+    """
+    Waits for a DUT to answer again after a reset
+    @return: versions read once it answers
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            return read_versions(dut)
+        except OSError:
+            if time.monotonic() >= deadline:
+                raise TimeoutError(f"DUT did not come back within {timeout}s")
+            sleep(poll_interval)
+
+
+def update_firmware(
+    slot: str,
+    dut: DeviceInfo,
+    images: dict[str, FirmwareImage],
+    min_versions: dict[str, Version],
+    flasher: Flasher,
+    chunk_size: int = 4096,
+    reboot_timeout: float = 30.0,
+) -> FirmwareUpdateReport:
+    """
+    Flashes each target that is below its minimum version and has an image, then reboots the DUT
+    and reads the versions back
+    @param slot: slot the DUT is in
+    @param dut: device to update
+    @param images: images to flash, keyed by target
+    @param min_versions: minimum versions, keyed by target
+    @param flasher: transfers an image to the DUT
+    @param chunk_size: bytes per transfer
+    @param reboot_timeout: seconds to wait for the DUT to answer after the update
+    @return: what was flashed and how fast, and whether every target now meets its minimum
+    """
+    logger = logging.getLogger("firmware_update")
+    flashed = []
+    try:
+        versions = read_versions(dut)
+        for target in TARGETS:
+            image = images.get(target)
+            if image is None or versions[target] >= min_versions[target]:
+                continue
+
+            logger.info(
+                f"Flashing {target} {image.version} to {slot} ({versions[target]})"
+            )
+            sent = 0
+
+            def progress(count: int) -> None:
+                nonlocal sent
+                sent = count
+
+            start = time.perf_counter()
+            flasher(dut, image, chunk_size, progress)
+            seconds = time.perf_counter() - start
+            flash_result = FlashResult(
+                target,
+                str(versions[target]),
+                str(image.version),
+                sent or len(image.data),
+                seconds,
+            )
+            flashed.append(flash_result)
+            logger.info(
+                f"Flashed {target} on {slot}: {flash_result.size} bytes in "
+                f"{seconds:.1f}s ({flash_result.throughput / 1024:.1f} KiB/s)"
+            )
+
+        if flashed:
+            dut.rode_device.handle_command(CommonCommands.reset())
+            versions = wait_for_reboot(dut, reboot_timeout)
+    except (OSError, NackStatus, ErrorStatus, TimeoutError) as e:
+        logger.error(f"Firmware update failed on {slot}: {e}")
+        return FirmwareUpdateReport(slot, flashed, {}, False, str(e))
+
+    verified = all(versions[target] >= min_versions[target] for target in images)
+    return FirmwareUpdateReport(
+        slot,
+        flashed,
+        {target: str(version) for target, version in versions.items()},
+        verified,
+    )
@@ -137,6 +137,11 @@ def _get_devices_linux(
     return ref, dut1, dut2, dut3, dut4
 
 
+def _system() -> str:
+    # Seam for the simulator, which enumerates devices as on Linux
+    return platform.system()
+
+
 def get_devices(
     dut_class: type[WirelessDeviceBase],
     ref_class: type[WirelessDeviceBase],
@@ -151,7 +156,7 @@ def get_devices(
     @return: Device info of charging case, WiGo3 RX, and two WiGo3 TXs respectively.
     """
 
-    operating_system = platform.system()
+    operating_system = _system()
     logger = logging.getLogger("get_devices")
     ref, dut1, dut2, dut3, dut4 = None, None, None, None, None
     for i in range(retries + 1):
@@ -179,6 +184,13 @@ def get_devices(
     return ref, dut1, dut2, dut3, dut4
 
 
+def close_device(device: DeviceInfo) -> None:
+    """
+    Closes the device's HID handle
+    """
+    device.rode_device.close()
+
+
 def find_hid_index(device_class: type[RodeDeviceBase]):
     device_hids = list(get_devices_by_hid([device_class])[device_class].keys())
 
@@ -0,0 +1,30 @@
+from dataclasses import dataclass
+
+from functional_test_core.models import DeviceInfo
+from rode.core.custom_exceptions import NackStatus, ErrorStatus
+from rode.devices.wireless.commands.radio_commands import RadioCommands
+
+
+@dataclass(frozen=True)
+class DutIdentity:
+    serial: str | None
+    rfid: str | None
+
+
+def read_identity(dut: DeviceInfo) -> DutIdentity:
+    """
+    Reads the identity of a DUT. Either field is None if it could not be read.
+    @param dut: device to identify
+    @return: serial number and RFID (hex) of the device
+    """
+    serial = getattr(dut.rode_device, "serial_number", None)
+
+    try:
+        rfid = dut.rode_device.handle_command(RadioCommands.radio_get_rfid(0))
+    except (OSError, NackStatus, ErrorStatus):
+        rfid = None
+
+    return DutIdentity(
+        str(serial) if serial else None,
+        rfid.hex() if isinstance(rfid, (bytes, bytearray)) else None,
+    )
@@ -0,0 +1,494 @@
+# Per-phase timing and HID command latency instrumentation
+import asyncio
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import contextmanager
+import contextvars
+from contextvars import ContextVar
+from functools import wraps
+from os import PathLike
+
+from functional_test_core.device_test import DeviceTest
+from functional_test_core.models import DeviceInfo
+
+from filmmaker_rf_ate.simulation.time_scale import scaled_wait, sleep_scale
+from filmmaker_rf_ate.utils.test_hooks import PHASES, wrap_execute
+from filmmaker_rf_ate.utils.watchdog import cancel_event, check_cancelled
+
+LATENCY_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+    120.0,
+    300.0,
+    600.0,
+)
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def merge(self, other: "Histogram") -> None:
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.sum += other.sum
+        self.count += other.count
+
+
+class TestTiming:
+    """
+    Timing breakdown of a single test run
+    """
+
+    def __init__(self):
+        self.phases: dict[str, float] = {}
+        self.commands: dict[str, list] = defaultdict(lambda: [0, 0.0])
+        self.sleep = 0.0
+        self.retries: dict[str, int] = defaultdict(int)
+        self.phase: str | None = None
+
+    def to_dict(self) -> dict:
+        return {
+            "phases": dict(self.phases),
+            "commands": {
+                command: {"count": count, "seconds": seconds}
+                for command, (count, seconds) in self.commands.items()
+            },
+            "sleep": self.sleep,
+            "retries": dict(self.retries),
+        }
+
+
+class StationMetrics:
+    """
+    Station-wide totals, shared across all slots
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.command_latency: dict[str, Histogram] = defaultdict(Histogram)
+        self.command_errors: dict[str, int] = defaultdict(int)
+        self.phase_duration: dict[tuple[str, str], Histogram] = defaultdict(Histogram)
+        self.retries: dict[tuple[str, str], int] = defaultdict(int)
+        self.sleep_seconds: dict[str, float] = defaultdict(float)
+        self.lease_wait: dict[str, Histogram] = defaultdict(Histogram)
+        self.upload_records: dict[str, int] = defaultdict(int)
+        self.upload_queue_depth = 0
+        self.upload_lag = 0.0
+
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def drain(self) -> "StationMetrics":
+        """
+        Moves everything observed so far into a new StationMetrics, e.g. to send it to another
+        process, leaving this one empty
+        """
+        drained = StationMetrics()
+        empty = StationMetrics().__getstate__()
+        with self._lock:
+            drained.__setstate__(self.__getstate__())
+            self.__dict__.update(empty)
+        return drained
+
+    def merge(self, other: "StationMetrics") -> None:
+        """
+        Adds the observations of another StationMetrics, e.g. one drained in a worker process.
+        The upload gauges are left as they are.
+        """
+        with self._lock:
+            for command, histogram in other.command_latency.items():
+                self.command_latency[command].merge(histogram)
+            for key, histogram in other.phase_duration.items():
+                self.phase_duration[key].merge(histogram)
+            for resource, histogram in other.lease_wait.items():
+                self.lease_wait[resource].merge(histogram)
+            for counters, others in (
+                (self.command_errors, other.command_errors),
+                (self.retries, other.retries),
+                (self.sleep_seconds, other.sleep_seconds),
+                (self.upload_records, other.upload_records),
+            ):
+                for key, value in others.items():
+                    counters[key] += value
+
+    def observe_command(self, command: str, seconds: float, failed: bool) -> None:
+        with self._lock:
+            self.command_latency[command].observe(seconds)
+            if failed:
+                self.command_errors[command] += 1
+
+    def observe_phase(self, test: str, phase: str, seconds: float) -> None:
+        with self._lock:
+            self.phase_duration[(test, phase)].observe(seconds)
+
+    def add_retry(self, test: str, reason: str) -> None:
+        with self._lock:
+            self.retries[(test, reason)] += 1
+
+    def add_sleep(self, test: str, seconds: float) -> None:
+        with self._lock:
+            self.sleep_seconds[test] += seconds
+
+    def observe_lease_wait(self, resource: str, seconds: float) -> None:
+        with self._lock:
+            self.lease_wait[resource].observe(seconds)
+
+    def add_uploads(self, outcome: str, count: int) -> None:
+        with self._lock:
+            self.upload_records[outcome] += count
+
+    def set_upload_queue(self, depth: int, lag: float) -> None:
+        """
+        @param depth: records waiting to be uploaded
+        @param lag: age in seconds of the oldest waiting record
+        """
+        with self._lock:
+            self.upload_queue_depth = depth
+            self.upload_lag = lag
+
+    def to_prometheus(self, prefix: str = "rf_ate") -> str:
+        with self._lock:
+            lines = []
+            _histogram_lines(
+                lines,
+                f"{prefix}_command_latency_seconds",
+                "Device command round trip time",
+                {
+                    (("command", command),): h
+                    for command, h in self.command_latency.items()
+                },
+            )
+            _histogram_lines(
+                lines,
+                f"{prefix}_phase_duration_seconds",
+                "Test phase duration",
+                {
+                    (("test", test), ("phase", phase)): h
+                    for (test, phase), h in self.phase_duration.items()
+                },
+            )
+            _histogram_lines(
+                lines,
+                f"{prefix}_lease_wait_seconds",
+                "Time slots waited for shared station hardware",
+                {
+                    (("resource", resource),): h
+                    for resource, h in self.lease_wait.items()
+                },
+            )
+            _counter_lines(
+                lines,
+                f"{prefix}_command_errors_total",
+                "Device commands that raised",
+                {
+                    (("command", command),): v
+                    for command, v in self.command_errors.items()
+                },
+            )
+            _counter_lines(
+                lines,
+                f"{prefix}_retries_total",
+                "Retries made by tests",
+                {
+                    (("test", test), ("reason", reason)): v
+                    for (test, reason), v in self.retries.items()
+                },
+            )
+            _counter_lines(
+                lines,
+                f"{prefix}_sleep_seconds_total",
+                "Time tests spent sleeping",
+                {(("test", test),): v for test, v in self.sleep_seconds.items()},
+            )
+            _counter_lines(
+                lines,
+                f"{prefix}_upload_records_total",
+                "Records sent to the MES, by outcome",
+                {
+                    (("outcome", outcome),): v
+                    for outcome, v in self.upload_records.items()
+                },
+            )
+            _gauge_lines(
+                lines,
+                f"{prefix}_upload_queue_depth",
+                "Records waiting to be uploaded",
+                {(): self.upload_queue_depth},
+            )
+            _gauge_lines(
+                lines,
+                f"{prefix}_upload_lag_seconds",
+                "Age of the oldest record waiting to be uploaded",
+                {(): self.upload_lag},
+            )
+
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: PathLike | str) -> None:
+        """
+        Writes metrics in the Prometheus text file format. The file is replaced atomically so a
+        node exporter never reads a partial file.
+        """
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as file:
+            file.write(self.to_prometheus())
+        os.replace(tmp_path, path)
+
+
+def _labels(labels: tuple, **extra) -> str:
+    pairs = [*labels, *extra.items()]
+    return "{" + ",".join(f'{key}="{value}"' for key, value in pairs) + "}"
+
+
+def _histogram_lines(lines: list, name: str, help_text: str, histograms: dict):
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} histogram")
+    for labels, histogram in histograms.items():
+        cumulative = 0
+        for bound, count in zip(histogram.buckets, histogram.counts):
+            cumulative += count
+            lines.append(f"{name}_bucket{_labels(labels, le=bound)} {cumulative}")
+        lines.append(f"{name}_bucket{_labels(labels, le='+Inf')} {histogram.count}")
+        lines.append(f"{name}_sum{_labels(labels)} {histogram.sum}")
+        lines.append(f"{name}_count{_labels(labels)} {histogram.count}")
+
+
+def _counter_lines(lines: list, name: str, help_text: str, counters: dict):
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} counter")
+    for labels, value in counters.items():
+        lines.append(f"{name}{_labels(labels)} {value}")
+
+
+def _gauge_lines(lines: list, name: str, help_text: str, gauges: dict):
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} gauge")
+    for labels, value in gauges.items():
+        lines.append(f"{name}{_labels(labels) if labels else ''} {value}")
+
+
+METRICS = StationMetrics()
+
+
+class _TaskLocal:
+    """
+    Like threading.local, but also kept apart for each asyncio task, so slots sharing an event
+    loop are each accounted to their own test
+    """
+
+    def __init__(self):
+        object.__setattr__(self, "_vars", {})
+
+    def __getattr__(self, name: str):
+        try:
+            return self._vars[name].get()
+        except (KeyError, LookupError):
+            raise AttributeError(name) from None
+
+    def __setattr__(self, name: str, value) -> None:
+        self._vars.setdefault(name, ContextVar(name)).set(value)
+
+
+_context = _TaskLocal()
+
+
+def bind_context(function):
+    """
+    Wraps a function to run in a copy of the calling thread's context, so work handed to another
+    thread is still accounted to the running test, and is cancelled along with it
+    """
+    context = contextvars.copy_context()
+
+    @wraps(function)
+    def bound(*args, **kwargs):
+        return context.copy().run(function, *args, **kwargs)
+
+    return bound
+
+
+def _current() -> tuple[str | None, TestTiming | None, StationMetrics | None]:
+    return (
+        getattr(_context, "test", None),
+        getattr(_context, "timing", None),
+        getattr(_context, "metrics", None),
+    )
+
+
+def sleep(seconds: float) -> None:
+    """
+    Drop-in for time.sleep that is accounted to the running test
+    """
+    check_cancelled()
+    scale = sleep_scale()
+    if scale:
+        cancel = cancel_event()
+        with scaled_wait():
+            if cancel is None:
+                time.sleep(seconds * scale)
+            elif cancel.wait(seconds * scale):
+                check_cancelled()
+
+    test, timing, metrics = _current()
+    if timing is not None:
+        timing.sleep += seconds
+        metrics.add_sleep(test, seconds)
+
+
+async def async_sleep(seconds: float) -> None:
+    """
+    Awaitable counterpart of `sleep`, yielding the event loop to other slots while it waits
+    """
+    check_cancelled()
+    scale = sleep_scale()
+    if scale:
+        with scaled_wait():
+            await asyncio.sleep(seconds * scale)
+        check_cancelled()
+
+    test, timing, metrics = _current()
+    if timing is not None:
+        timing.sleep += seconds
+        metrics.add_sleep(test, seconds)
+
+
+def record_retry(reason: str) -> None:
+    """
+    Counts a retry against the running test
+    """
+    test, timing, metrics = _current()
+    if timing is not None:
+        timing.retries[reason] += 1
+        metrics.add_retry(test, reason)
+
+
+def instrument_device(device: DeviceInfo, metrics: StationMetrics = METRICS) -> None:
+    """
+    Times every command sent to a device. Safe to call more than once on the same device.
+    """
+    rode_device = device.rode_device
+    if getattr(rode_device, "_instrumented", False):
+        return
+
+    handle_command = rode_device.handle_command
+
+    @wraps(handle_command)
+    def timed_handle_command(command, *args, **kwargs):
+        name = type(command).__name__
+        start = time.perf_counter()
+        failed = True
+        try:
+            response = handle_command(command, *args, **kwargs)
+            failed = False
+            return response
+        finally:
+            elapsed = time.perf_counter() - start
+            metrics.observe_command(name, elapsed, failed)
+
+            _, timing, _ = _current()
+            if timing is not None:
+                stats = timing.commands[name]
+                stats[0] += 1
+                stats[1] += elapsed
+
+    rode_device.handle_command = timed_handle_command
+    rode_device._instrumented = True
+
+
+def instrument_test(test: DeviceTest, metrics: StationMetrics = METRICS) -> None:
+    """
+    Times each phase of a test. After each run, the breakdown is available as `test.timing`.
+    """
+
+    def start_phase(phase: str) -> float:
+        _, timing, _ = _current()
+        if timing is not None:
+            timing.phase = phase
+        return time.perf_counter()
+
+    def end_phase(phase: str, start: float) -> None:
+        elapsed = time.perf_counter() - start
+        metrics.observe_phase(test.name, phase, elapsed)
+        _, timing, _ = _current()
+        if timing is not None:
+            timing.phases[phase] = elapsed
+            timing.phase = None
+
+    def timed_phase(phase: str, routine):
+        @wraps(routine)
+        def wrapper(*args, **kwargs):
+            start = start_phase(phase)
+            try:
+                return routine(*args, **kwargs)
+            finally:
+                end_phase(phase, start)
+
+        return wrapper
+
+    def timed_async_phase(phase: str, routine):
+        @wraps(routine)
+        async def wrapper(*args, **kwargs):
+            start = start_phase(phase)
+            try:
+                return await routine(*args, **kwargs)
+            finally:
+                end_phase(phase, start)
+
+        return wrapper
+
+    @contextmanager
+    def run():
+        timing = TestTiming()
+        previous = _current()
+        _context.test, _context.timing, _context.metrics = test.name, timing, metrics
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            timing.phases["total"] = time.perf_counter() - start
+            test.timing = timing.to_dict()
+            _context.test, _context.timing, _context.metrics = previous
+
+    for phase in PHASES:
+        setattr(test, phase, timed_phase(phase, getattr(test, phase)))
+
+    if getattr(test, "execute_test_async", None) is not None:
+        # Phases the test bridges to a thread are timed by the sync wrappers above
+        for phase in PHASES:
+            routine = getattr(test, f"{phase}_async")
+            if not getattr(routine, "bridged", False):
+                setattr(test, f"{phase}_async", timed_async_phase(phase, routine))
+
+    wrap_execute(test, around=run)
+    test.timing = None
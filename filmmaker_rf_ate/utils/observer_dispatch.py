@@ -0,0 +1,210 @@
+# Delivers test messages to observers on their own thread, so a slow observer does not hold up
+# the test
+import logging
+import threading
+from collections import deque
+from contextlib import contextmanager
+from enum import Enum
+from typing import Iterator
+
+from functional_test_core.device_test.observer import Message, Observable, Observer
+
+STATUS = "running"
+
+
+class DispatchPolicy(Enum):
+    # Drop the oldest queued status message to make room
+    DROP_OLDEST = "drop_oldest"
+    # Replace the queued status message of the same test, or drop the oldest if it has none
+    MERGE = "merge"
+    # Wait for the observer to catch up, as if it were called directly
+    BLOCK = "block"
+
+
+class ObserverDispatcher(Observer):
+    """
+    Queues messages for an observer and delivers them, in order, on a separate thread. Status
+    messages are bounded by `queue_size` and handled by `policy` once it is reached. Pass and
+    fail messages are always queued and delivered, however full the queue. Messages sent once
+    closed are dropped.
+    """
+
+    def __init__(
+        self,
+        observer: Observer,
+        queue_size: int = 256,
+        policy: DispatchPolicy = DispatchPolicy.MERGE,
+        name: str = "observer",
+    ):
+        """
+        @param observer: observer to deliver to
+        @param queue_size: status messages that may wait for delivery
+        @param name: name of the delivery thread
+        """
+        super().__init__()
+        self._observer = observer
+        self._queue_size = max(queue_size, 1)
+        self._policy = DispatchPolicy(policy)
+        self._logger = logging.getLogger("observer_dispatch")
+
+        self._condition = threading.Condition()
+        # [observable, message, args, kwargs], with message set to None once dropped
+        self._queue: deque[list] = deque()
+        self._statuses: deque[list] = deque()
+        self._latest: dict[str, list] = {}
+        self._pending_statuses = 0
+        self._delivering = False
+        self._closed = False
+
+        self.delivered = 0
+        self.dropped = 0
+        self.merged = 0
+
+        self._thread = threading.Thread(target=self._deliver, name=name, daemon=True)
+        self._thread.start()
+
+    @property
+    def observer(self) -> Observer:
+        return self._observer
+
+    def update(self, observable: Observable, message: Message, *args, **kwargs):
+        entry = [observable, message, args, kwargs]
+        with self._condition:
+            if self._closed:
+                # A test thread can still be notifying after the run was closed
+                self._logger.warning(
+                    f"Dropped {message.status} message from {message.name} sent after closing"
+                )
+                return
+
+            if message.status != STATUS:
+                # Anything queued for the test is older than its result
+                self._latest.pop(message.name, None)
+                self._append(entry)
+                return
+
+            if self._pending_statuses >= self._queue_size:
+                if self._policy is DispatchPolicy.BLOCK:
+                    self._condition.wait_for(
+                        lambda: self._pending_statuses < self._queue_size
+                    )
+                elif self._policy is DispatchPolicy.MERGE and self._merge(entry):
+                    return
+                else:
+                    self._drop_oldest()
+
+            self._pending_statuses += 1
+            self._statuses.append(entry)
+            self._latest[message.name] = entry
+            self._append(entry)
+
+    def _append(self, entry: list) -> None:
+        self._queue.append(entry)
+        self._condition.notify_all()
+
+    def _merge(self, entry: list) -> bool:
+        queued = self._latest.get(entry[1].name)
+        if queued is None or queued[1] is None:
+            return False
+
+        queued[:] = entry
+        self.merged += 1
+        return True
+
+    def _drop_oldest(self) -> None:
+        while self._statuses:
+            entry = self._statuses.popleft()
+            if entry[1] is not None:
+                if self._latest.get(entry[1].name) is entry:
+                    del self._latest[entry[1].name]
+                entry[1] = None
+                self._pending_statuses -= 1
+                self.dropped += 1
+                return
+
+    def _deliver(self) -> None:
+        while True:
+            with self._condition:
+                self._delivering = False
+                self._condition.notify_all()
+                self._condition.wait_for(lambda: self._queue or self._closed)
+                if not self._queue:
+                    return
+
+                entry = self._queue.popleft()
+                observable, message, args, kwargs = entry
+                if message is None:
+                    continue
+
+                if message.status == STATUS:
+                    self._pending_statuses -= 1
+                    if self._statuses and self._statuses[0] is entry:
+                        self._statuses.popleft()
+                    if self._latest.get(message.name) is entry:
+                        del self._latest[message.name]
+                self._delivering = True
+
+            try:
+                self._observer.update(observable, message, *args, **kwargs)
+            except Exception:
+                self._logger.exception(f"Observer failed on {message.name}")
+            self.delivered += 1
+
+    def flush(self, timeout: float = None) -> bool:
+        """
+        Waits for every queued message to be delivered
+        @return: False if the timeout ran out first
+        """
+        with self._condition:
+            return self._condition.wait_for(
+                lambda: not self._queue and not self._delivering, timeout
+            )
+
+    def close(self, timeout: float = None) -> None:
+        """
+        Delivers the queued messages, then stops the delivery thread
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self._thread.join(timeout)
+
+        if self.dropped or self.merged:
+            self._logger.info(
+                f"{self._thread.name}: delivered {self.delivered} message(s), "
+                f"dropped {self.dropped} and merged {self.merged} status message(s)"
+            )
+
+
+def dispatch_observer(
+    observer: Observer | None, config, name: str = "observer"
+) -> ObserverDispatcher | None:
+    """
+    @param config: ObserverDispatchConfig
+    @return: a dispatcher for the observer, or None if there is no observer or dispatch is off
+    """
+    if observer is None or not config.enabled:
+        return None
+    return ObserverDispatcher(
+        observer, config.queue_size, DispatchPolicy(config.policy), name
+    )
+
+
+@contextmanager
+def dispatching(
+    observer: Observer | None, config, name: str = "observer"
+) -> Iterator[Observer | None]:
+    """
+    Wraps an observer in a dispatcher for the duration of the block, if enabled, delivering
+    everything queued before leaving it
+    @param config: ObserverDispatchConfig
+    """
+    dispatcher = dispatch_observer(observer, config, name)
+    if dispatcher is None:
+        yield observer
+        return
+
+    try:
+        yield dispatcher
+    finally:
+        dispatcher.close()
@@ -0,0 +1,216 @@
+# Retries device commands that fail transiently, according to what the command does
+import time
+from dataclasses import dataclass, replace
+from enum import Enum
+from functools import wraps
+from typing import Any, Callable
+
+from functional_test_core.models import DeviceInfo
+from rode.devices.common.commands.basic_commands import CommonCommands
+from rode.devices.wireless.commands.app_commands import (
+    AppCommands,
+    GetFuelGaugeCommand,
+)
+from rode.devices.wireless.commands.nvm_commands import NVMReadCommand
+from rode.devices.wireless.commands.radio_channels import RadioChannel
+from rode.devices.wireless.commands.radio_commands import (
+    RadioAntennaIndex,
+    RadioCommands,
+)
+
+from filmmaker_rf_ate.utils.instrumentation import record_retry, sleep
+
+# A NACK or error status is the device's answer to the command, so resending it gets the
+# same answer
+TRANSIENT_ERRORS = (OSError,)
+
+
+class CommandKind(Enum):
+    # Reads device state. Safe to resend.
+    READ = "read"
+    # Sets device state. Sending the same value twice leaves the device as sending it once.
+    WRITE = "write"
+    # Measures over a duration. Safe to resend, but only worth it if rejected straight away.
+    MEASUREMENT = "measurement"
+    # Anything else, such as a reset. Never resent, as the first attempt may have taken effect.
+    UNSAFE = "unsafe"
+
+
+@dataclass
+class RetryPolicy:
+    # Total tries, including the first
+    attempts: int = 1
+    backoff: float = 0.0
+    multiplier: float = 2.0
+    max_backoff: float = 1.0
+    # No try starts once this many seconds have passed since the first
+    budget: float = 0.0
+
+
+DEFAULT_POLICIES = {
+    CommandKind.READ: RetryPolicy(
+        attempts=4, backoff=0.02, max_backoff=0.2, budget=1.0
+    ),
+    CommandKind.WRITE: RetryPolicy(
+        attempts=3, backoff=0.05, max_backoff=0.2, budget=1.0
+    ),
+    CommandKind.MEASUREMENT: RetryPolicy(attempts=2, backoff=0.1, budget=0.5),
+    CommandKind.UNSAFE: RetryPolicy(),
+}
+
+_command_kinds: dict[type, CommandKind] | None = None
+
+
+def _build_command_kinds() -> dict[type, CommandKind]:
+    commands = (
+        (AppCommands.system_is_on(), CommandKind.READ),
+        (CommonCommands.app_version(), CommandKind.READ),
+        (AppCommands.radio_version(), CommandKind.READ),
+        (RadioCommands.radio_get_rfid(0), CommandKind.READ),
+        (GetFuelGaugeCommand, CommandKind.READ),
+        (NVMReadCommand, CommandKind.READ),
+        (AppCommands.set_system_state(True), CommandKind.WRITE),
+        (RadioCommands.radio_set_rfid(0, bytes(4)), CommandKind.WRITE),
+        (
+            RadioCommands.radio_start_continuous_wave_test_mode_fixedfreq(
+                RadioChannel.CHANNEL_0, RadioAntennaIndex.ANTENNA_1, 0x04
+            ),
+            CommandKind.WRITE,
+        ),
+        (
+            RadioCommands.radio_start_continuous_receive_test_mode(
+                RadioChannel.CHANNEL_0, RadioAntennaIndex.ANTENNA_1
+            ),
+            CommandKind.WRITE,
+        ),
+        (
+            RadioCommands.radio_get_advanced_connection_stats(0, 1),
+            CommandKind.MEASUREMENT,
+        ),
+        (CommonCommands.reset(), CommandKind.UNSAFE),
+    )
+
+    command_kinds = {}
+    for command, kind in commands:
+        command_type = command if isinstance(command, type) else type(command)
+        if command_type in command_kinds:
+            # Commands are told apart by class, so a shared class would take the last kind
+            raise ValueError(
+                f"Several commands share the class {command_type.__name__}, so their "
+                "retry policies can't be told apart"
+            )
+        command_kinds[command_type] = kind
+    return command_kinds
+
+
+def _get_command_kinds() -> dict[type, CommandKind]:
+    global _command_kinds
+    if _command_kinds is None:
+        _command_kinds = _build_command_kinds()
+    return _command_kinds
+
+
+def command_kind(command) -> CommandKind:
+    """
+    @return: how safe a command is to resend. Commands not classified here are never resent.
+    """
+    return _get_command_kinds().get(type(command), CommandKind.UNSAFE)
+
+
+def resolve_policies(
+    overrides: dict[str, dict] = None,
+) -> dict[CommandKind, RetryPolicy]:
+    """
+    @param overrides: policy fields to change, keyed by command kind, e.g. `{"read": {"attempts": 6}}`
+    @return: the default policies with the overrides applied
+    """
+    policies = dict(DEFAULT_POLICIES)
+    for kind, fields in (overrides or {}).items():
+        policies[CommandKind(kind)] = replace(policies[CommandKind(kind)], **fields)
+    return policies
+
+
+def call_with_retries(
+    function: Callable[[], Any],
+    policy: RetryPolicy,
+    reason: str,
+    exceptions: tuple[type[BaseException], ...] = TRANSIENT_ERRORS,
+):
+    """
+    Calls a function, retrying with exponential backoff while it raises one of `exceptions` and
+    the policy's attempts and budget allow. Each retry is counted against the running test.
+    @param reason: retry reason recorded in the test's timing and station metrics
+    @return: what the function returned
+    """
+    start = time.perf_counter()
+    backoff = policy.backoff
+    attempt = 1
+    while True:
+        try:
+            return function()
+        except exceptions:
+            elapsed = time.perf_counter() - start
+            if attempt >= policy.attempts or elapsed + backoff > policy.budget:
+                raise
+
+        record_retry(reason)
+        sleep(backoff)
+        backoff = min(backoff * policy.multiplier, policy.max_backoff)
+        attempt += 1
+
+
+def add_command_retries(
+    device: DeviceInfo, policies: dict[CommandKind, RetryPolicy] = None
+) -> None:
+    """
+    Retries each command sent to a device according to its kind. Safe to call more than once on
+    the same device. Wrap after `instrument_device` so each attempt is timed on its own.
+    """
+    rode_device = device.rode_device
+    if getattr(rode_device, "_retrying", False):
+        return
+
+    policies = DEFAULT_POLICIES if policies is None else policies
+    # Fails on setup rather than on the first command if commands can't be classified
+    _get_command_kinds()
+    handle_command = rode_device.handle_command
+
+    @wraps(handle_command)
+    def retrying_handle_command(command, *args, **kwargs):
+        policy = policies[command_kind(command)]
+        if policy.attempts <= 1:
+            return handle_command(command, *args, **kwargs)
+
+        return call_with_retries(
+            lambda: handle_command(command, *args, **kwargs),
+            policy,
+            type(command).__name__,
+        )
+
+    rode_device.handle_command = retrying_handle_command
+    rode_device._retrying = True
+
+
+def wait_until(
+    check: Callable[[], Any],
+    reason: str,
+    retries: int,
+    poll_interval: float = 1.0,
+    exceptions: tuple[type[BaseException], ...] = (AssertionError, OSError),
+):
+    """
+    Polls until `check` stops raising, e.g. for a device to finish powering on or rebooting
+    @param check: raises one of `exceptions` while the device is not ready
+    @param reason: retry reason recorded in the test's timing and station metrics
+    @param retries: total tries. The last error is raised once they run out.
+    @return: what `check` returned
+    """
+    for i in range(retries):
+        try:
+            return check()
+        except exceptions:
+            if i + 1 >= retries:
+                raise
+
+            record_retry(reason)
+            sleep(poll_interval)
@@ -0,0 +1,54 @@
+# Hooks run around each run of a device test, sync or async
+from contextlib import nullcontext
+from functools import wraps
+from typing import Callable, ContextManager
+
+from functional_test_core.device_test import DeviceTest
+from functional_test_core.models import TestInfo
+
+PHASES = ("pre_test_routine", "test_routine", "post_test_routine")
+
+
+def wrap_execute(
+    test: DeviceTest,
+    after: Callable[[list[TestInfo]], None] = None,
+    around: Callable[[], ContextManager] = None,
+    asynchronous: bool = True,
+) -> None:
+    """
+    Wraps each run of a test, through `execute_test` or, if the test has one,
+    `execute_test_async`
+    @param after: called with the results of each run that returns, which it may add to
+    @param around: returns a new context for each run to be made in
+    @param asynchronous: also wrap the async variant
+    """
+
+    def enter() -> ContextManager:
+        return nullcontext() if around is None else around()
+
+    def finish(results: list[TestInfo]) -> list[TestInfo]:
+        if after is not None:
+            after(results)
+        return results
+
+    execute_test = test.execute_test
+
+    @wraps(execute_test)
+    def wrapped_execute_test(*args, **kwargs):
+        with enter():
+            results = execute_test(*args, **kwargs)
+        return finish(results)
+
+    test.execute_test = wrapped_execute_test
+
+    execute_test_async = getattr(test, "execute_test_async", None)
+    if not asynchronous or execute_test_async is None:
+        return
+
+    @wraps(execute_test_async)
+    async def wrapped_execute_test_async(*args, **kwargs):
+        with enter():
+            results = await execute_test_async(*args, **kwargs)
+        return finish(results)
+
+    test.execute_test_async = wrapped_execute_test_async
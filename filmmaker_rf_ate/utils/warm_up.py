@@ -0,0 +1,64 @@
+# Reads ahead everything a DUT's tests can take before the run starts
+import time
+from dataclasses import dataclass
+from datetime import datetime
+
+from functional_test_core.models import DeviceInfo
+from rode.devices.common.commands.basic_commands import CommonCommands
+from rode.devices.wireless.commands.app_commands import (
+    AppCommands,
+    FuelGaugeData,
+    GetFuelGaugeCommand,
+)
+
+from filmmaker_rf_ate.utils.identity import DutIdentity, read_identity
+from filmmaker_rf_ate.utils.instrumentation import sleep
+
+
+@dataclass
+class WarmDut:
+    """
+    A DUT that has been powered on and read ahead of its test run
+    """
+
+    dut: DeviceInfo
+    identity: DutIdentity
+    firmware_version: object
+    nordic_version: object
+    battery_info: FuelGaugeData
+    battery_time: datetime
+    warmed_at: float
+
+
+def warm_up(dut: DeviceInfo, power_on_polls: int = 10, poll_interval: float = 1.0):
+    """
+    Powers a DUT on and reads everything the tests can take ahead of time
+    @param dut: device to warm up
+    @param power_on_polls: times to check the DUT has powered on
+    @param poll_interval: seconds between power on checks
+    @return: the warmed up DUT
+    """
+    device = dut.rode_device
+    device.handle_command(AppCommands.set_system_state(True))
+
+    firmware_version = device.handle_command(CommonCommands.app_version())
+    nordic_version = device.handle_command(AppCommands.radio_version())
+    battery_time = datetime.now()
+    battery_info = device.handle_command(GetFuelGaugeCommand())
+    identity = read_identity(dut)
+
+    # The tests power the DUT on again, so one that is slow to start is still handed over
+    for _ in range(power_on_polls):
+        if device.handle_command(AppCommands.system_is_on()):
+            break
+        sleep(poll_interval)
+
+    return WarmDut(
+        dut,
+        identity,
+        firmware_version,
+        nordic_version,
+        battery_info,
+        battery_time,
+        time.time(),
+    )
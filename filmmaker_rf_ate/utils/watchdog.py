@@ -0,0 +1,208 @@
+# Aborts test phases that overrun their deadline
+import asyncio
+import contextvars
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from functional_test_core.device_test import DeviceTest
+from functional_test_core.models import DeviceInfo, TestInfo
+
+from filmmaker_rf_ate.config.tests import TestTimeoutConfig
+from filmmaker_rf_ate.utils.test_hooks import PHASES, wrap_execute
+
+# Cancel event of the phase running under a deadline, set once the watchdog gives up on it
+_cancel: ContextVar[threading.Event | None] = ContextVar("cancel", default=None)
+
+
+class TestCancelled(Exception):
+    pass
+
+
+def cancel_event() -> threading.Event | None:
+    """
+    @return: the running phase's cancel event, or None if it has no deadline
+    """
+    return _cancel.get()
+
+
+def check_cancelled() -> None:
+    cancel = _cancel.get()
+    if cancel is not None and cancel.is_set():
+        raise TestCancelled("Test was cancelled by the watchdog")
+
+
+def make_cancellable(device: DeviceInfo) -> None:
+    """
+    Makes every command sent to a device from a cancelled test raise TestCancelled. Safe to call
+    more than once on the same device. Wrap before `instrument_device`, so retried commands are
+    checked on each attempt.
+    """
+    rode_device = device.rode_device
+    if getattr(rode_device, "_cancellable", False):
+        return
+
+    handle_command = rode_device.handle_command
+
+    @wraps(handle_command)
+    def cancellable_handle_command(command, *args, **kwargs):
+        check_cancelled()
+        return handle_command(command, *args, **kwargs)
+
+    rode_device.handle_command = cancellable_handle_command
+    rode_device._cancellable = True
+
+
+class _DeadlineExceeded(Exception):
+    def __init__(self, thread: threading.Thread):
+        super().__init__()
+        # Still running the abandoned routine until it reaches a cancellation point
+        self.thread = thread
+
+
+class WatchdogTimeout(Exception):
+    def __init__(self, test: str, phase: str, timeout: float):
+        super().__init__(f"`{test}` {phase} exceeded its {timeout}s deadline")
+        self.test = test
+        self.phase = phase
+        self.timeout = timeout
+
+
+def _run_with_deadline(
+    routine, timeout: float | None, name: str, args: tuple, kwargs: dict
+):
+    """
+    Runs a routine on a helper thread and waits up to `timeout` for it. Threads cannot be killed,
+    so on timeout the helper is cancelled: its next instrumented sleep or device command raises.
+    The devices must have been made cancellable.
+    """
+    if timeout is None:
+        return routine(*args, **kwargs)
+
+    cancel = threading.Event()
+    outcome = {}
+
+    def target():
+        _cancel.set(cancel)
+        try:
+            outcome["result"] = routine(*args, **kwargs)
+        except BaseException as e:
+            outcome["exception"] = e
+
+    # Runs in a copy of the caller's context, so the phase is still accounted to its test
+    thread = threading.Thread(
+        target=contextvars.copy_context().run, args=(target,), name=name, daemon=True
+    )
+    thread.start()
+    thread.join(max(timeout, 0.0))
+
+    if thread.is_alive():
+        cancel.set()
+        raise _DeadlineExceeded(thread)
+
+    if "exception" in outcome:
+        raise outcome["exception"]
+    return outcome.get("result")
+
+
+def guard_test(test: DeviceTest, timeouts: TestTimeoutConfig) -> None:
+    """
+    Runs each phase of a test under a deadline. A phase that overruns raises WatchdogTimeout, so
+    the test fails and its teardown still runs, once the phase has stopped at its next sleep or
+    device command. Teardown is skipped if the phase does not stop within the teardown's
+    deadline, rather than sending commands alongside it. Each timeout is also recorded as a
+    failed `<test>_watchdog` result naming the phase that hung.
+    @param test: test to guard
+    @param timeouts: per phase deadlines, and an optional deadline for the whole test
+    """
+    logger = logging.getLogger("watchdog")
+    state = {"start": 0.0, "timeouts": [], "abandoned": None}
+
+    def deadline(phase: str) -> float | None:
+        timeout = getattr(timeouts, phase)
+        if timeouts.total is None or phase == "post_test_routine":
+            # Teardown always gets its own deadline, even once the test is out of time
+            return timeout
+
+        remaining = timeouts.total - (time.perf_counter() - state["start"])
+        return remaining if timeout is None else min(timeout, remaining)
+
+    def guarded_phase(phase: str, routine):
+        @wraps(routine)
+        def wrapper(*args, **kwargs):
+            timeout = deadline(phase)
+            abandoned = state["abandoned"]
+            if abandoned is not None:
+                # Without its own deadline, teardown waits as long as the phase was given
+                abandoned.join(
+                    state["timeouts"][-1][1] if timeout is None else max(timeout, 0.0)
+                )
+                if abandoned.is_alive():
+                    logger.error(
+                        f"Skipping `{test.name}` {phase}, {abandoned.name} is still running"
+                    )
+                    state["timeouts"].append((phase, timeout))
+                    raise WatchdogTimeout(test.name, phase, timeout)
+                state["abandoned"] = None
+
+            try:
+                return _run_with_deadline(
+                    routine, timeout, f"{test.name}-{phase}", args, kwargs
+                )
+            except _DeadlineExceeded as e:
+                logger.error(f"`{test.name}` {phase} timed out after {timeout}s")
+                state["timeouts"].append((phase, timeout))
+                state["abandoned"] = e.thread
+                raise WatchdogTimeout(test.name, phase, timeout) from None
+
+        return wrapper
+
+    def guarded_async_phase(phase: str, routine):
+        @wraps(routine)
+        async def wrapper(*args, **kwargs):
+            timeout = deadline(phase)
+            if timeout is None:
+                return await routine(*args, **kwargs)
+
+            try:
+                return await asyncio.wait_for(
+                    routine(*args, **kwargs), max(timeout, 0.0)
+                )
+            except asyncio.TimeoutError:
+                logger.error(f"`{test.name}` {phase} timed out after {timeout}s")
+                state["timeouts"].append((phase, timeout))
+                raise WatchdogTimeout(test.name, phase, timeout) from None
+
+        return wrapper
+
+    def add_timeouts(results: list[TestInfo]) -> None:
+        for phase, timeout in state["timeouts"]:
+            result = TestInfo(
+                f"{test.name}_watchdog",
+                False,
+                info={"phase": phase, "limits": {"timeout": timeout}},
+            )
+            result.error_code = test.error_code
+            results.append(result)
+
+    for phase in PHASES:
+        setattr(test, phase, guarded_phase(phase, getattr(test, phase)))
+
+    if getattr(test, "execute_test_async", None) is not None:
+        # Phases the test bridges to a thread are guarded by the sync wrappers above
+        for phase in PHASES:
+            routine = getattr(test, f"{phase}_async")
+            if not getattr(routine, "bridged", False):
+                setattr(test, f"{phase}_async", guarded_async_phase(phase, routine))
+
+    @contextmanager
+    def run():
+        state["start"] = time.perf_counter()
+        state["timeouts"] = []
+        state["abandoned"] = None
+        yield
+
+    wrap_execute(test, after=add_timeouts, around=run)
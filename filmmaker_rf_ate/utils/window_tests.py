@@ -0,0 +1,25 @@
+# Tests run inside another test's measurement window, kept apart from the config-dependent
+# test factory so results code can use them
+from functional_test_core.device_test import DeviceTest
+from functional_test_core.models import TestInfo
+
+
+def all_tests(tests: list[DeviceTest]) -> list[DeviceTest]:
+    """
+    @return: the tests in a plan, including those run inside another test's measurement window
+    """
+    return [
+        test for outer in tests for test in (outer, *getattr(outer, "window_tests", ()))
+    ]
+
+
+def own_results(test: DeviceTest, results: list[TestInfo]) -> list[TestInfo]:
+    """
+    @return: a test's results, without those of tests run in its measurement window
+    """
+    window_results = getattr(test, "window_results", ())
+    return [
+        result
+        for result in results
+        if not any(result is window_result for window_result in window_results)
+    ]